@@ -0,0 +1,166 @@
+"""
+Multiple-comparison adjustments for arrays of p-values, such as those
+returned by the batched tests in stats (attest_ind, amasslinregress, or the
+rank tests with dimension=).  Requires numpy.
+
+Every function takes p-values of any shape and returns adjusted p-values of
+the same shape.  With dimension=None all p-values form one family;  with an
+integer dimension each lane along that dimension is adjusted separately.
+Each adjustment costs a single sort.  NaN p-values (e.g., from all-tied
+lanes) are left as NaN and do not count towards the family size.
+
+    abonferroni(pvals,dimension=None)   Bonferroni (family-wise error)
+    aholm(pvals,dimension=None)         Holm step-down (family-wise error)
+    abh(pvals,dimension=None)           Benjamini-Hochberg (false discovery)
+    aby(pvals,dimension=None)           Benjamini-Yekutieli (FDR, any dependence)
+    apadjust(pvals,method='holm',dimension=None)
+    areject(pvals,alpha=0.05,method='holm',dimension=None)
+"""
+
+import numpy as N
+
+
+def _lanes(pvals,dimension):
+    """
+    Moves the adjustment dimension of pvals last and flattens the rest, so
+    the family of each row is adjusted together.
+
+    Usage:   _lanes(pvals,dimension)
+    Returns: 2D float array (lanes x family), function undoing the reshape
+    """
+    p = N.asarray(pvals,N.float_)
+    shape = p.shape
+    if dimension is None:
+        return N.reshape(p,(1,-1)), lambda a: N.reshape(a,shape)
+    p = N.rollaxis(p,dimension,p.ndim)
+    rolled = p.shape
+    def restore(a):
+        return N.rollaxis(N.reshape(a,rolled),p.ndim-1,dimension)
+    return N.reshape(p,(-1,rolled[-1])), restore
+
+
+def _stepwise(pvals,dimension,method):
+    """
+    Shared engine of the sorted adjustments.  Sorts each lane once (NaNs
+    sort last), scales the i-th smallest p-value by its step factor, and
+    enforces monotonicity with a running maximum (step-down) or running
+    minimum from the largest p-value (step-up).
+
+    Usage:   _stepwise(pvals,dimension,method)  method is 'holm', 'bh' or 'by'
+    Returns: adjusted p-values shaped like pvals
+    """
+    p, restore = _lanes(pvals,dimension)
+    if p.size == 0:
+        return restore(p)
+    order = N.argsort(p,1,kind='mergesort')
+    rows = N.arange(p.shape[0])[:,N.newaxis]
+    sp = p[rows,order]
+    m = N.add.reduce(~N.isnan(sp),1)[:,N.newaxis].astype(N.float_)
+    i = N.arange(1,p.shape[1]+1,dtype=N.float_)
+    olderr = N.seterr(invalid='ignore')
+    try:
+        if method == 'holm':
+            adj = N.fmax.accumulate(sp*(m-i+1),1)
+        else:
+            adj = sp*m/i
+            if method == 'by':
+                c = N.cumsum(1.0/i)
+                adj = adj*c[N.maximum(m.astype(N.int_)-1,0)]
+            adj = N.fmin.accumulate(adj[:,::-1],1)[:,::-1]
+        adj = N.minimum(adj,1.0)
+    finally:
+        N.seterr(**olderr)
+    adj = N.where(N.isnan(sp),N.nan,adj)
+    out = N.empty(p.shape,N.float_)
+    out[rows,order] = adj
+    return restore(out)
+
+
+def abonferroni(pvals,dimension=None):
+    """
+    Bonferroni adjustment: each p-value times the number of (non-NaN)
+    p-values in its family, capped at 1.
+
+    Usage:   abonferroni(pvals,dimension=None)
+    Returns: adjusted p-values shaped like pvals
+    """
+    p, restore = _lanes(pvals,dimension)
+    m = N.add.reduce(~N.isnan(p),1)[:,N.newaxis]
+    olderr = N.seterr(invalid='ignore')
+    try:
+        return restore(N.minimum(p*m,1.0))
+    finally:
+        N.seterr(**olderr)
+
+
+def aholm(pvals,dimension=None):
+    """
+    Holm's step-down adjustment, which controls the family-wise error
+    rate like Bonferroni but is uniformly more powerful.
+
+    Usage:   aholm(pvals,dimension=None)
+    Returns: adjusted p-values shaped like pvals
+    """
+    return _stepwise(pvals,dimension,'holm')
+
+
+def abh(pvals,dimension=None):
+    """
+    Benjamini-Hochberg step-up adjustment (q-values), which controls the
+    false discovery rate for independent or positively dependent tests.
+
+    Usage:   abh(pvals,dimension=None)
+    Returns: adjusted p-values shaped like pvals
+    """
+    return _stepwise(pvals,dimension,'bh')
+
+
+def aby(pvals,dimension=None):
+    """
+    Benjamini-Yekutieli step-up adjustment, which controls the false
+    discovery rate under any dependence (BH scaled by sum(1/k), k=1..m).
+
+    Usage:   aby(pvals,dimension=None)
+    Returns: adjusted p-values shaped like pvals
+    """
+    return _stepwise(pvals,dimension,'by')
+
+
+methods = {'bonferroni': abonferroni,
+           'holm': aholm,
+           'bh': abh,
+           'fdr_bh': abh,
+           'by': aby,
+           'fdr_by': aby}
+
+
+def apadjust(pvals,method='holm',dimension=None):
+    """
+    Adjusts pvals for multiple comparisons by method, one of 'bonferroni',
+    'holm', 'bh' (or 'fdr_bh') and 'by' (or 'fdr_by').
+
+    Usage:   apadjust(pvals,method='holm',dimension=None)
+    Returns: adjusted p-values shaped like pvals
+    """
+    try:
+        fcn = methods[method]
+    except KeyError:
+        raise ValueError, 'apadjust: unknown method %r' % (method,)
+    return fcn(pvals,dimension)
+
+
+def areject(pvals,alpha=0.05,method='holm',dimension=None):
+    """
+    Tests which null hypotheses are rejected at level alpha after
+    adjusting pvals by method (see apadjust).  NaN p-values are never
+    rejected.
+
+    Usage:   areject(pvals,alpha=0.05,method='holm',dimension=None)
+    Returns: boolean array shaped like pvals, true where rejected
+    """
+    adj = apadjust(pvals,method,dimension)
+    olderr = N.seterr(invalid='ignore')
+    try:
+        return adj <= alpha
+    finally:
+        N.seterr(**olderr)
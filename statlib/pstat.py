@@ -211,20 +211,18 @@ Usage:   colex (listoflists,cnums)
 Returns: a list-of-lists corresponding to the columns from listoflists
          specified by cnums, in the order the column numbers appear in cnums
 """
-    global index
     column = 0
     if type(cnums) in [ListType,TupleType]:   # if multiple columns to get
         index = cnums[0]
-        column = map(lambda x: x[index], listoflists)
+        column = map(lambda x, index=index: x[index], listoflists)
         for col in cnums[1:]:
-            index = col
-            column = abut(column,map(lambda x: x[index], listoflists))
+            column = abut(column,map(lambda x, index=col: x[index], listoflists))
     elif type(cnums) == StringType:              # if an 'x[3:]' type expr.
         evalstring = 'map(lambda x: x'+cnums+', listoflists)'
         column = eval(evalstring)
     else:                                     # else it's just 1 col to get
         index = cnums
-        column = map(lambda x: x[index], listoflists)
+        column = map(lambda x, index=index: x[index], listoflists)
     return column
 
 
@@ -666,9 +664,17 @@ Usage:   unique (inlist)
 Returns: the unique elements (or rows) in inlist
 """
     uniques = []
-    for item in inlist:
-        if item not in uniques:
-            uniques.append(item)
+    seen = {}
+    try:
+        for item in inlist:
+            if item not in seen:
+                seen[item] = 1
+                uniques.append(item)
+    except TypeError:   # unhashable items (e.g., rows), fall back to O(n**2)
+        uniques = []
+        for item in inlist:
+            if item not in uniques:
+                uniques.append(item)
     return uniques
 
 def duplicates(inlist):
@@ -1005,22 +1011,16 @@ try:                         # DEFINE THESE *ONLY* IF numpy IS AVAILABLE
     """
         uniques = N.array([inarray[0]])
         if len(uniques.shape) == 1:            # IF IT'S A 1D ARRAY
+            if inarray.dtype.char != 'O':      # sort-based, keep 1st-seen order
+                first = N.unique(inarray,return_index=True)[1]
+                return inarray[N.sort(first)]
             for item in inarray[1:]:
                 if N.add.reduce(N.equal(uniques,item).ravel()) == 0:
-                    try:
-                        uniques = N.concatenate([uniques,N.array[N.newaxis,:]])
-                    except TypeError:
-                        uniques = N.concatenate([uniques,N.array([item])])
+                    uniques = N.concatenate([uniques,N.array([item])])
         else:                                  # IT MUST BE A 2+D ARRAY
             if inarray.dtype.char != 'O':  # not an Object array
-                for item in inarray[1:]:
-                    if not N.sum(N.alltrue(N.equal(uniques,item),1)):
-                        try:
-                            uniques = N.concatenate( [uniques,item[N.newaxis,:]] )
-                        except TypeError:    # the item to add isn't a list
-                            uniques = N.concatenate([uniques,N.array([item])])
-                    else:
-                        pass  # this item is already in the uniques array
+                first = N.unique(inarray,return_index=True,axis=0)[1]
+                return inarray[N.sort(first)]
             else:   # must be an Object array, alltrue/equal functions don't work
                 for item in inarray[1:]:
                     newflag = 1
@@ -46,6 +46,12 @@ Moments
     - skewtest   (for Numpy arrays only)
     - kurtosistest (for Numpy arrays only)
     - normaltest (for Numpy arrays only)
+    - RunningStats (class; one-pass, mergeable moments for streamed data)
+    - parallelsummary (RunningStats over shards in a process pool)
+    - QuantileSketch (class; mergeable streaming percentile estimates)
+    - Histogram (class; incremental, mergeable histogram)
+    - RunningTTest1Samp, RunningTTestInd, RunningTTestRel, RunningChisquare
+      (classes; O(1) online t-tests and chi-square, optionally windowed)
 
 Altered Versions
 ----------------
@@ -61,8 +67,10 @@ Frequency Stats
 ---------------
     - itemfreq
     - scoreatpercentile
+    - quantiles
     - percentileofscore
     - histogram
+    - histograms (for Numpy arrays only; shared bins)
     - cumfreq
     - relfreq
 
@@ -94,6 +102,8 @@ Correlation Fcns
     - paired
     - pearsonr
     - spearmanr
+    - pearsonrmatrix  (for Numpy arrays only; all column pairs, with p)
+    - spearmanrmatrix (for Numpy arrays only; all column pairs, with p)
     - pointbiserialr
     - kendalltau
     - linregress
@@ -104,11 +114,11 @@ Inferential Stats
     - ttest_ind
     - ttest_rel
     - chisquare
-    - ks_2samp
-    - mannwhitneyu
-    - ranksums
-    - wilcoxont
-    - kruskalwallish
+    - ks_2samp        (arrays: dimension= tests many lanes at once)
+    - mannwhitneyu    (arrays: dimension= tests many lanes at once)
+    - ranksums        (arrays: dimension= tests many lanes at once)
+    - wilcoxont       (arrays: dimension= tests many lanes at once)
+    - kruskalwallish  (arrays: dimension= tests many lanes at once)
     - friedmanchisquare
 
 Probability Calcs
@@ -121,10 +131,13 @@ Probability Calcs
     - betacf
     - gammln 
     - betai
+    - ProbCache  (opt-in per-df tables for chisqprob and fprob)
+    - zprobinv, tprobinv, chisqprobinv, fprobinv  (critical values; Numpy only)
 
 Anova Functions
 ---------------
     - F_oneway
+    - F_onewaylabels  (for Numpy arrays only; flat scores + group labels, 2D=many columns)
     - F_value
 
 Support Functions
@@ -139,7 +152,11 @@ Support Functions
     - sumdiffsquared
     - square_of_sums
     - shellsort
+    - lselect  (partial sort for lists)
+    - lcounts  (unique scores and their counts, for lists)
     - rankdata
+    - rankties
+    - abatchrankdata (ranks every lane of an array; Numpy only)
     - outputpairedstats
     - findwithin
 
@@ -255,15 +272,24 @@ For further references see the U{python-statlib homepage
 ##              fixed (a)histogram (which sometimes counted points <lowerlimit)
 
 import pstat               # required 3rd party module
-import math, string, copy  # required python modules
+import math, string, copy, bisect, collections  # required python modules
 from types import *
 
 __version__ = 0.6
 
 ############# DISPATCH CODE ##############
 
+# Lists/tuples at least this long are converted to float arrays and handed
+# to the array version of dispatchers that allow it (None = never promote).
+# A single call can override this with promote=1 (always) or promote=0 (never).
+promotelength = None
 
-class Dispatch:
+# Set to a ProbCache() to answer chisqprob() and fprob() from per-df
+# interpolation tables (None = always use the exact functions).
+probcache = None
+
+
+class Dispatch(object):
     """
     The Dispatch class, care of David Ascher, allows different functions to
     be called depending on the argument types.  This way, there can be one
@@ -271,21 +297,92 @@ class Dispatch:
     in stats.py module, prefix the function with an 'l' or 'a' for list or
     array arguments, respectively.  That is, print stats.lmean.__doc__ or
     print stats.amean.__doc__ or whatever.
+
+    Types are resolved by walking the method resolution order of the
+    argument's type, so subclasses of a registered type (e.g., ndarray
+    subclasses, or numpy.float64 for FloatType) dispatch like their base.
+    Each resolution is cached per type, so only the first call with a new
+    type pays for the walk.  Use register() to add types after creation and
+    resolve() to fetch the underlying function once for tight loops.
+
+    Dispatchers given a converter with setpromotion() also accept a
+    promote= keyword; see promotelength above.
     """
 
     def __init__(self, *tuples):
         self._dispatch = {}
+        self._cache = {}
+        self._convert = None
+        self._restore = None
         for func, types in tuples:
-            for t in types:
-                if t in self._dispatch.keys():
-                    raise ValueError, "can't have two dispatches on "+str(t)
-                self._dispatch[t] = func
-        self._types = self._dispatch.keys()
+            self.register(func, types)
+
+    def register(self, func, types):
+        """
+        Adds func as the function to call for arguments of each type in
+        types (a sequence of types).  Subclasses of these types are also
+        dispatched to func unless registered separately.
+
+        Usage:   register(func, types)
+        """
+        for t in types:
+            if self._dispatch.has_key(t):
+                raise ValueError, "can't have two dispatches on "+str(t)
+            self._dispatch[t] = func
+        self._cache.clear()
+
+    def resolve(self, argtype):
+        """
+        Returns the function that arguments of type argtype dispatch to.
+        Raises TypeError if there is none.
+
+        Usage:   resolve(argtype)
+        """
+        try:
+            return self._cache[argtype]
+        except KeyError:
+            pass
+        for t in getattr(argtype, '__mro__', (argtype,)):
+            if self._dispatch.has_key(t):
+                func = self._dispatch[t]
+                break
+        else:
+            raise TypeError, "don't know how to dispatch %s arguments" %  argtype
+        self._cache[argtype] = func
+        return func
+
+    def setpromotion(self, convert, restore=None):
+        """
+        Allows list/tuple first arguments to be promoted: they are passed
+        through convert() and dispatched on the type of the result instead,
+        and the result of that call goes through restore() (if given) so
+        callers get back the types the list version returns.  Use
+        convert=None to switch promotion off again.
+
+        Usage:   setpromotion(convert, restore=None)
+        """
+        self._convert = convert
+        self._restore = restore
 
     def __call__(self, arg1, *args, **kw):
-        if type(arg1) not in self._types:
-            raise TypeError, "don't know how to dispatch %s arguments" %  type(arg1)
-        return apply(self._dispatch[type(arg1)], (arg1,) + args, kw)
+        try:
+            func = self._cache[type(arg1)]
+        except KeyError:
+            func = self.resolve(type(arg1))
+        # plain calls skip this unless a promotelength is set
+        if (kw or promotelength is not None) and self._convert is not None:
+            promote = kw.pop('promote', None)
+            if isinstance(arg1, (ListType, TupleType)):
+                if promote is None:
+                    promote = (promotelength is not None and
+                               len(arg1) >= promotelength)
+                if promote:
+                    arg1 = self._convert(arg1)
+                    result = self.resolve(type(arg1))(arg1, *args, **kw)
+                    if self._restore is not None:
+                        result = self._restore(result)
+                    return result
+        return func(arg1, *args, **kw)
 
 
 ##########################################################################
@@ -337,15 +434,21 @@ def lmean (inlist):
     return sum/float(len(inlist))
 
 
-def lmedian (inlist,numbins=1000):
+def lmedian (inlist,numbins=1000,method='histogram'):
     """
     Returns the computed median value of a list of numbers, given the
     number of bins to use for the histogram (more bins brings the computed value
     closer to the median score, default number of bins = 1000).  See G.W.
     Heiman's Basic Stats (1st Edition), or CRC Probability & Statistics.
+    method='exact' returns the exact median from lquantiles() instead of
+    the histogram approximation.
 
-    Usage:   lmedian (inlist, numbins=1000)
+    Usage:   lmedian (inlist, numbins=1000, method='histogram')
     """
+    if method == 'exact':
+        return lquantiles(inlist,50)
+    elif method <> 'histogram':
+        raise ValueError, "method must be 'histogram' or 'exact'"
     (hist, smallest, binsize, extras) = histogram(inlist,numbins,[min(inlist),max(inlist)]) # make histog
     cumhist = cumsum(hist)              # make cumulative histogram
     for i in range(len(cumhist)):        # get 1st(!) index holding 50%ile score
@@ -367,8 +470,9 @@ def lmedianscore (inlist):
     Usage:   lmedianscore(inlist)
     """
 
-    newlist = copy.deepcopy(inlist)
-    newlist.sort()
+    newlist = list(inlist)
+    index = len(newlist)/2
+    lselect(newlist,[index-1,index])
     if len(newlist) % 2 == 0:   # if even number of scores, average middle 2
         index = len(newlist)/2  # integer division correct
         median = float(newlist[index] + newlist[index-1]) /2
@@ -388,25 +492,41 @@ def lmode(inlist):
     Returns: bin-count for mode(s), a list of modal value(s)
     """
 
-    scores = pstat.unique(inlist)
-    scores.sort()
-    freq = []
-    for item in scores:
-        freq.append(inlist.count(item))
+    scores, freq = lcounts(inlist)
     maxfreq = max(freq)
     mode = []
-    stillmore = 1
-    while stillmore:
-        try:
-            indx = freq.index(maxfreq)
-            mode.append(scores[indx])
-            del freq[indx]
-            del scores[indx]
-        except ValueError:
-            stillmore=0
+    for i in range(len(scores)):
+        if freq[i] == maxfreq:
+            mode.append(scores[i])
     return maxfreq, mode
 
 
+def lcounts(inlist):
+    """
+    Returns the sorted unique scores of inlist and how often each occurs,
+    from a single dictionary pass (falls back to list.count() for
+    unhashable items, such as the rows of a list-of-lists).
+
+    Usage:   lcounts(inlist)
+    Returns: list of unique scores (sorted), list of their frequencies
+    """
+    counts = {}
+    scores = []
+    try:
+        for item in inlist:
+            if item in counts:
+                counts[item] = counts[item] + 1
+            else:
+                counts[item] = 1
+                scores.append(item)
+    except TypeError:
+        scores = pstat.unique(inlist)
+        scores.sort()
+        return scores, [inlist.count(item) for item in scores]
+    scores.sort()
+    return scores, [counts[item] for item in scores]
+
+
 ####################################
 ############  MOMENTS  #############
 ####################################
@@ -463,17 +583,1061 @@ def lkurtosis(inlist):
 def ldescribe(inlist):
     """
     Returns some descriptive statistics of the passed list (assumed to be 1D).
+    Makes two passes over inlist (see RunningStats).
 
     Usage:   ldescribe(inlist)
-    Returns: n, mean, standard deviation, skew, kurtosis
+    Returns: n, (min,max), mean, standard deviation, skew, kurtosis
     """
-    n = len(inlist)
-    mm = (min(inlist),max(inlist))
-    m = mean(inlist)
-    sd = stdev(inlist)
-    sk = skew(inlist)
-    kurt = kurtosis(inlist)
-    return n, mm, m, sd, sk, kurt
+    return RunningStats(inlist).describe()
+
+
+####################################
+######  RUNNING STATISTICS  ########
+####################################
+
+class RunningStats(object):
+    """
+    Accumulates n, min, max, mean and the 2nd-4th central moment sums of a
+    stream of values in constant memory, so describe() can be computed for
+    data that never fits in a list (files, sockets, generators).  Values can
+    be fed one at a time with update() or in chunks with update_many().
+    The stream is read once.  Single values use Welford's update.  A list,
+    tuple or array chunk is already in memory, so it is summarised with two
+    passes over it (mean, then central moment sums), which in python is
+    several times faster per value than Welford's update and rounds less;
+    the chunk summary is then folded in with the pairwise formulas of Pebay
+    (2008), Formulas for robust, one-pass parallel computation of
+    covariances and arbitrary-order statistical moments, Sandia Report
+    SAND2008-6212.
+
+    Usage:   rs = RunningStats(values=None)
+             rs.update(x);  rs.update_many(chunk);  rs.describe()
+    """
+
+    def __init__(self, values=None):
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.M2 = 0.0     # sum of (x-mean)**2
+        self.M3 = 0.0     # sum of (x-mean)**3
+        self.M4 = 0.0     # sum of (x-mean)**4
+        if values is not None:
+            self.update_many(values)
+
+    def update(self, x):
+        """
+        Adds a single value to the accumulator.
+
+        Usage:   update(x)
+        """
+        n1 = self.n
+        self.n = n = n1 + 1
+        delta = x - self.mean
+        delta_n = delta / float(n)
+        delta_n2 = delta_n * delta_n
+        term1 = delta * delta_n * n1
+        self.mean = self.mean + delta_n
+        self.M4 = (self.M4 + term1*delta_n2*(n*n - 3*n + 3)
+                   + 6*delta_n2*self.M2 - 4*delta_n*self.M3)
+        self.M3 = self.M3 + term1*delta_n*(n - 2) - 3*delta_n*self.M2
+        self.M2 = self.M2 + term1
+        if n1 == 0:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+
+    def update_many(self, values):
+        """
+        Adds a chunk of values: a list, tuple, numpy array (flattened) or any
+        other iterable.  Lists, tuples and arrays are summarised as a block
+        in two passes over the chunk; other iterables are consumed once, one
+        value at a time.
+
+        Usage:   update_many(values)
+        """
+        if type(values) in [ListType, TupleType]:
+            n = len(values)
+            if n == 0:
+                return
+            s = 0.0
+            for x in values:
+                s = s + x
+            mn = s / n
+            M2 = M3 = M4 = 0.0
+            for x in values:
+                d = x - mn
+                d2 = d * d
+                M2 = M2 + d2
+                M3 = M3 + d2*d
+                M4 = M4 + d2*d2
+            self._combine(n, mn, M2, M3, M4, min(values), max(values))
+        elif hasattr(values, 'dtype'):      # numpy array
+            a = N.ravel(values).astype(N.float_)
+            n = len(a)
+            if n == 0:
+                return
+            mn = N.add.reduce(a) / n
+            d = a - mn
+            d2 = d * d
+            self._combine(n, float(mn), float(N.add.reduce(d2)),
+                          float(N.add.reduce(d2*d)), float(N.add.reduce(d2*d2)),
+                          float(N.minimum.reduce(a)), float(N.maximum.reduce(a)))
+        else:
+            for x in values:
+                self.update(x)
+
+    def _combine(self, nb, meanb, M2b, M3b, M4b, minb, maxb):
+        # fold the moment sums of another block of nb values into self
+        na = self.n
+        if nb == 0:
+            return
+        if na == 0:
+            self.n, self.mean = nb, meanb
+            self.M2, self.M3, self.M4 = M2b, M3b, M4b
+            self.min, self.max = minb, maxb
+            return
+        n = na + nb
+        fn = float(n)
+        delta = meanb - self.mean
+        delta2 = delta * delta
+        M2a, M3a = self.M2, self.M3
+        self.M4 = (self.M4 + M4b
+                   + delta2*delta2*na*nb*(na*na - na*nb + nb*nb)/(fn*fn*fn)
+                   + 6.0*delta2*(na*na*M2b + nb*nb*M2a)/(fn*fn)
+                   + 4.0*delta*(na*M3b - nb*M3a)/fn)
+        self.M3 = (M3a + M3b + delta2*delta*na*nb*(na - nb)/(fn*fn)
+                   + 3.0*delta*(na*M2b - nb*M2a)/fn)
+        self.M2 = M2a + M2b + delta2*na*nb/fn
+        self.mean = self.mean + delta*nb/fn
+        self.n = n
+        if minb < self.min:
+            self.min = minb
+        if maxb > self.max:
+            self.max = maxb
+
+    def merge(self, other):
+        """
+        Folds another RunningStats (e.g. from a different shard of the data)
+        into this one, exactly as if all its values had been fed here.
+
+        Usage:   merge(other)
+        Returns: self
+        """
+        self._combine(other.n, other.mean, other.M2, other.M3, other.M4,
+                      other.min, other.max)
+        return self
+
+    def summary(self):
+        """
+        Returns the state as a tuple of plain numbers, suitable for pickle,
+        marshal or JSON.  Rebuild with RunningStats.fromsummary().
+
+        Usage:   summary()
+        Returns: (n, min, max, mean, M2, M3, M4)
+        """
+        return (self.n, self.min, self.max, self.mean,
+                self.M2, self.M3, self.M4)
+
+    def fromsummary(cls, summary):
+        """
+        Returns a RunningStats rebuilt from the tuple made by summary().
+
+        Usage:   RunningStats.fromsummary(summary)
+        """
+        rs = cls()
+        n, lo, hi, mn, M2, M3, M4 = summary
+        rs._combine(n, mn, M2, M3, M4, lo, hi)
+        return rs
+    fromsummary = classmethod(fromsummary)
+
+    def moment(self, moment=1):
+        """
+        Returns the nth (1-4) moment about the mean, as moment() would.
+
+        Usage:   moment(moment=1)
+        """
+        if moment == 1:
+            return 0.0
+        return [self.M2, self.M3, self.M4][moment-2] / float(self.n)
+
+    def samplevar(self):
+        "Returns the variance using N in the denominator, as samplevar()."
+        return self.M2 / float(self.n)
+
+    def var(self):
+        "Returns the variance using N-1 in the denominator, as var()."
+        return self.M2 / float(self.n - 1)
+
+    def stdev(self):
+        "Returns the standard deviation using N-1, as stdev()."
+        return math.sqrt(self.var())
+
+    def skew(self):
+        "Returns the skewness, as skew()."
+        return self.moment(3) / pow(self.moment(2), 1.5)
+
+    def kurtosis(self):
+        "Returns the kurtosis, as kurtosis()."
+        return self.moment(4) / pow(self.moment(2), 2.0)
+
+    def describe(self):
+        """
+        Returns the same tuple as describe() would for all values seen so far.
+
+        Usage:   describe()
+        Returns: n, (min,max), mean, standard deviation, skew, kurtosis
+        """
+        return (self.n, (self.min, self.max), self.mean, self.stdev(),
+                self.skew(), self.kurtosis())
+
+
+def _summarizechunk(chunk):
+    # worker for parallelsummary: a filename, or a chunk of values
+    rs = RunningStats()
+    if type(chunk) in [StringType, UnicodeType]:
+        f = open(chunk, 'r')
+        try:
+            for line in f:
+                rs.update_many(map(float, line.split()))
+        finally:
+            f.close()
+    else:
+        rs.update_many(chunk)
+    return rs.summary()
+
+
+def parallelsummary(source, processes=None, chunks=None):
+    """
+    Computes a RunningStats over source in a pool of worker processes.
+    Source is either a list of filenames (whitespace-separated numbers,
+    one file per task, read a line at a time) or an array/list of values,
+    which is flattened and cut into chunks (default 4 per process).  The
+    per-shard summaries are merged in order.  Needs the multiprocessing
+    module (python 2.6+).
+
+    Usage:   parallelsummary(source, processes=None, chunks=None)
+    Returns: RunningStats; call its describe() for the describe() tuple
+    """
+    import multiprocessing
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if (type(source) in [ListType, TupleType] and len(source) > 0 and
+        type(source[0]) in [StringType, UnicodeType]):
+        tasks = list(source)
+    else:
+        if chunks is None:
+            chunks = 4*processes
+        if hasattr(source, 'dtype'):
+            flat = N.ravel(source)
+            tasks = N.array_split(flat, max(1, min(chunks, len(flat))))
+        else:
+            step = max(1, (len(source)+chunks-1) // chunks)
+            tasks = [source[i:i+step] for i in range(0, len(source), step)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        summaries = pool.map(_summarizechunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    rs = RunningStats()
+    for summary in summaries:
+        rs.merge(RunningStats.fromsummary(summary))
+    return rs
+
+
+class QuantileSketch(object):
+    """
+    Mergeable, bounded-memory approximation of the distribution of a stream
+    of values (a merging t-digest; Dunning & Ertl, Computing extremely
+    accurate quantiles using t-digests, 2019).  Values are clustered into at
+    most about `compression` centroids, smallest near the tails, so extreme
+    percentiles (p99, p99.9) stay accurate; larger compression means more
+    memory and more accuracy.  quantile()/cdf() take and return fractions
+    (0-1); scoreatpercentile()/percentileofscore() use percents (0-100)
+    like the module functions of the same names.
+
+    Usage:   qs = QuantileSketch(values=None, compression=100)
+             qs.update(x);  qs.update_many(chunk);  qs.scoreatpercentile(99)
+    """
+
+    def __init__(self, values=None, compression=100):
+        self.compression = compression
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.means = []          # centroid means, ascending
+        self.weights = []        # centroid weights
+        self._buffer = []        # (value, weight) pairs not yet clustered
+        self._buffersize = max(int(5*compression), 10)
+        if values is not None:
+            self.update_many(values)
+
+    def update(self, x, weight=1):
+        """
+        Adds a single value (optionally with an integer or float weight).
+
+        Usage:   update(x, weight=1)
+        """
+        if self.n == 0:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+        self.n = self.n + weight
+        self._buffer.append((x, weight))
+        if len(self._buffer) >= self._buffersize:
+            self._compress()
+
+    def update_many(self, values):
+        """
+        Adds a chunk of values: a list, tuple, numpy array (flattened) or any
+        other iterable (consumed one value at a time).
+
+        Usage:   update_many(values)
+        """
+        if hasattr(values, 'dtype'):
+            values = N.ravel(values).tolist()
+        elif type(values) not in [ListType, TupleType]:
+            for x in values:
+                self.update(x)
+            return
+        if len(values) == 0:
+            return
+        lo, hi = min(values), max(values)
+        if self.n == 0 or lo < self.min:
+            self.min = lo
+        if self.n == 0 or hi > self.max:
+            self.max = hi
+        self.n = self.n + len(values)
+        step = self._buffersize
+        for i in range(0, len(values), step):
+            self._buffer.extend([(x, 1) for x in values[i:i+step]])
+            if len(self._buffer) >= step:
+                self._compress()
+
+    def merge(self, other):
+        """
+        Folds another QuantileSketch into this one.
+
+        Usage:   merge(other)
+        Returns: self
+        """
+        if other.n == 0:
+            return self
+        other._compress()
+        if self.n == 0 or other.min < self.min:
+            self.min = other.min
+        if self.n == 0 or other.max > self.max:
+            self.max = other.max
+        self.n = self.n + other.n
+        self._buffer.extend(zip(other.means, other.weights))
+        self._compress()
+        return self
+
+    def _compress(self):
+        # cluster the centroids and buffered points into new centroids; a
+        # centroid may span at most one unit of the scale function
+        # k(q) = compression/(2*pi) * asin(2q-1)
+        if not self._buffer:
+            return
+        points = zip(self.means, self.weights) + self._buffer
+        points.sort()
+        self._buffer = []
+        total = 0.0
+        for x, wx in points:
+            total = total + wx
+        scale = self.compression / (2*math.pi)
+        def qlimit(q):
+            k = scale*math.asin(2*q-1) + 1
+            if k >= self.compression/4.0:
+                return 1.0
+            return (math.sin(k/scale)+1) / 2.0
+        means = []
+        weights = []
+        wsofar = 0.0
+        wlimit = total*qlimit(0.0)
+        m, w = points[0]
+        for x, wx in points[1:]:
+            if wsofar + w + wx <= wlimit:
+                w = w + wx
+                m = m + (x-m)*wx/float(w)
+            else:
+                means.append(m)
+                weights.append(w)
+                wsofar = wsofar + w
+                wlimit = total*qlimit(min(wsofar/total, 1.0))
+                m, w = x, wx
+        means.append(m)
+        weights.append(w)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """
+        Returns the estimated score below which a fraction q (0-1) of the
+        values lie.
+
+        Usage:   quantile(q)
+        """
+        if self.n == 0:
+            raise ValueError, 'quantile() of an empty QuantileSketch'
+        if q < 0 or q > 1:
+            raise ValueError, 'q must be between 0 and 1'
+        self._compress()
+        means, weights = self.means, self.weights
+        t = q*self.n
+        if t < weights[0]/2.0:                  # left of the first centre
+            if weights[0] == 1:
+                return self.min
+            return self.min + (means[0]-self.min)*t/(weights[0]/2.0)
+        cum = 0.0
+        for i in range(len(means)-1):
+            left = cum + weights[i]/2.0
+            right = cum + weights[i] + weights[i+1]/2.0
+            if t <= right:
+                return means[i] + (means[i+1]-means[i])*(t-left)/(right-left)
+            cum = cum + weights[i]
+        if weights[-1] == 1:                    # right of the last centre
+            return self.max
+        left = self.n - weights[-1]/2.0
+        return means[-1] + (self.max-means[-1])*(t-left)/(weights[-1]/2.0)
+
+    def cdf(self, x):
+        """
+        Returns the estimated fraction (0-1) of the values below x.
+
+        Usage:   cdf(x)
+        """
+        if self.n == 0:
+            raise ValueError, 'cdf() of an empty QuantileSketch'
+        self._compress()
+        if x < self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        means, weights = self.means, self.weights
+        total = float(self.n)
+        if x < means[0]:
+            return (x-self.min)/float(means[0]-self.min) * weights[0]/2.0 / total
+        cum = 0.0
+        for i in range(len(means)-1):
+            if x < means[i+1]:
+                left = cum + weights[i]/2.0
+                right = cum + weights[i] + weights[i+1]/2.0
+                return (left + (x-means[i])/float(means[i+1]-means[i])*(right-left)) / total
+            cum = cum + weights[i]
+        left = total - weights[-1]/2.0
+        return (left + (x-means[-1])/float(self.max-means[-1])*weights[-1]/2.0) / total
+
+    def scoreatpercentile(self, percent):
+        """
+        Returns the estimated score at a given percentile (0-100).
+
+        Usage:   scoreatpercentile(percent)
+        """
+        return self.quantile(percent/100.0)
+
+    def percentileofscore(self, score):
+        """
+        Returns the estimated percentile (0-100) of a score.
+
+        Usage:   percentileofscore(score)
+        """
+        return self.cdf(score)*100
+
+    def median(self):
+        "Returns the estimated median."
+        return self.quantile(0.5)
+
+    def summary(self):
+        """
+        Returns the state as a tuple of plain numbers and lists, suitable for
+        pickle, marshal or JSON.  Rebuild with QuantileSketch.fromsummary().
+
+        Usage:   summary()
+        Returns: (compression, n, min, max, means, weights)
+        """
+        self._compress()
+        return (self.compression, self.n, self.min, self.max,
+                list(self.means), list(self.weights))
+
+    def fromsummary(cls, summary):
+        """
+        Returns a QuantileSketch rebuilt from the tuple made by summary().
+
+        Usage:   QuantileSketch.fromsummary(summary)
+        """
+        compression, n, lo, hi, means, weights = summary
+        qs = cls(compression=compression)
+        qs.n, qs.min, qs.max = n, lo, hi
+        qs.means, qs.weights = list(means), list(weights)
+        return qs
+    fromsummary = classmethod(fromsummary)
+
+
+class Histogram(object):
+    """
+    Incrementally maintained histogram with the same bin layout rules as
+    histogram(): pass defaultreallimits=(lower,upper) for fixed bins, or
+    let the first add() pick bins spanning its values.  With extend=1 bins
+    of the same width are added at either end for scores that fall outside,
+    instead of counting them as extrapoints.  add() and subtract() (for
+    sliding windows) take lists, tuples, arrays or other iterables, with
+    optional weights; merge() folds in another Histogram whose bin edges line
+    up with this one.  histogram(), cumfreq() and relfreq() return the same
+    (bins, lowerreallimit, binsize, extrapoints) tuples as the module
+    functions do for the data added so far.
+
+    Usage:   h = Histogram(numbins=10, defaultreallimits=None, extend=0)
+             h.add(values);  h.subtract(oldvalues);  h.histogram()
+    """
+
+    def __init__(self, numbins=10, defaultreallimits=None, extend=0):
+        self.extend = extend
+        self.bins = [0]*numbins
+        self.extrapoints = 0
+        self.n = 0              # number of scores added minus subtracted
+        self.binsize = None     # bin layout not chosen yet
+        self._origin = None     # lowerreallimit when the layout was chosen
+        self._offset = 0        # bins added below _origin by extend
+        if defaultreallimits <> None:
+            self.setlayout(defaultreallimits)
+
+    def setlayout(self, defaultreallimits):
+        """
+        Fixes the bin layout to numbins bins spanning defaultreallimits
+        (lower, upper), as histogram() would.  Call before adding scores.
+
+        Usage:   setlayout((lower, upper))
+        """
+        numbins = len(self.bins)
+        lower, upper = defaultreallimits[0], defaultreallimits[1]
+        self._origin = lower
+        self._offset = 0
+        self.binsize = (upper-lower)/float(numbins)
+
+    def _autolayout(self, values):
+        # same rule as lhistogram()/ahistogram() without limits
+        numbins = len(self.bins)
+        if hasattr(values, 'dtype'):
+            Min = N.minimum.reduce(values)
+            Max = N.maximum.reduce(values)
+            estbinwidth = float(Max - Min)/float(numbins) + 1e-6
+            self.binsize = (Max-Min+estbinwidth)/float(numbins)
+            self._origin = Min - self.binsize/2.0
+        else:
+            Min = min(values)
+            Max = max(values)
+            estbinwidth = (Max-Min)/float(numbins) + 1e-6
+            self.binsize = (Max-Min+estbinwidth)/float(numbins)
+            self._origin = Min - self.binsize/2
+        self._offset = 0
+
+    def _lowerreallimit(self):
+        if self._offset == 0:
+            return self._origin
+        return self._origin + self._offset*self.binsize
+    lowerreallimit = property(_lowerreallimit)
+
+    def _grow(self, lo, hi):
+        # make bins lo..hi (indices relative to the current first bin) exist
+        if hi >= len(self.bins):
+            self.bins.extend([0]*(hi - len(self.bins) + 1))
+        if lo < 0:
+            self.bins[0:0] = [0]*(-lo)
+            self._offset = self._offset + lo
+
+    def add(self, values, weights=None):
+        """
+        Adds a batch of scores (optionally weighted) to the histogram.
+
+        Usage:   add(values, weights=None)
+        """
+        self._count(values, weights, 1)
+
+    def subtract(self, values, weights=None):
+        """
+        Removes a batch of previously added scores (and their weights).
+
+        Usage:   subtract(values, weights=None)
+        """
+        self._count(values, weights, -1)
+
+    def _count(self, values, weights, sign):
+        if hasattr(values, 'dtype'):
+            values = N.ravel(values)
+        elif type(values) not in [ListType, TupleType]:
+            values = list(values)
+        if len(values) == 0:
+            return
+        if weights is not None and len(weights) <> len(values):
+            raise ValueError, 'weights must be as long as values'
+        if self.binsize is None:
+            self._autolayout(values)
+        if hasattr(values, 'dtype'):
+            self._countarray(values, weights, sign)
+        else:
+            self._countlist(values, weights, sign)
+        self.n = self.n + sign*len(values)
+
+    def _countlist(self, values, weights, sign):
+        # bin k covers [origin+(k+offset)*binsize, origin+(k+offset+1)*binsize)
+        bins = self.bins
+        origin, binsize = self._origin, float(self.binsize)
+        if weights is None:
+            weights = [1]*len(values)
+        outside = 0
+        for num, w in zip(values, weights):
+            q = (num-origin)/binsize
+            if self._offset == 0 and 0 <= q < len(bins):
+                i = int(q)
+            else:
+                try:
+                    i = int(math.floor(q)) - self._offset
+                except (ValueError, OverflowError):     # NaN or inf
+                    outside = outside + 1
+                    continue
+                if not 0 <= i < len(bins):
+                    if not (self.extend and sign > 0):
+                        outside = outside + 1
+                        continue
+                    self._grow(i, i)
+                    i = max(i, 0)
+            bins[i] = bins[i] + sign*w
+        self.extrapoints = self.extrapoints + sign*outside
+
+    def _countarray(self, values, weights, sign):
+        olderr = N.seterr(invalid='ignore')
+        try:
+            q = N.floor((N.asarray(values, N.float_)-self._origin)
+                        / float(self.binsize))
+            if self.extend and sign > 0:
+                finite = q[N.isfinite(q)] - self._offset
+                if len(finite):
+                    self._grow(int(finite.min()), int(finite.max()))
+            q = q - self._offset
+            inside = (q >= 0) & (q < len(self.bins))
+        finally:
+            N.seterr(**olderr)
+        idx = q[inside].astype(N.int_)
+        if weights is None:
+            counts = N.bincount(idx, minlength=len(self.bins)).tolist()
+        else:
+            weights = N.ravel(N.asarray(weights))[inside]
+            counts = N.bincount(idx, weights, minlength=len(self.bins)).tolist()
+        self.bins = [b + sign*c for b, c in zip(self.bins, counts)]
+        self.extrapoints = self.extrapoints + sign*(len(values) - len(idx))
+
+    def merge(self, other):
+        """
+        Adds the counts of another Histogram.  Both must have the same bin
+        width and bin edges that line up; bins of other that fall outside
+        this histogram are added as extrapoints unless extend is set.
+
+        Usage:   merge(other)
+        Returns: self
+        """
+        if other.binsize is None:
+            return self
+        if self.binsize is None:
+            if self.n or self.extrapoints:
+                raise ValueError, 'cannot merge into a histogram without bins'
+            self.bins = [0]*len(other.bins)
+            self.binsize, self._origin = other.binsize, other.lowerreallimit
+            self._offset = 0
+        if abs(other.binsize - self.binsize) > 1e-12*abs(self.binsize):
+            raise ValueError, 'histograms have different bin widths'
+        shift = (other.lowerreallimit - self.lowerreallimit)/float(self.binsize)
+        start = int(round(shift))
+        if abs(shift - start) > 1e-6:
+            raise ValueError, 'histogram bin edges do not line up'
+        if self.extend:
+            self._grow(start, start + len(other.bins) - 1)
+            start = int(round((other.lowerreallimit - self.lowerreallimit)
+                              / float(self.binsize)))
+        for j in range(len(other.bins)):
+            i = start + j
+            if 0 <= i < len(self.bins):
+                self.bins[i] = self.bins[i] + other.bins[j]
+            else:
+                self.extrapoints = self.extrapoints + other.bins[j]
+        self.extrapoints = self.extrapoints + other.extrapoints
+        self.n = self.n + other.n
+        return self
+
+    def histogram(self):
+        """
+        Returns the histogram of all scores added so far.
+
+        Usage:   histogram()
+        Returns: list of bin values, lowerreallimit, binsize, extrapoints
+        """
+        return list(self.bins), self.lowerreallimit, self.binsize, self.extrapoints
+
+    def cumfreq(self):
+        """
+        Returns the cumulative frequency histogram, as cumfreq() would.
+
+        Usage:   cumfreq()
+        Returns: list of cumfreq bin values, lowerreallimit, binsize, extrapoints
+        """
+        h, l, b, e = self.histogram()
+        return lcumsum(h), l, b, e
+
+    def relfreq(self):
+        """
+        Returns the relative frequency histogram, as relfreq() would.
+
+        Usage:   relfreq()
+        Returns: list of relfreq bin values, lowerreallimit, binsize, extrapoints
+        """
+        h, l, b, e = self.histogram()
+        for i in range(len(h)):
+            h[i] = h[i]/float(self.n)
+        return h, l, b, e
+
+    def percentileofscore(self, score):
+        """
+        Returns the percentile (0-100) of score, interpolating within its
+        bin as percentileofscore() does.
+
+        Usage:   percentileofscore(score)
+        """
+        h, lrl, binsize, extras = self.histogram()
+        i = int(math.floor((score - lrl)/float(binsize)))
+        if i < 0:
+            return 0.0
+        if i >= len(h):
+            return (self.n - extras)/float(self.n) * 100
+        below = 0
+        for j in range(i):
+            below = below + h[j]
+        return (below + ((score-(lrl+binsize*i))/float(binsize))*h[i])/float(self.n) * 100
+
+
+class _RunningMeanVar(object):
+    """
+    n, mean and sum of squared deviations of a stream of values, with
+    Welford's update and its inverse (so values can be retracted).  With a
+    window, only the last window values are kept: each update beyond that
+    retracts the oldest value automatically.  Used by the running t-tests.
+
+    Usage:   _RunningMeanVar(window=None)
+    """
+
+    def __init__(self, window=None):
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0     # sum of (x-mean)**2
+        self.window = window
+        if window is not None:
+            if window < 2:
+                raise ValueError, 'window must hold at least 2 values'
+            self.values = collections.deque()
+
+    def update(self, x):
+        self.n = n = self.n + 1
+        delta = x - self.mean
+        self.mean = self.mean + delta/float(n)
+        self.M2 = self.M2 + delta*(x - self.mean)
+        if self.window is not None:
+            self.values.append(x)
+            if n > self.window:
+                self._remove(self.values.popleft())
+
+    def update_many(self, values):
+        if self.window is not None or not (type(values) in [ListType, TupleType]
+                                           or hasattr(values, 'dtype')):
+            for x in values:
+                self.update(x)
+            return
+        if hasattr(values, 'dtype'):
+            a = N.ravel(values).astype(N.float_)
+            nb = len(a)
+            if nb == 0:
+                return
+            meanb = float(N.add.reduce(a)) / nb
+            M2b = float(N.add.reduce((a-meanb)*(a-meanb)))
+        else:
+            nb = len(values)
+            if nb == 0:
+                return
+            meanb = lsum(values) / float(nb)
+            M2b = 0.0
+            for x in values:
+                M2b = M2b + (x-meanb)*(x-meanb)
+        na = self.n
+        n = na + nb
+        delta = meanb - self.mean
+        self.M2 = self.M2 + M2b + delta*delta*na*nb/float(n)
+        self.mean = self.mean + delta*nb/float(n)
+        self.n = n
+
+    def retract(self, x):
+        if self.window is not None:
+            try:
+                self.values.remove(x)
+            except ValueError:
+                raise ValueError, 'retract: %r is not in the window' % (x,)
+        self._remove(x)
+
+    def _remove(self, x):
+        if self.n == 0:
+            raise ValueError, 'retract: no values left'
+        self.n = n = self.n - 1
+        if n == 0:
+            self.mean = self.M2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean = self.mean - delta/float(n)
+        self.M2 = max(self.M2 - delta*(x - self.mean), 0.0)
+
+    def var(self):
+        return self.M2 / float(self.n - 1)
+
+
+def _tprob(t,df):
+    # two-tailed p-value of t on df degrees of freedom, as the t-tests use
+    return betai(0.5*df,0.5,df/(df+t*t))
+
+
+class RunningTTest1Samp(object):
+    """
+    One-sample t-test of a stream of values against popmean, giving the
+    same result as ttest_1samp() on all values seen (or on the last window
+    values) at O(1) cost per update and per result().  Values can be
+    retracted again with retract().
+
+    Usage:   rt = RunningTTest1Samp(popmean=0.0, window=None)
+             rt.update(x);  rt.update_many(values);  rt.retract(x);  rt.result()
+    """
+
+    def __init__(self, popmean=0.0, window=None):
+        self.popmean = popmean
+        self.a = _RunningMeanVar(window)
+
+    def update(self, x):
+        "Adds a value.  Usage:   update(x)"
+        self.a.update(x)
+
+    def update_many(self, values):
+        "Adds a list, tuple, array or other iterable of values.  Usage:   update_many(values)"
+        self.a.update_many(values)
+
+    def retract(self, x):
+        "Removes a value added earlier.  Usage:   retract(x)"
+        self.a.retract(x)
+
+    def result(self):
+        """
+        Returns the t-test of the values currently held.
+
+        Usage:   result()
+        Returns: t-value, two-tailed prob
+        """
+        a = self.a
+        if a.n < 2:
+            raise ValueError, 'RunningTTest1Samp needs at least 2 values'
+        t = (a.mean-self.popmean)/math.sqrt(a.var()/a.n)
+        return t, _tprob(t,a.n-1.0)
+
+
+class RunningTTestInd(object):
+    """
+    Two-sample t-test of independent streams a (sample=0) and b (sample=1),
+    e.g. the two arms of an A/B experiment.  With pooled=1 the result is that
+    of ttest_ind() (pooled variance, n1+n2-2 df); with pooled=0 it is Welch's
+    test (separate variances, Welch-Satterthwaite df).  Updates and result()
+    cost O(1); with a window, each sample keeps only its last window values.
+
+    Usage:   rt = RunningTTestInd(pooled=1, window=None)
+             rt.update(x, sample=0);  rt.update_many(values, sample=1)
+             rt.retract(x, sample=0);  rt.result()
+    """
+
+    def __init__(self, pooled=1, window=None):
+        self.pooled = pooled
+        self.samples = (_RunningMeanVar(window), _RunningMeanVar(window))
+
+    def update(self, x, sample=0):
+        "Adds a value to sample 0 (a) or 1 (b).  Usage:   update(x, sample=0)"
+        self.samples[sample].update(x)
+
+    def update_many(self, values, sample=0):
+        "Adds an iterable of values to sample 0 or 1.  Usage:   update_many(values, sample=0)"
+        self.samples[sample].update_many(values)
+
+    def retract(self, x, sample=0):
+        "Removes a value added earlier to sample 0 or 1.  Usage:   retract(x, sample=0)"
+        self.samples[sample].retract(x)
+
+    def result(self):
+        """
+        Returns the t-test of the values currently held in the two samples.
+
+        Usage:   result()
+        Returns: t-value, two-tailed prob
+        """
+        a, b = self.samples
+        if a.n < 2 or b.n < 2:
+            raise ValueError, 'RunningTTestInd needs at least 2 values per sample'
+        v1 = a.var()
+        v2 = b.var()
+        if self.pooled:
+            df = a.n + b.n - 2.0
+            svar = ((a.n-1)*v1 + (b.n-1)*v2)/df
+            t = (a.mean-b.mean)/math.sqrt(svar*(1.0/a.n + 1.0/b.n))
+        else:
+            s1 = v1/a.n
+            s2 = v2/b.n
+            t = (a.mean-b.mean)/math.sqrt(s1+s2)
+            df = (s1+s2)**2 / (s1*s1/(a.n-1) + s2*s2/(b.n-1))
+        return t, _tprob(t,df)
+
+
+class RunningTTestRel(object):
+    """
+    Paired t-test of a stream of (a, b) pairs, giving the same result as
+    ttest_rel() at O(1) cost per update and per result().  Only the
+    differences a-b are accumulated.
+
+    Usage:   rt = RunningTTestRel(window=None)
+             rt.update(a, b);  rt.update_many(alist, blist);  rt.retract(a, b)
+             rt.result()
+    """
+
+    def __init__(self, window=None):
+        self.d = _RunningMeanVar(window)
+
+    def update(self, a, b):
+        "Adds the pair (a, b).  Usage:   update(a, b)"
+        self.d.update(a-b)
+
+    def update_many(self, a, b):
+        "Adds pairs from two equal-length sequences.  Usage:   update_many(a, b)"
+        if len(a) <> len(b):
+            raise ValueError, 'Unequal length lists in RunningTTestRel.'
+        if hasattr(a, 'dtype') or hasattr(b, 'dtype'):
+            self.d.update_many(N.asarray(a,N.float_) - N.asarray(b,N.float_))
+        else:
+            self.d.update_many(map(lambda x, y: x-y, a, b))
+
+    def retract(self, a, b):
+        "Removes a pair added earlier.  Usage:   retract(a, b)"
+        self.d.retract(a-b)
+
+    def result(self):
+        """
+        Returns the paired t-test of the pairs currently held.
+
+        Usage:   result()
+        Returns: t-value, two-tailed prob
+        """
+        d = self.d
+        if d.n < 2:
+            raise ValueError, 'RunningTTestRel needs at least 2 pairs'
+        t = d.mean/math.sqrt(d.var()/d.n)
+        return t, _tprob(t,d.n-1.0)
+
+
+class RunningChisquare(object):
+    """
+    Chi-square goodness-of-fit test of a stream of category counts, as
+    chisquare() would compute it on the current counts.  Categories are
+    numbered 0..k-1.  With f_exp=None all categories are equally likely;
+    otherwise f_exp gives the expected frequencies (or proportions), which
+    are rescaled to the current total.  The statistic is kept as
+    sum(obs**2/exp) - n, so update(), retract() and result() cost O(1)
+    whatever k is.  With a window, only the counts of the last window
+    update()/update_many() calls are kept.
+
+    Usage:   rc = RunningChisquare(k=None, f_exp=None, window=None)
+             rc.update(category, count=1);  rc.update_many(counts)
+             rc.retract(category, count=1);  rc.result()
+    """
+
+    def __init__(self, k=None, f_exp=None, window=None):
+        if f_exp is not None:
+            k = len(f_exp)
+            total = float(lsum(list(f_exp)))
+            self.weights = [total/e for e in f_exp]    # 1/proportion
+        elif k is None:
+            raise ValueError, 'RunningChisquare needs k or f_exp'
+        else:
+            self.weights = [k]*k                       # integers stay exact
+        self.k = k
+        self.counts = [0]*k
+        self.n = 0
+        self.ss = 0        # sum of counts**2/proportion
+        self.window = window
+        if window is not None:
+            self.events = collections.deque()
+
+    def _add(self, event, sign):
+        for i, count in event:
+            count = sign*count
+            c = self.counts[i]
+            self.counts[i] = c + count
+            self.ss = self.ss + (2*c + count)*count*self.weights[i]
+            self.n = self.n + count
+
+    def _push(self, event):
+        self._add(event, 1)
+        if self.window is not None:
+            self.events.append(event)
+            if len(self.events) > self.window:
+                self._add(self.events.popleft(), -1)
+
+    def update(self, category, count=1):
+        """
+        Adds count observations in category (0..k-1).
+
+        Usage:   update(category, count=1)
+        """
+        self._push(((category, count),))
+
+    def update_many(self, counts):
+        """
+        Adds a list (or array) of k counts, one per category, as a single
+        update (so a window of w keeps the last w such batches).
+
+        Usage:   update_many(counts)
+        """
+        if len(counts) <> self.k:
+            raise ValueError, 'update_many needs one count per category'
+        self._push(tuple([(i, counts[i]) for i in range(self.k) if counts[i]]))
+
+    def retract(self, category, count=1):
+        """
+        Removes count observations from category.  In a window, this must
+        match an earlier update(category, count) that is still held.
+
+        Usage:   retract(category, count=1)
+        """
+        event = ((category, count),)
+        if self.window is not None:
+            try:
+                self.events.remove(event)
+            except ValueError:
+                raise ValueError, 'retract: no such update in the window'
+        elif count > self.counts[category]:
+            raise ValueError, 'retract: category %r has fewer counts' % (category,)
+        self._add(event, -1)
+
+    def result(self):
+        """
+        Returns the chi-square test of the counts currently held.
+
+        Usage:   result()
+        Returns: chisquare-statistic, associated p-value
+        """
+        if self.n == 0:
+            raise ValueError, 'RunningChisquare has no observations'
+        chisq = max((self.ss - self.n*self.n)/float(self.n), 0.0)
+        return chisq, chisqprob(chisq, self.k-1)
 
 
 ####################################
@@ -488,24 +1652,25 @@ def litemfreq(inlist):
     Usage:   litemfreq(inlist)
     Returns: a 2D frequency table (col [0:n-1]=scores, col n=frequencies)
     """
-    scores = pstat.unique(inlist)
-    scores.sort()
-    freq = []
-    for item in scores:
-        freq.append(inlist.count(item))
+    scores, freq = lcounts(inlist)
     return pstat.abut(scores, freq)
 
 
-def lscoreatpercentile (inlist, percent):
+def lscoreatpercentile (inlist, percent, method='histogram'):
     """
     Returns the score at a given percentile relative to the distribution
-    given by inlist.
+    given by inlist.  The default method interpolates within a 10-bin
+    histogram; method='exact' uses lquantiles() instead.
 
-    Usage:   lscoreatpercentile(inlist,percent)
+    Usage:   lscoreatpercentile(inlist,percent,method='histogram')
     """
     if percent > 1:
         print "\nDividing percent>1 by 100 in lscoreatpercentile().\n"
         percent = percent / 100.0
+    if method == 'exact':
+        return lquantiles(inlist,percent*100)
+    elif method <> 'histogram':
+        raise ValueError, "method must be 'histogram' or 'exact'"
     targetcf = percent*len(inlist)
     h, lrl, binsize, extras = histogram(inlist)
     cumhist = cumsum(copy.deepcopy(h))
@@ -516,6 +1681,88 @@ def lscoreatpercentile (inlist, percent):
     return score
 
 
+def lselect (inlist, ranks):
+    """
+    Partially orders inlist IN PLACE so that inlist[k] holds the k-th
+    smallest value (counting from 0) for every k in ranks.  Uses a
+    quickselect that only descends into the partitions still holding a
+    wanted rank, so many ranks cost one partitioning pass (average O(n));
+    partitions that recurse too deeply are simply sorted (introselect).
+
+    Usage:   lselect(inlist,ranks)
+    Returns: inlist
+    """
+    n = len(inlist)
+    ranks = [k for k in ranks if 0 <= k < n]
+    if not ranks:
+        return inlist
+    maxdepth = 2*int(math.log(n,2)+1)
+    pending = [(0, n, ranks, 0)]
+    while pending:
+        lo, hi, ks, depth = pending.pop()
+        if hi-lo <= 16 or depth > maxdepth:
+            inlist[lo:hi] = sorted(inlist[lo:hi])
+            continue
+        part = inlist[lo:hi]
+        a, b, c = part[0], part[len(part)/2], part[-1]
+        if a > b: a, b = b, a
+        if b > c: b = c
+        if a > b: b = a
+        pivot = b                          # median of three
+        below = [x for x in part if x < pivot]
+        equal = [x for x in part if x == pivot]
+        above = [x for x in part if x > pivot]
+        inlist[lo:hi] = below + equal + above
+        lt = lo + len(below)
+        gt = lt + len(equal)
+        left = [k for k in ks if k < lt]
+        right = [k for k in ks if k >= gt]
+        if left:
+            pending.append((lo, lt, left, depth+1))
+        if right:
+            pending.append((gt, hi, right, depth+1))
+    return inlist
+
+
+def lquantiles (inlist, percents):
+    """
+    Returns the EXACT score(s) at the given percentile(s) (0-100), linearly
+    interpolating between order statistics (the k-th smallest of n values
+    sits at percentile 100*k/(n-1)).  All percentiles are found with one
+    lselect() call on a copy of inlist, without a full sort.
+
+    Usage:   lquantiles(inlist,percents)   percents is a number or a sequence
+    Returns: score, or a list of scores in the order of percents
+    """
+    n = len(inlist)
+    if n == 0:
+        raise ValueError, 'lquantiles() needs at least one score'
+    single = type(percents) not in [ListType, TupleType]
+    if single:
+        percents = [percents]
+    positions = []
+    ranks = {}
+    for p in percents:
+        if p < 0 or p > 100:
+            raise ValueError, 'percents must be between 0 and 100'
+        h = (n-1)*p/100.0
+        k = int(h)
+        positions.append((k, h-k))
+        ranks[k] = 1
+        if h > k:
+            ranks[k+1] = 1
+    values = lselect(list(inlist), ranks.keys())
+    scores = []
+    for k, frac in positions:
+        if frac > 0:
+            scores.append(values[k] + frac*(values[k+1]-values[k]))
+        else:
+            scores.append(values[k])
+    if single:
+        return scores[0]
+    return scores
+
+
 def lpercentileofscore (inlist, score,histbins=10,defaultlimits=None):
     """
     Returns the percentile value of a score relative to the distribution
@@ -531,15 +1778,16 @@ def lpercentileofscore (inlist, score,histbins=10,defaultlimits=None):
     return pct
 
 
-def lhistogram (inlist,numbins=10,defaultreallimits=None,printextras=0):
+def lhistogram (inlist,numbins=10,defaultreallimits=None,printextras=0,weights=None):
     """
     Returns (i) a list of histogram bin counts, (ii) the smallest value
     of the histogram binning, and (iii) the bin width (the last 2 are not
     necessarily integers).  Default number of bins is 10.  If no sequence object
     is given for defaultreallimits, the routine picks (usually non-pretty) bins
-    spanning all the numbers in the inlist.
+    spanning all the numbers in the inlist.  If weights (a list as long as
+    inlist) is given, each bin holds the summed weights of its scores.
 
-    Usage:   lhistogram (inlist, numbins=10, defaultreallimits=None,suppressoutput=0)
+    Usage:   lhistogram (inlist, numbins=10, defaultreallimits=None,printextras=0,weights=None)
     Returns: list of bin values, lowerreallimit, binsize, extrapoints
     """
     if (defaultreallimits <> None):
@@ -551,20 +1799,33 @@ def lhistogram (inlist,numbins=10,defaultreallimits=None,printextras=0):
             upperreallimit = defaultreallimits[1]
         binsize = (upperreallimit-lowerreallimit)/float(numbins)
     else:     # no limits given for histogram, both must be calc'd
-        estbinwidth=(max(inlist)-min(inlist))/float(numbins) +1e-6 #1=>cover all
-        binsize = ((max(inlist)-min(inlist)+estbinwidth))/float(numbins)
-        lowerreallimit = min(inlist) - binsize/2 #lower real limit,1st bin
+        Min = min(inlist)
+        Max = max(inlist)
+        estbinwidth=(Max-Min)/float(numbins) +1e-6 #1=>cover all
+        binsize = ((Max-Min+estbinwidth))/float(numbins)
+        lowerreallimit = Min - binsize/2 #lower real limit,1st bin
+    if weights is not None and len(weights) <> len(inlist):
+        raise ValueError, 'weights must be as long as inlist'
     bins = [0]*(numbins)
-    extrapoints = 0
-    for num in inlist:
-        try:
-            if (num-lowerreallimit) < 0:
-                extrapoints = extrapoints + 1
-            else:
-                bintoincrement = int((num-lowerreallimit)/float(binsize))
-                bins[bintoincrement] = bins[bintoincrement] + 1
-        except:
-            extrapoints = extrapoints + 1
+    inside = 0
+    fbinsize = float(binsize)
+    if fbinsize == 0:                  # degenerate limits, nothing fits
+        pass
+    elif weights is None:
+        for num in inlist:
+            i = (num-lowerreallimit)/fbinsize
+            if 0 <= i < numbins:       # also False for NaN
+                i = int(i)
+                bins[i] = bins[i] + 1
+                inside = inside + 1
+    else:
+        for num, w in zip(inlist,weights):
+            i = (num-lowerreallimit)/fbinsize
+            if 0 <= i < numbins:
+                i = int(i)
+                bins[i] = bins[i] + w
+                inside = inside + 1
+    extrapoints = len(inlist) - inside
     if (extrapoints > 0 and printextras == 1):
         print '\nPoints outside given histogram range =',extrapoints
     return (bins, lowerreallimit, binsize, extrapoints)
@@ -960,33 +2221,69 @@ def lpointbiserialr(x,y):
 
 def lkendalltau(x,y):
     """
-    Calculates Kendall's tau ... correlation of ordinal data.  Adapted
-    from function kendl1 in Numerical Recipes.  Needs good test-routine.@@@
+    Calculates Kendall's tau-b ... correlation of ordinal data, with ties
+    in x, in y and in both counted separately.  Uses Knight's O(n log n)
+    algorithm (Knight, W. (1966) JASA 61:436-439): sort the pairs by x
+    (then y), count ties, and count the discordant pairs as the swaps a
+    merge sort needs to put the y values in order.
 
     Usage:   lkendalltau(x,y)
     Returns: Kendall's tau, two-tailed p-value
     """
-    n1 = 0
-    n2 = 0
-    iss = 0
-    for j in range(len(x)-1):
-        for k in range(j,len(y)):
-            a1 = x[j] - x[k]
-            a2 = y[j] - y[k]
-            aa = a1 * a2
-            if (aa):             # neither list has a tie
-                n1 = n1 + 1
-                n2 = n2 + 1
-                if aa > 0:
-                    iss = iss + 1
-                else:
-                    iss = iss -1
-            else:
-                if (a1):
-                    n1 = n1 + 1
+    n = len(x)
+    if len(y) <> n:
+        raise ValueError, 'Unequal N in kendalltau.  Aborting.'
+    pairs = zip(x,y)
+    pairs.sort()
+    xties = jointties = 0             # tied pairs in x, and in both x and y
+    i = 0
+    while i < n:
+        j = i + 1
+        while j < n and pairs[j][0] == pairs[i][0]:
+            j = j + 1
+        xties = xties + (j-i)*(j-i-1)/2
+        k = i
+        while k < j:
+            m = k + 1
+            while m < j and pairs[m][1] == pairs[k][1]:
+                m = m + 1
+            jointties = jointties + (m-k)*(m-k-1)/2
+            k = m
+        i = j
+    # bottom-up merge sort of the y values, counting swaps
+    ys = [pair[1] for pair in pairs]
+    swaps = 0
+    width = 1
+    while width < n:
+        merged = []
+        for lo in range(0, n, 2*width):
+            left = ys[lo:lo+width]
+            right = ys[lo+width:lo+2*width]
+            nleft = len(left)
+            i = j = 0
+            while i < nleft and j < len(right):
+                if left[i] <= right[j]:
+                    merged.append(left[i])
+                    i = i + 1
                 else:
-                    n2 = n2 + 1
-    tau = iss / math.sqrt(n1*n2)
+                    merged.append(right[j])
+                    j = j + 1
+                    swaps = swaps + nleft - i
+            merged.extend(left[i:])
+            merged.extend(right[j:])
+        ys = merged
+        width = width * 2
+    yties = 0
+    i = 0
+    while i < n:
+        j = i + 1
+        while j < n and ys[j] == ys[i]:
+            j = j + 1
+        yties = yties + (j-i)*(j-i-1)/2
+        i = j
+    npairs = n*(n-1)/2
+    iss = npairs - xties - yties + jointties - 2*swaps  # concordant-discordant
+    tau = iss / math.sqrt(float(npairs-xties)*(npairs-yties))
     svar = (4.0*len(x)+10.0) / (9.0*len(x)*(len(x)-1))
     z = tau / math.sqrt(svar)
     prob = erfcc(abs(z)/1.4142136)
@@ -1140,37 +2437,38 @@ def lchisquare(f_obs,f_exp=None):
     return chisq, chisqprob(chisq, k-1)
 
 
-def lks_2samp (data1,data2):
+def lks_2samp (data1,data2,exact=0):
     """
     Computes the Kolmogorov-Smirnof statistic on 2 samples.  From
-    Numerical Recipes in C, page 493.
+    Numerical Recipes in C, page 493, but stepping past tied values before
+    comparing the two empirical distributions.  The inputs are not sorted
+    in place.  With exact=1 the p-value is the exact (untied) permutation
+    probability of a D this large, which costs O(n1*n2); otherwise it is
+    the asymptotic Kolmogorov approximation.
 
-    Usage:   lks_2samp(data1,data2)   data1&2 are lists of values for 2 conditions
+    Usage:   lks_2samp(data1,data2,exact=0)   data1&2 are lists of values for 2 conditions
     Returns: KS D-value, associated p-value
     """
     j1 = 0
     j2 = 0
-    fn1 = 0.0
-    fn2 = 0.0
     n1 = len(data1)
     n2 = len(data2)
-    en1 = n1
-    en2 = n2
+    en1 = float(n1)
+    en2 = float(n2)
     d = 0.0
-    data1.sort()
-    data2.sort()
+    data1 = sorted(data1)
+    data2 = sorted(data2)
     while j1 < n1 and j2 < n2:
-        d1=data1[j1]
-        d2=data2[j2]
-        if d1 <= d2:
-            fn1 = (j1)/float(en1)
+        x = min(data1[j1],data2[j2])
+        while j1 < n1 and data1[j1] <= x:
             j1 = j1 + 1
-        if d2 <= d1:
-            fn2 = (j2)/float(en2)
+        while j2 < n2 and data2[j2] <= x:
             j2 = j2 + 1
-        dt = (fn2-fn1)
+        dt = j2/en2 - j1/en1
         if math.fabs(dt) > math.fabs(d):
             d = dt
+    if exact:
+        return d, _lksexact(n1,n2,d)
     try:
         en = math.sqrt(en1*en2/float(en1+en2))
         prob = ksprob((en+0.12+0.11/en)*abs(d))
@@ -1179,6 +2477,44 @@ def lks_2samp (data1,data2):
     return d, prob
 
 
+def _lksexact (n1,n2,d):
+    """
+    Exact two-sided p-value of a two-sample KS statistic d, for continuous
+    (untied) data.  Walks the lattice of merge orders one anti-diagonal at
+    a time, keeping for each cell the fraction of paths into it that stay
+    strictly inside |i/n1-j/n2| < |d|, and sums the probability of paths
+    first leaving that band (hypergeometric weights, so small p-values do
+    not cancel).
+
+    Usage:   _lksexact(n1,n2,d)
+    Returns: p-value
+    """
+    h = round(abs(d)*n1*n2)
+    if h <= 0 or n1 == 0 or n2 == 0:
+        return 1.0
+    lf = [0.0]*(n1+n2+2)
+    for k in range(2,n1+n2+2):
+        lf[k] = lf[k-1] + math.log(k)
+    lall = lf[n1+n2] - lf[n1] - lf[n2]
+    prob = 0.0
+    u = [1.0] + [0.0]*n1               # u[i] is cell (i,k-i) on diagonal k
+    for k in range(1,n1+n2+1):
+        new = [0.0]*(n1+1)
+        for i in range(max(0,k-n2),min(k,n1)+1):
+            j = k-i
+            if i > 0:
+                v = (i*u[i-1] + j*u[i])/float(k)
+            else:
+                v = u[i]
+            if abs(i*n2-j*n1) < h:
+                new[i] = v
+            elif v:
+                prob = prob + v*math.exp(lf[k]-lf[i]-lf[j] + lf[n1+n2-k]
+                                         - lf[n1-i] - lf[n2-j] - lall)
+        u = new
+    return min(prob,1.0)
+
+
 def lmannwhitneyu(x,y):
     """
     Calculates a Mann-Whitney U statistic on the provided scores and
@@ -1193,14 +2529,14 @@ def lmannwhitneyu(x,y):
     """
     n1 = len(x)
     n2 = len(y)
-    ranked = rankdata(x+y)
+    ranked, ties = lrankties(list(x)+list(y))
     rankx = ranked[0:n1]       # get the x-ranks
     ranky = ranked[n1:]        # the rest are y-ranks
     u1 = n1*n2 + (n1*(n1+1))/2.0 - sum(rankx)  # calc U for x
     u2 = n1*n2 - u1                            # remainder is U for y
     bigu = max(u1,u2)
     smallu = min(u1,u2)
-    T = math.sqrt(tiecorrect(ranked))  # correction factor for tied scores
+    T = math.sqrt(ltiecorrect(ranked,ties))  # correction factor for tied scores
     if T == 0:
         raise ValueError, 'All numbers are identical in lmannwhitneyu'
     sd = math.sqrt(T*n1*n2*(n1+n2+1)/12.0)
@@ -1208,27 +2544,32 @@ def lmannwhitneyu(x,y):
     return smallu, 1.0 - zprob(z)
 
 
-def ltiecorrect(rankvals):
+def ltiecorrect(rankvals,ties=None):
     """
     Corrects for ties in Mann Whitney U and Kruskal Wallis H tests.  See
     Siegel, S. (1956) Nonparametric Statistics for the Behavioral Sciences.
-    New York: McGraw-Hill.  Code adapted from |Stat rankind.c code.
+    New York: McGraw-Hill.  Code adapted from |Stat rankind.c code.  Pass
+    the tie-group sizes from rankties() as ties to skip sorting rankvals.
 
-    Usage:   ltiecorrect(rankvals)
+    Usage:   ltiecorrect(rankvals,ties=None)
     Returns: T correction factor for U or H
     """
-    sorted,posn = shellsort(rankvals)
-    n = len(sorted)
+    n = len(rankvals)
+    if ties is None:
+        svec = sorted(rankvals)
+        ties = []
+        i = 0
+        while (i<n-1):
+            if svec[i] == svec[i+1]:
+                nties = 1
+                while (i<n-1) and (svec[i] == svec[i+1]):
+                    nties = nties +1
+                    i = i +1
+                ties.append(nties)
+            i = i+1
     T = 0.0
-    i = 0
-    while (i<n-1):
-        if sorted[i] == sorted[i+1]:
-            nties = 1
-            while (i<n-1) and (sorted[i] == sorted[i+1]):
-                nties = nties +1
-                i = i +1
-            T = T + nties**3 - nties
-        i = i+1
+    for nties in ties:
+        T = T + nties**3 - nties
     T = T / float(n**3-n)
     return 1.0 - T
 
@@ -1303,9 +2644,9 @@ def lkruskalwallish(*args):
     all = []
     n = map(len,args)
     for i in range(len(args)):
-        all = all + args[i]
-    ranked = rankdata(all)
-    T = tiecorrect(ranked)
+        all = all + list(args[i])
+    ranked, ties = lrankties(all)
+    T = ltiecorrect(ranked,ties)
     for i in range(len(args)):
         args[i] = ranked[0:n[i]]
         del ranked[0:n[i]]
@@ -1353,6 +2694,30 @@ def lfriedmanchisquare(*args):
 ####  PROBABILITY CALCULATIONS  ####
 ####################################
 
+# Chebyshev coefficients of log(erfc(z)*exp(z*z)/t) in 4t-2, t = 2/(2+z),
+# z >= 0 (Numerical Recipes, 3rd ed., Erf::erfccheb); relative error ~1e-16
+_ERFCCOF = (-1.3026537197817094, 6.4196979235649026e-1,
+            1.9476473204185836e-2, -9.561514786808631e-3, -9.46595344482036e-4,
+            3.66839497852761e-4, 4.2523324806907e-5, -2.0278578112534e-5,
+            -1.624290004647e-6, 1.303655835580e-6, 1.5626441722e-8,
+            -8.5238095915e-8, 6.529054439e-9, 5.059343495e-9, -9.91364156e-10,
+            -2.27365122e-10, 9.6467911e-11, 2.394038e-12, -6.886027e-12,
+            8.94487e-13, 3.13092e-13, -1.12708e-13, 3.81e-16, 7.106e-15,
+            -1.523e-15, -9.4e-17, 1.21e-16, -2.8e-17)
+
+# Lanczos coefficients for g=7, n=9; log-gamma to ~1e-15 for x >= 0.5
+_LANCZOS = (0.99999999999980993, 676.5203681218851, -1259.1392167224028,
+            771.32342877765313, -176.61502916214059, 12.507343278686905,
+            -0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7)
+
+# the C library versions (Python 2.7+) are faster still for scalars
+try:
+    _erfc = math.erfc
+    _lgamma = math.lgamma
+except AttributeError:
+    _erfc = _lgamma = None
+
+
 def lchisqprob(chisq,df):
     """
     Returns the (1-tailed) probability value associated with the provided
@@ -1360,6 +2725,10 @@ def lchisqprob(chisq,df):
 
     Usage:   lchisqprob(chisq,df)
     """
+    if probcache is not None:
+        p = probcache.lookup('chisq',df,chisq)
+        if p is not None:
+            return p
     BIG = 20.0
     def ex(x):
         BIG = 20.0
@@ -1415,14 +2784,21 @@ def lchisqprob(chisq,df):
 
 def lerfcc(x):
     """
-    Returns the complementary error function erfc(x) with fractional
-    error everywhere less than 1.2e-7.  Adapted from Numerical Recipes.
+    Returns the complementary error function erfc(x), accurate to nearly
+    double precision.  Uses math.erfc where available, otherwise the
+    Chebyshev expansion of Numerical Recipes (3rd ed.).
 
     Usage:   lerfcc(x)
     """
+    if _erfc is not None:
+        return _erfc(x)
     z = abs(x)
-    t = 1.0 / (1.0+0.5*z)
-    ans = t * math.exp(-z*z-1.26551223 + t*(1.00002368+t*(0.37409196+t*(0.09678418+t*(-0.18628806+t*(0.27886807+t*(-1.13520398+t*(1.48851587+t*(-0.82215223+t*0.17087277)))))))))
+    t = 2.0 / (2.0+z)
+    ty = 4.0*t - 2.0
+    d = dd = 0.0
+    for j in range(len(_ERFCCOF)-1,0,-1):
+        d, dd = ty*d - dd + _ERFCCOF[j], d
+    ans = t * math.exp(-z*z + 0.5*(_ERFCCOF[0] + ty*d) - dd)
     if x >= 0:
         return ans
     else:
@@ -1500,63 +2876,275 @@ def lfprob (dfnum, dfden, F):
 
     Usage:   lfprob(dfnum, dfden, F)   where usually dfnum=dfbn, dfden=dfwn
     """
+    if probcache is not None:
+        p = probcache.lookup('f',(dfnum,dfden),F)
+        if p is not None:
+            return p
     p = betai(0.5*dfden, 0.5*dfnum, dfden/float(dfden+dfnum*F))
     return p
 
 
+class ProbCache(object):
+    """
+    Opt-in cache of interpolation tables for chisqprob() and fprob(), for
+    workloads that call them over and over with the same few degrees of
+    freedom.  Install it with stats.probcache = ProbCache(); the list and
+    array versions of both functions then consult it (scalar or array
+    statistics; the degrees of freedom must be scalars).
+
+    The first call for a df (or dfnum,dfden pair) tabulates log(p) as a
+    piecewise cubic in sqrt(statistic), refining each interval until the
+    relative error against the exact function is within tol at the
+    midpoints checked; each later call is a bisection plus one cubic.
+    Tables cover p >= PMIN; smaller p-values, negative and NaN statistics
+    go to the exact function.  At most maxsize tables are kept, evicting
+    the least recently used.  hits, misses (table builds), evictions and
+    fallbacks (exact calls) are attributes; info() returns all of them.
+    Scalar chisqprob() with df below about 20 is already cheaper than a
+    lookup; see the probcache section of test/benchmark.py.
+
+    Usage:   probcache = ProbCache(maxsize=32, tol=1e-9)
+    """
+    PMIN = 1e-8        # tables stop where p drops below this
+    MAXDEPTH = 24      # interval halvings before accepting a fit
+
+    def __init__(self, maxsize=32, tol=1e-9):
+        if maxsize < 1:
+            raise ValueError, 'ProbCache needs maxsize >= 1'
+        self.maxsize = maxsize
+        self.tol = tol
+        self.clear()
+
+    def clear(self):
+        """
+        Drops every table and resets the statistics.
+
+        Usage:   cache.clear()
+        """
+        self._tables = {}
+        self._lastused = {}
+        self._clock = 0
+        self._exact = 0
+        self.hits = self.misses = self.evictions = self.fallbacks = 0
+
+    def info(self):
+        """
+        Usage:   cache.info()
+        Returns: dict of hits, misses, evictions, fallbacks, size, maxsize
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'fallbacks': self.fallbacks,
+                'size': len(self._tables), 'maxsize': self.maxsize}
+
+    def chisqprob(self, chisq, df):
+        """
+        Cached chisqprob(chisq,df), for a scalar or an array chisq.
+
+        Usage:   cache.chisqprob(chisq,df)
+        """
+        return self._lookup('chisq',df,chisq)
+
+    def fprob(self, dfnum, dfden, F):
+        """
+        Cached fprob(dfnum,dfden,F), for a scalar or an array F.
+
+        Usage:   cache.fprob(dfnum,dfden,F)
+        """
+        return self._lookup('f',(dfnum,dfden),F)
+
+    def lookup(self, kind, key, x):
+        """
+        Hook used by the probability functions; returns None (meaning
+        compute it exactly) while a table is being built or when key is
+        not a scalar.
+
+        Usage:   cache.lookup(kind,key,x)   kind is 'chisq' or 'f'
+        """
+        if self._exact:
+            return None
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return self._lookup(kind,key,x)
+
+    def _exactprob(self, kind, key, x):
+        "Calls the uncached function for kind (list or array version)."
+        self._exact = 1
+        try:
+            if kind == 'chisq':
+                if getattr(x,'ndim',0) > 0:
+                    return achisqprob(x,key)
+                return lchisqprob(x,key)
+            if getattr(x,'ndim',0) > 0:
+                return afprob(key[0],key[1],x)
+            return lfprob(key[0],key[1],x)
+        finally:
+            self._exact = 0
+
+    def _table(self, kind, key):
+        "Returns the table for (kind,key), building it on a miss."
+        self._clock = self._clock + 1
+        tkey = (kind,key)
+        table = self._tables.get(tkey)
+        if table is not None:
+            self.hits = self.hits + 1
+        else:
+            self.misses = self.misses + 1
+            table = self._build(kind,key)
+            if len(self._tables) >= self.maxsize:
+                oldest = min(self._lastused.items(), key=lambda item: item[1])[0]
+                del self._tables[oldest]
+                del self._lastused[oldest]
+                self.evictions = self.evictions + 1
+            self._tables[tkey] = table
+        self._lastused[tkey] = self._clock
+        return table
+
+    def _build(self, kind, key):
+        """
+        Tabulates y(t) = log(p(t*t)) on [0,tmax], where tmax is the last
+        power of 2 with p >= PMIN, as cubics through 4 equally spaced
+        points.  The checks at 1/6, 1/2 and 5/6 of an interval are exactly
+        the interior points of its two halves, so refinement reuses them.
+        """
+        def y(t):
+            p = self._exactprob(kind,key,t*t)
+            return math.log(max(p,1e-300))
+        ends = [0.0]
+        t = 0.125
+        while t < 2.0**60 and y(t) >= math.log(self.PMIN):
+            ends.append(t)
+            t = t * 2.0
+        nodes = []
+        coeffs = []
+        pending = []
+        for i in range(len(ends)-2,-1,-1):
+            t0, t1 = ends[i], ends[i+1]
+            h = (t1-t0) / 3.0
+            pending.append((t0, t1, (y(t0), y(t0+h), y(t1-h), y(t1)), 0))
+        while pending:
+            t0, t1, ys, depth = pending.pop()
+            y0, y1, y2, y3 = ys
+            c = (y0,
+                 (-11*y0 + 18*y1 - 9*y2 + 2*y3) / 2.0,
+                 (18*y0 - 45*y1 + 36*y2 - 9*y3) / 2.0,
+                 (-9*y0 + 27*y1 - 27*y2 + 9*y3) / 2.0)
+            h = t1-t0
+            checks = [y(t0+h/6.0), y(t0+h/2.0), y(t1-h/6.0)]
+            worst = 0.0
+            for s, yc in zip([1/6.0, 0.5, 5/6.0], checks):
+                worst = max(worst, abs(((c[3]*s+c[2])*s+c[1])*s+c[0] - yc))
+            if worst <= 0.5*self.tol or depth >= self.MAXDEPTH:
+                nodes.append(t0)
+                coeffs.append(c)
+            else:           # right half first, so the left one pops first
+                pending.append((t0+h/2.0, t1, (checks[1], y2, checks[2], y3), depth+1))
+                pending.append((t0, t0+h/2.0, (y0, checks[0], y1, checks[1]), depth+1))
+        nodes.append(ends[-1])
+        return nodes, coeffs, None
+
+    def _arrays(self, kind, key, table):
+        "Array form of a table (built on first array lookup)."
+        nodes, coeffs, arrays = table
+        if arrays is None:
+            arrays = (N.array(nodes), N.transpose(N.array(coeffs)))
+            self._tables[(kind,key)] = (nodes, coeffs, arrays)
+        return arrays
+
+    def _lookup(self, kind, key, x):
+        table = self._table(kind,key)
+        nodes, coeffs = table[0], table[1]
+        tmax = nodes[-1]
+        if getattr(x,'ndim',0) > 0:
+            nodes, coeffs = self._arrays(kind,key,table)
+            x = x.astype(N.float_)
+            inside = N.greater_equal(x,0) & N.less(x,tmax*tmax)
+            t = N.sqrt(N.where(inside,x,0.0))
+            i = N.searchsorted(nodes,t,'right') - 1
+            i = N.clip(i,0,len(nodes)-2)
+            s = (t-nodes[i]) / (nodes[i+1]-nodes[i])
+            c0, c1, c2, c3 = coeffs[0][i], coeffs[1][i], coeffs[2][i], coeffs[3][i]
+            p = N.exp(((c3*s+c2)*s+c1)*s+c0)
+            outside = ~inside
+            if N.sometrue(outside):
+                nans = N.isnan(x)
+                rest = outside & ~nans
+                p[nans] = N.nan
+                if N.sometrue(rest):
+                    self.fallbacks = self.fallbacks + 1
+                    p[rest] = self._exactprob(kind,key,x[rest])
+            return p
+        if not (0 <= x < tmax*tmax):
+            self.fallbacks = self.fallbacks + 1
+            return self._exactprob(kind,key,x)
+        t = math.sqrt(x)
+        i = bisect.bisect_right(nodes,t) - 1
+        c0, c1, c2, c3 = coeffs[i]
+        s = (t-nodes[i]) / (nodes[i+1]-nodes[i])
+        return math.exp(((c3*s+c2)*s+c1)*s+c0)
+
+
 def lbetacf(a,b,x):
     """
     This function evaluates the continued fraction form of the incomplete
-    Beta function, betai.  (Adapted from: Numerical Recipes in C.)
+    Beta function, betai, by the modified Lentz method.  (Adapted from:
+    Numerical Recipes in C, 2nd ed.)
 
     Usage:   lbetacf(a,b,x)
     """
-    ITMAX = 200
-    EPS = 3.0e-7
+    # convergence takes O(sqrt(max(a,b))) iterations
+    ITMAX = max(200,int(10*math.sqrt(min(max(a,b),1e12))))
+    EPS = 3.0e-16
+    FPMIN = 1.0e-300
 
-    bm = az = am = 1.0
     qab = a+b
     qap = a+1.0
     qam = a-1.0
-    bz = 1.0-qab*x/qap
-    for i in range(ITMAX+1):
-        em = float(i+1)
-        tem = em + em
-        d = em*(b-em)*x/((qam+tem)*(a+tem))
-        ap = az + d*am
-        bp = bz+d*bm
-        d = -(a+em)*(qab+em)*x/((qap+tem)*(a+tem))
-        app = ap+d*az
-        bpp = bp+d*bz
-        aold = az
-        am = ap/bpp
-        bm = bp/bpp
-        az = app/bpp
-        bz = 1.0
-        if (abs(az-aold)<(EPS*abs(az))):
-            return az
+    c = 1.0
+    d = 1.0-qab*x/qap
+    if abs(d) < FPMIN:
+        d = FPMIN
+    d = 1.0/d
+    h = d
+    for i in range(1,ITMAX+1):
+        m2 = 2*i
+        for aa in [i*(b-i)*x/((qam+m2)*(a+m2)),       # even step
+                   -(a+i)*(qab+i)*x/((a+m2)*(qap+m2))]: # odd step
+            d = 1.0+aa*d
+            if abs(d) < FPMIN:
+                d = FPMIN
+            c = 1.0+aa/c
+            if abs(c) < FPMIN:
+                c = FPMIN
+            d = 1.0/d
+            delta = d*c
+            h = h*delta
+        if abs(delta-1.0) < EPS:
+            return h
     print 'a or b too big, or ITMAX too small in Betacf.'
+    return h
 
 
 def lgammln(xx):
     """
-    Returns the gamma function of xx.
+    Returns the log of the gamma function of xx (log|gamma| for xx < 0).
     Gamma(z) = Integral(0,infinity) of t^(z-1)exp(-t) dt.
-    (Adapted from: Numerical Recipes in C.)
+    Uses math.lgamma where available, otherwise a Lanczos series accurate
+    to about 1e-15.
 
     Usage:   lgammln(xx)
     """
-
-    coeff = [76.18009173, -86.50532033, 24.01409822, -1.231739516,
-             0.120858003e-2, -0.536382e-5]
+    if _lgamma is not None:
+        return _lgamma(xx)
+    if xx < 0.5:        # reflection formula
+        return math.log(math.pi/abs(math.sin(math.pi*xx))) - lgammln(1.0-xx)
     x = xx - 1.0
-    tmp = x + 5.5
-    tmp = tmp - (x+0.5)*math.log(tmp)
-    ser = 1.0
-    for j in range(len(coeff)):
-        x = x + 1
-        ser = ser + coeff[j]/x
-    return -tmp + math.log(2.50662827465*ser)
+    ser = _LANCZOS[0]
+    for j in range(1,len(_LANCZOS)):
+        ser = ser + _LANCZOS[j]/(x+j)
+    t = x + 7.5
+    return 0.91893853320467274 + (x+0.5)*math.log(t) - t + math.log(ser)
 
 
 def lbetai(a,b,x):
@@ -1785,24 +3373,41 @@ def lshellsort(inlist):
     Usage:   lshellsort(inlist)
     Returns: sorted-inlist, sorting-index-vector (for original list)
     """
-    n = len(inlist)
-    svec = copy.deepcopy(inlist)
-    ivec = range(n)
-    gap = n/2   # integer division needed
-    while gap >0:
-        for i in range(gap,n):
-            for j in range(i-gap,-1,-gap):
-                while j>=0 and svec[j]>svec[j+gap]:
-                    temp        = svec[j]
-                    svec[j]     = svec[j+gap]
-                    svec[j+gap] = temp
-                    itemp       = ivec[j]
-                    ivec[j]     = ivec[j+gap]
-                    ivec[j+gap] = itemp
-        gap = gap / 2  # integer division needed
+    # name kept for compatibility; python's stable O(n log n) sort does the work
+    ivec = sorted(range(len(inlist)), key=inlist.__getitem__)
+    svec = [inlist[i] for i in ivec]
     # svec is now sorted inlist, and ivec has the order svec[i] = vec[ivec[i]]
     return svec, ivec
 
+
+def lrankties(inlist):
+    """
+    Ranks the data in inlist (tied scores get their average rank) and
+    also returns the size of every group of tied scores, so that
+    tiecorrect() need not sort again.  Assumes a 1D inlist.
+
+    Usage:   lrankties(inlist)
+    Returns: list of rank scores, list of tie-group sizes (groups of 2+)
+    """
+    n = len(inlist)
+    ivec = sorted(range(n), key=inlist.__getitem__)
+    ranks = [0]*n
+    ties = []
+    i = 0
+    while i < n:
+        score = inlist[ivec[i]]
+        j = i + 1
+        while j < n and inlist[ivec[j]] == score:
+            j = j + 1
+        averank = (i + j - 1) / 2.0 + 1
+        for k in ivec[i:j]:
+            ranks[k] = averank
+        if j - i > 1:
+            ties.append(j - i)
+        i = j
+    return ranks, ties
+
+
 def lrankdata(inlist):
     """
     Ranks the data in inlist, dealing with ties appropritely.  Assumes
@@ -1811,21 +3416,7 @@ def lrankdata(inlist):
     Usage:   lrankdata(inlist)
     Returns: a list of length equal to inlist, containing rank scores
     """
-    n = len(inlist)
-    svec, ivec = shellsort(inlist)
-    sumranks = 0
-    dupcount = 0
-    newlist = [0]*n
-    for i in range(n):
-        sumranks = sumranks + i
-        dupcount = dupcount + 1
-        if i==n-1 or svec[i] <> svec[i+1]:
-            averank = sumranks / float(dupcount) + 1
-            for j in range(i-dupcount+1,i+1):
-                newlist[ivec[j]] = averank
-            sumranks = 0
-            dupcount = 0
-    return newlist
+    return lrankties(inlist)[0]
 
 
 def outputpairedstats(fname,writemode,name1,n1,m1,se1,min1,max1,name2,n2,m2,se2,min2,max2,statname,stat,prob):
@@ -1931,6 +3522,7 @@ describe = Dispatch ( (ldescribe, (ListType, TupleType)), )
 ## FREQUENCY STATISTICS:
 itemfreq = Dispatch ( (litemfreq, (ListType, TupleType)), )
 scoreatpercentile = Dispatch ( (lscoreatpercentile, (ListType, TupleType)), )
+quantiles = Dispatch ( (lquantiles, (ListType, TupleType)), )
 percentileofscore = Dispatch ( (lpercentileofscore, (ListType, TupleType)), )
 histogram = Dispatch ( (lhistogram, (ListType, TupleType)), )
 cumfreq = Dispatch ( (lcumfreq, (ListType, TupleType)), )
@@ -1968,6 +3560,7 @@ ks_2samp = Dispatch ( (lks_2samp, (ListType, TupleType)), )
 mannwhitneyu = Dispatch ( (lmannwhitneyu, (ListType, TupleType)), )
 ranksums = Dispatch ( (lranksums, (ListType, TupleType)), )
 tiecorrect = Dispatch ( (ltiecorrect, (ListType, TupleType)), )
+rankties = Dispatch ( (lrankties, (ListType, TupleType)), )
 wilcoxont = Dispatch ( (lwilcoxont, (ListType, TupleType)), )
 kruskalwallish = Dispatch ( (lkruskalwallish, (ListType, TupleType)), )
 friedmanchisquare = Dispatch ( (lfriedmanchisquare, (ListType, TupleType)), )
@@ -2106,13 +3699,13 @@ def aharmonicmean (inarray,dimension=None,keepdims=0):
             size = len(N.ravel(inarray))
             s = asum(1.0 / inarray)
             if keepdims == 1:
-                s = N.reshape([s],N.ones(len(inarray.shape)))
+                s = N.reshape([s],[1]*len(inarray.shape))
         else:
             idx[0] = -1
             loopcap = N.array(tinarray.shape[0:len(nondims)]) -1
             s = N.zeros(loopcap+1,N.float_)
             while incr(idx,loopcap) <> -1:
-                s[idx] = asum(1.0/tinarray[idx])
+                s[tuple(idx)] = asum(1.0/tinarray[tuple(idx)])
             size = N.multiply.reduce(N.take(inarray.shape,dims))
             if keepdims == 1:
                 shp = list(inarray.shape)
@@ -2164,19 +3757,24 @@ def amean (inarray,dimension=None,keepdims=0):
     return sum/denom
 
 
-def amedian (inarray,numbins=1000):
+def amedian (inarray,numbins=1000,method='histogram'):
     """
     Calculates the COMPUTED median value of an array of numbers, given the
     number of bins to use for the histogram (more bins approaches finding the
     precise median value of the array; default number of bins = 1000).  From
     G.W. Heiman's Basic Stats, or CRC Probability & Statistics.
+    method='exact' returns the exact median from aquantiles() instead.
     NOTE:  THIS ROUTINE ALWAYS uses the entire passed array (flattens it first).
     
-    Usage:   amedian(inarray,numbins=1000)
+    Usage:   amedian(inarray,numbins=1000,method='histogram')
     Returns: median calculated over ALL values in inarray
     """
     inarray = N.ravel(inarray)
-    (hist, smallest, binsize, extras) = ahistogram(inarray,numbins,[min(inarray),max(inarray)])
+    if method == 'exact':
+        return aquantiles(inarray,50)
+    elif method <> 'histogram':
+        raise ValueError, "method must be 'histogram' or 'exact'"
+    (hist, smallest, binsize, extras) = ahistogram(inarray,numbins,[min(inarray),max(inarray)],0)
     cumhist = N.cumsum(hist)            # make cumulative histogram
     otherbins = N.greater_equal(cumhist,len(inarray)/2.0)
     otherbins = list(otherbins)         # list of 0/1s, 1s start at median bin
@@ -2201,12 +3799,13 @@ def amedianscore (inarray,dimension=None):
     if dimension == None:
         inarray = N.ravel(inarray)
         dimension = 0
-    inarray = N.sort(inarray,dimension)
     if inarray.shape[dimension] % 2 == 0:   # if even number of elements
         indx = inarray.shape[dimension]/2   # integer division correct
+        inarray = N.partition(inarray,[indx-1,indx],dimension)
         median = N.asarray(inarray[indx]+inarray[indx-1]) / 2.0
     else:
         indx = inarray.shape[dimension] / 2 # integer division correct
+        inarray = N.partition(inarray,indx,dimension)
         median = N.take(inarray,[indx],dimension)
         if median.shape == (1,):
             median = median[0]
@@ -2227,18 +3826,24 @@ def amode(a, dimension=None):
     if dimension == None:
         a = N.ravel(a)
         dimension = 0
-    scores = pstat.aunique(N.ravel(a))       # get ALL unique values
+    # code every value by its unique score, then count codes per slice with
+    # one bincount; ties go to the score seen first in N.ravel(a)
+    scores, first, codes = N.unique(N.ravel(a),return_index=True,
+                                    return_inverse=True)
+    order = N.argsort(first,kind='mergesort')  # codes in 1st-seen order
+    codes = N.reshape(codes,a.shape)
+    codes = N.rollaxis(codes,dimension,codes.ndim)
+    codes = N.reshape(codes,(-1,codes.shape[-1]))
+    nscores = len(scores)
+    rows = N.arange(codes.shape[0])[:,N.newaxis]*nscores
+    counts = N.bincount(N.ravel(codes+rows),minlength=codes.shape[0]*nscores)
+    counts = N.reshape(counts,(codes.shape[0],nscores))[:,order]
+    best = N.argmax(counts,1)
     testshape = list(a.shape)
     testshape[dimension] = 1
-    oldmostfreq = N.zeros(testshape)
-    oldcounts = N.zeros(testshape)
-    for score in scores:
-        template = N.equal(a,score)
-        counts = asum(template,dimension,1)
-        mostfrequent = N.where(counts>oldcounts,score,oldmostfreq)
-        oldcounts = N.where(counts>oldcounts,counts,oldcounts)
-        oldmostfreq = mostfrequent
-    return oldcounts, mostfrequent
+    oldcounts = counts[N.arange(len(best)),best].astype(N.float_)
+    mostfrequent = scores[order][best].astype(N.float_)
+    return N.reshape(oldcounts,testshape), N.reshape(mostfrequent,testshape)
 
 
 def atmean(a,limits=None,inclusive=(1,1)):
@@ -2579,19 +4184,22 @@ def aitemfreq(a):
     Usage:   aitemfreq(a)
     Returns: a 2D frequency table (col [0:n-1]=scores, col n=frequencies)
     """
-    scores = pstat.aunique(a)
-    scores = N.sort(scores)
-    freq = N.zeros(len(scores))
-    for i in range(len(scores)):
-        freq[i] = N.add.reduce(N.equal(a,scores[i]))
-    return N.array(pstat.aabut(scores, freq))
+    scores, freq = N.unique(a,return_counts=True)
+    return N.array(pstat.aabut(scores, freq.astype(N.float_)))
 
 
-def ascoreatpercentile (inarray, percent):
+def ascoreatpercentile (inarray, percent, method='histogram'):
     """
-    Usage:   ascoreatpercentile(inarray,percent)   0<percent<100
+    The default method interpolates within a 10-bin histogram;
+    method='exact' uses aquantiles() instead.
+
+    Usage:   ascoreatpercentile(inarray,percent,method='histogram')   0<percent<100
     Returns: score at given percentile, relative to inarray distribution
     """
+    if method == 'exact':
+        return aquantiles(inarray,percent)
+    elif method <> 'histogram':
+        raise ValueError, "method must be 'histogram' or 'exact'"
     percent = percent / 100.0
     targetcf = percent*len(inarray)
     h, lrl, binsize, extras = histogram(inarray)
@@ -2603,6 +4211,40 @@ def ascoreatpercentile (inarray, percent):
     return score
 
 
+def aquantiles (inarray, percents, dimension=None):
+    """
+    Returns the EXACT score(s) at the given percentile(s) (0-100), linearly
+    interpolating between order statistics (the k-th smallest of n values
+    sits at percentile 100*k/(n-1)).  All percentiles come from a single
+    N.partition() (introselect) call, without a full sort.  Dimension can
+    equal None (ravel array first) or an integer (the dimension over which
+    to operate).
+
+    Usage:   aquantiles(inarray,percents,dimension=None)
+    Returns: array of scores; percents' shape replaces the dimension axis
+    """
+    inarray = N.asarray(inarray)
+    if dimension == None:
+        inarray = N.ravel(inarray)
+        dimension = 0
+    n = inarray.shape[dimension]
+    if n == 0:
+        raise ValueError, 'aquantiles() needs at least one score'
+    percents = N.asarray(percents,N.float_)
+    if N.sometrue(N.ravel((percents < 0) | (percents > 100))):
+        raise ValueError, 'percents must be between 0 and 100'
+    h = (n-1)*percents/100.0
+    lo = N.floor(h).astype(N.int_)
+    hi = N.minimum(lo+1,n-1)
+    frac = h - lo
+    kth = N.unique(N.concatenate((N.ravel(lo),N.ravel(hi))))
+    part = N.partition(inarray,kth,dimension)
+    lovals = N.take(part,lo,dimension)
+    hivals = N.take(part,hi,dimension)
+    frac = N.reshape(frac,frac.shape+(1,)*(inarray.ndim-dimension-1))
+    return lovals + frac*(hivals-lovals)
+
+
 def apercentileofscore (inarray,score,histbins=10,defaultlimits=None):
     """
     Note: result of this function depends on the values used to histogram
@@ -2618,43 +4260,102 @@ def apercentileofscore (inarray,score,histbins=10,defaultlimits=None):
     return pct
 
 
-def ahistogram (inarray,numbins=10,defaultlimits=None,printextras=1):
+def ahistogram (inarray,numbins=10,defaultlimits=None,printextras=1,weights=None):
     """
     Returns (i) an array of histogram bin counts, (ii) the smallest value
     of the histogram binning, and (iii) the bin width (the last 2 are not
     necessarily integers).  Default number of bins is 10.  Defaultlimits
     can be None (the routine picks bins spanning all the numbers in the
-    inarray) or a 2-sequence (lowerlimit, upperlimit).  Returns all of the
-    following: array of bin values, lowerreallimit, binsize, extrapoints.
+    inarray) or a 2-sequence (lowerlimit, upperlimit).  If weights (an
+    array shaped like inarray) is given, each bin holds the summed weights
+    of its scores.  Returns all of the following: array of bin values,
+    lowerreallimit, binsize, extrapoints.
     
-    Usage:   ahistogram(inarray,numbins=10,defaultlimits=None,printextras=1)
+    Usage:   ahistogram(inarray,numbins=10,defaultlimits=None,printextras=1,weights=None)
     Returns: (array of bin counts, bin-minimum, min-width, #-points-outside-range)
     """
     inarray = N.ravel(inarray)               # flatten any >1D arrays
+    lowerreallimit, binsize = abinlayout([inarray],numbins,defaultlimits)
+    bins, extrapoints = abincount(inarray,lowerreallimit,binsize,numbins,weights)
+    if (extrapoints > 0 and printextras == 1):
+        print '\nPoints outside given histogram range =',extrapoints
+    return (bins, lowerreallimit, binsize, extrapoints)
+
+
+def ahistograms (arrays,numbins=10,defaultlimits=None,printextras=1,weights=None):
+    """
+    Histograms several arrays (a sequence of arrays, or the rows of a 2D
+    array) on ONE shared bin layout, picked to span all of them unless
+    defaultlimits (lowerlimit, upperlimit) is given.  Weights, if given, is
+    a matching sequence of weight arrays.
+    
+    Usage:   ahistograms(arrays,numbins=10,defaultlimits=None,printextras=1,weights=None)
+    Returns: (2D array of bin counts, one row per array, bin-minimum,
+              bin-width, list of #-points-outside-range per array)
+    """
+    arrays = [N.ravel(a) for a in arrays]
+    if weights is None:
+        weights = [None]*len(arrays)
+    elif len(weights) <> len(arrays):
+        raise ValueError, 'need one weights array per array'
+    lowerreallimit, binsize = abinlayout(arrays,numbins,defaultlimits)
+    allbins = N.zeros((len(arrays),numbins))
+    extrapoints = []
+    for i in range(len(arrays)):
+        allbins[i], extra = abincount(arrays[i],lowerreallimit,binsize,numbins,
+                                      weights[i])
+        extrapoints.append(extra)
+    if (N.add.reduce(extrapoints) > 0 and printextras == 1):
+        print '\nPoints outside given histogram range =',extrapoints
+    return (allbins, lowerreallimit, binsize, extrapoints)
+
+
+def abinlayout (arrays,numbins=10,defaultlimits=None):
+    """
+    Returns the lowest real limit and the bin width that ahistogram() uses
+    for numbins bins, either from defaultlimits (lowerlimit, upperlimit) or
+    spanning all values in the passed sequence of 1D arrays.
+    
+    Usage:   abinlayout(arrays,numbins=10,defaultlimits=None)
+    Returns: lowerreallimit, binsize
+    """
     if (defaultlimits <> None):
         lowerreallimit = defaultlimits[0]
         upperreallimit = defaultlimits[1]
         binsize = (upperreallimit-lowerreallimit) / float(numbins)
     else:
-        Min = N.minimum.reduce(inarray)
-        Max = N.maximum.reduce(inarray)
+        Min = min([N.minimum.reduce(a) for a in arrays])
+        Max = max([N.maximum.reduce(a) for a in arrays])
         estbinwidth = float(Max - Min)/float(numbins) + 1e-6
         binsize = (Max-Min+estbinwidth)/float(numbins)
         lowerreallimit = Min - binsize/2.0  #lower real limit,1st bin
-    bins = N.zeros(numbins)
-    extrapoints = 0
-    for num in inarray:
-        try:
-            if (num-lowerreallimit) < 0:
-                extrapoints = extrapoints + 1
-            else:
-                bintoincrement = int((num-lowerreallimit) / float(binsize))
-                bins[bintoincrement] = bins[bintoincrement] + 1
-        except:                           # point outside lower/upper limits
-            extrapoints = extrapoints + 1
-    if (extrapoints > 0 and printextras == 1):
-        print '\nPoints outside given histogram range =',extrapoints
-    return (bins, lowerreallimit, binsize, extrapoints)
+    return lowerreallimit, binsize
+
+
+def abincount (inarray,lowerreallimit,binsize,numbins,weights=None):
+    """
+    Counts (or sums weights of) the scores of a 1D array into numbins bins
+    of width binsize starting at lowerreallimit, with one floor-division
+    and one N.bincount.  Scores outside the bins (and NaNs) are extrapoints.
+    
+    Usage:   abincount(inarray,lowerreallimit,binsize,numbins,weights=None)
+    Returns: array of bin counts (floats), extrapoints
+    """
+    olderr = N.seterr(invalid='ignore')
+    try:
+        idx = (N.asarray(inarray,N.float_)-lowerreallimit) / float(binsize)
+        inside = (idx >= 0) & (idx < numbins)
+    finally:
+        N.seterr(**olderr)
+    idx = idx[inside].astype(N.int_)
+    if weights is None:
+        bins = N.bincount(idx,minlength=numbins).astype(N.float_)
+    else:
+        weights = N.ravel(weights)
+        if len(weights) <> len(inarray):
+            raise ValueError, 'weights must be shaped like inarray'
+        bins = N.bincount(idx,weights[inside],minlength=numbins)
+    return bins[:numbins], len(inarray) - len(idx)
 
 
 def acumfreq(a,numbins=10,defaultreallimits=None):
@@ -2741,7 +4442,7 @@ def asamplevar (inarray,dimension=None,keepdims=0):
         inarray = N.ravel(inarray)
         dimension = 0
     if dimension == 1:
-        mn = amean(inarray,dimension)[:,N.NewAxis]
+        mn = amean(inarray,dimension)[:,N.newaxis]
     else:
         mn = amean(inarray,dimension,keepdims=1)
     deviations = inarray - mn 
@@ -3014,6 +4715,65 @@ def acorrelation(X):
     return C / N.sqrt(N.multiply.outer(V,V))
 
 
+def apearsonrmatrix(X,verbose=1):
+    """
+    Calculates Pearson's r between every pair of columns of the (n x k)
+    matrix X with one matrix product, and the two-tailed p-values (as
+    apearsonr() computes them) with a single abetai() call.
+    
+    Usage:   apearsonrmatrix(X,verbose=1)
+    Returns: (k x k) array of Pearson's r, (k x k) array of p-values
+    """
+    X = N.asarray(X,N.float_)
+    if len(X.shape) <> 2:
+        raise TypeError, "apearsonrmatrix requires 2D matrices"
+    n = X.shape[0]
+    Xc = X - amean(X,0)
+    Z = Xc / N.sqrt(N.add.reduce(Xc*Xc,0))
+    r = N.clip(N.dot(N.transpose(Z),Z),-1.0,1.0)
+    return r, acorrmatrixprob(r,n,verbose)
+
+
+def aspearmanrmatrix(X,verbose=1):
+    """
+    Calculates Spearman's rank-order r between every pair of columns of the
+    (n x k) matrix X, as aspearmanr() does for a single pair.  Each column
+    is ranked once; the sums of squared rank differences all come from
+    one matrix product, and the p-values from a single abetai() call.
+    
+    Usage:   aspearmanrmatrix(X,verbose=1)
+    Returns: (k x k) array of Spearman's r, (k x k) array of p-values
+    """
+    X = N.asarray(X)
+    if len(X.shape) <> 2:
+        raise TypeError, "aspearmanrmatrix requires 2D matrices"
+    n, k = X.shape
+    R = N.zeros((n,k),N.float_)
+    for j in range(k):
+        R[:,j] = arankdata(X[:,j])
+    G = N.dot(N.transpose(R),R)
+    V = N.diagonal(G)
+    dsq = V[:,N.newaxis] + V[N.newaxis,:] - 2*G     # sum((rank_i-rank_j)**2)
+    rs = N.clip(1 - 6*dsq / float(n*(n**2-1)),-1.0,1.0)
+    return rs, acorrmatrixprob(rs,n,verbose)
+
+
+def acorrmatrixprob(r,n,verbose=1):
+    """
+    Returns the two-tailed p-values for an array of correlation
+    coefficients, each computed from n pairs, using Student's t with n-2
+    df and one vectorized abetai() call.
+    
+    Usage:   acorrmatrixprob(r,n,verbose=1)
+    Returns: array of p-values shaped like r
+    """
+    TINY = 1.0e-20
+    r = N.asarray(r,N.float_)
+    df = n-2
+    t = r*N.sqrt(df/((1.0-r+TINY)*(1.0+r+TINY)))
+    return abetai(0.5*df,0.5,df/(df+t*t),verbose)
+
+
 def apaired(x,y):
     """
     Interactively determines the type of data in x and y, and then runs the
@@ -3212,33 +4972,56 @@ def apointbiserialr(x,y):
 
 def akendalltau(x,y):
     """
-    Calculates Kendall's tau ... correlation of ordinal data.  Adapted
-    from function kendl1 in Numerical Recipes.  Needs good test-cases.@@@
+    Calculates Kendall's tau-b ... correlation of ordinal data, with ties
+    in x, in y and in both counted separately.  Uses Knight's O(n log n)
+    algorithm (Knight, W. (1966) JASA 61:436-439); the merge-sort swap
+    count is done a whole level at a time with searchsorted.
     
     Usage:   akendalltau(x,y)
     Returns: Kendall's tau, two-tailed p-value
     """
-    n1 = 0
-    n2 = 0
-    iss = 0
-    for j in range(len(x)-1):
-        for k in range(j,len(y)):
-            a1 = x[j] - x[k]
-            a2 = y[j] - y[k]
-            aa = a1 * a2
-            if (aa):             # neither array has a tie
-                n1 = n1 + 1
-                n2 = n2 + 1
-                if aa > 0:
-                    iss = iss + 1
-                else:
-                    iss = iss -1
-            else:
-                if (a1):
-                    n1 = n1 + 1
-                else:
-                    n2 = n2 + 1
-    tau = iss / math.sqrt(n1*n2)
+    x = N.ravel(x)
+    y = N.ravel(y)
+    n = len(x)
+    if len(y) <> n:
+        raise ValueError, 'Unequal N in akendalltau.  Aborting.'
+    def tiedpairs(sortedvals):
+        # number of tied pairs in a sorted (or grouped) 1D array
+        if len(sortedvals) == 0:
+            return 0
+        starts = N.nonzero(N.concatenate(([1], sortedvals[1:] <> sortedvals[:-1])))[0]
+        t = N.diff(N.concatenate((starts, [len(sortedvals)]))).astype(N.int64)
+        return int(N.add.reduce(t*(t-1)/2))
+    order = N.lexsort((y,x))           # sort by x, then by y
+    xs = x[order]
+    ys = y[order]
+    # dense integer codes, so the (x,y) groups and y ranks are easy to use
+    xcode = N.unique(xs,return_inverse=True)[1].astype(N.int64)
+    ycode = N.unique(ys,return_inverse=True)[1].astype(N.int64)
+    xties = tiedpairs(xcode)
+    jointties = tiedpairs(xcode*n + ycode)
+    # bottom-up merge sort of ycode: at each level, for every element of a
+    # right-hand block count the larger elements of its left-hand partner
+    swaps = 0
+    r = ycode
+    idx = N.arange(n, dtype=N.int64)
+    width = 1
+    while width < n:
+        block = idx // (2*width)
+        isleft = (idx % (2*width)) < width
+        keys = block*n + r
+        leftkeys = keys[isleft]
+        rightkeys = keys[~isleft]
+        rightblock = block[~isleft]
+        notgreater = N.searchsorted(leftkeys, rightkeys, 'right')
+        blockend = N.searchsorted(leftkeys, (rightblock+1)*n, 'left')
+        swaps = swaps + int(N.add.reduce(blockend - notgreater))
+        r = N.sort(keys) - block*n
+        width = width * 2
+    yties = tiedpairs(r)
+    npairs = n*(n-1)/2
+    iss = npairs - xties - yties + jointties - 2*swaps  # concordant-discordant
+    tau = iss / math.sqrt(float(npairs-xties)*(npairs-yties))
     svar = (4.0*len(x)+10.0) / (9.0*len(x)*(len(x)-1))
     z = tau / math.sqrt(svar)
     prob = erfcc(abs(z)/1.4142136)
@@ -3412,32 +5195,15 @@ def attest_ind (a, b, dimension=None, printit=0, name1='Samp1', name2='Samp2',wr
 
 def ap2t(pval,df):
     """
-    Tries to compute a t-value from a p-value (or pval array) and associated df.
-    SLOW for large numbers of elements(!) as it re-computes p-values 20 times
-    (smaller step-sizes) at which point it decides it's done. Keeps the signs
-    of the input array. Returns 1000 (or -1000) if t>100.
+    Computes t-values from two-tailed p-values (or a pval array) and the
+    associated df, keeping the signs of the input array.  See atprobinv().
     
     Usage:  ap2t(pval,df)
     Returns: an array of t-values with the shape of pval
     """
     pval = N.array(pval)
-    signs = N.sign(pval)
-    pval = abs(pval)
-    t = N.ones(pval.shape,N.float_)*50
-    step = N.ones(pval.shape,N.float_)*25
-    print "Initial ap2t() prob calc"
-    prob = abetai(0.5*df,0.5,float(df)/(df+t*t))
-    print 'ap2t() iter: ',
-    for i in range(10):
-        print i,' ',
-        t = N.where(pval<prob,t+step,t-step)
-        prob = abetai(0.5*df,0.5,float(df)/(df+t*t))
-        step = step/2
-    print
-    # since this is an ugly hack, we get ugly boundaries
-    t = N.where(t>99.9,1000,t)      # hit upper-boundary
-    t = t+signs
-    return t #, prob, pval
+    signs = N.where(N.less(pval,0),-1,1)
+    return atprobinv(abs(pval),df)*signs
 
 
 def attest_rel (a,b,dimension=None,printit=0,name1='Samp1',name2='Samp2',writemode='a'):
@@ -3507,67 +5273,148 @@ def achisquare(f_obs,f_exp=None):
     return chisq, achisqprob(chisq, k-1)
 
 
-def aks_2samp (data1,data2):
+def aks_2samp (data1,data2,dimension=None,exact=0):
     """
-    Computes the Kolmogorov-Smirnof statistic on 2 samples.  Modified from
-    Numerical Recipes in C, page 493.  Returns KS D-value, prob.  Not ufunc-
-    like.
+    Computes the Kolmogorov-Smirnof statistic on 2 samples.  The empirical
+    distribution functions are evaluated at every value of the merged,
+    sorted data with searchsorted (the inputs are not modified).  With an
+    integer dimension, tests every pair of lanes along that dimension at
+    once (the other dimensions must match) and returns arrays.  With
+    exact=1 the p-value is the exact (untied) permutation probability,
+    which costs O(n1*n2) per call; otherwise it is the asymptotic
+    Kolmogorov approximation.
     
-    Usage:   aks_2samp(data1,data2)  where data1 and data2 are 1D arrays
+    Usage:   aks_2samp(data1,data2,dimension=None,exact=0)  data1, data2 1D arrays
     Returns: KS D-value, p-value
     """
-    j1 = 0    # N.zeros(data1.shape[1:]) TRIED TO MAKE THIS UFUNC-LIKE
-    j2 = 0    # N.zeros(data2.shape[1:])
-    fn1 = 0.0 # N.zeros(data1.shape[1:],N.float_)
-    fn2 = 0.0 # N.zeros(data2.shape[1:],N.float_)
-    n1 = data1.shape[0]
-    n2 = data2.shape[0]
-    en1 = n1*1
-    en2 = n2*1
-    d = N.zeros(data1.shape[1:],N.float_)
-    data1 = N.sort(data1,0)
-    data2 = N.sort(data2,0)
-    while j1 < n1 and j2 < n2:
-        d1=data1[j1]
-        d2=data2[j2]
-        if d1 <= d2:
-            fn1 = (j1)/float(en1)
-            j1 = j1 + 1
-        if d2 <= d1:
-            fn2 = (j2)/float(en2)
-            j2 = j2 + 1
-        dt = (fn2-fn1)
-        if abs(dt) > abs(d):
-            d = dt
-    #    try:
-    en = math.sqrt(en1*en2/float(en1+en2))
+    if dimension <> None:
+        return abatchks_2samp(data1,data2,dimension,exact)
+    data1 = N.sort(N.ravel(data1))
+    data2 = N.sort(N.ravel(data2))
+    n1 = len(data1)
+    n2 = len(data2)
+    if n1 == 0 or n2 == 0:
+        return 0.0, 1.0
+    merged = N.sort(N.concatenate((data1,data2)))
+    cdf1 = N.searchsorted(data1,merged,'right') / float(n1)
+    cdf2 = N.searchsorted(data2,merged,'right') / float(n2)
+    diff = cdf2 - cdf1
+    d = float(diff[N.argmax(N.fabs(diff))])
+    if exact:
+        return d, float(_aksexact(n1,n2,d))
+    en = math.sqrt(n1*n2/float(n1+n2))
     prob = aksprob((en+0.12+0.11/en)*N.fabs(d))
-    #    except:
-    #        prob = 1.0
     return d, prob
 
 
-def amannwhitneyu(x,y):
+def abatchks_2samp (data1,data2,dimension=0,exact=0):
+    """
+    Batch form of aks_2samp() over every lane along dimension (all other
+    dimensions must match).  Each lane's merged data is sorted once;
+    running counts of the values from each sample then give both
+    empirical distribution functions, read off at the last of each run of
+    tied values (a lane-wise searchsorted).
+    
+    Usage:   abatchks_2samp(data1,data2,dimension=0,exact=0)
+    Returns: array of KS D-values, array of p-values
+    """
+    data1 = N.rollaxis(N.asarray(data1),dimension,0)
+    data2 = N.rollaxis(N.asarray(data2),dimension,0)
+    if data1.shape[1:] <> data2.shape[1:]:
+        raise ValueError, 'abatchks_2samp: shapes do not match off dimension'
+    lanes = data1.shape[1:]
+    n1 = data1.shape[0]
+    n2 = data2.shape[0]
+    merged = N.concatenate((N.reshape(data1,(n1,-1)),N.reshape(data2,(n2,-1))))
+    cols = N.arange(merged.shape[1])
+    order = N.argsort(merged,0,kind='mergesort')
+    merged = merged[order,cols]
+    from1 = order < n1
+    diff = N.cumsum(~from1,0)/float(n2) - N.cumsum(from1,0)/float(n1)
+    last = N.ones(merged.shape,N.bool_)
+    last[:-1] = merged[1:] <> merged[:-1]
+    diff = N.where(last,diff,0.0)
+    d = diff[N.argmax(N.fabs(diff),0),cols]
+    if exact:
+        prob = _aksexact(n1,n2,d)
+    else:
+        en = math.sqrt(n1*n2/float(n1+n2))
+        prob = aksprob((en+0.12+0.11/en)*N.fabs(d))
+    return N.reshape(d,lanes), N.reshape(prob,lanes)
+
+
+def _aksexact (n1,n2,d):
+    """
+    Array form of _lksexact(): exact two-sided p-values for an array of
+    KS statistics d sharing the sample sizes n1 and n2, one anti-diagonal
+    of the merge lattice per step for all statistics at once.
+
+    Usage:   _aksexact(n1,n2,d)
+    Returns: array of p-values shaped like d
+    """
+    d = N.asarray(d,N.float_)
+    h = N.round(N.fabs(N.ravel(d))*n1*n2)
+    lf = agammln(N.arange(1,n1+n2+2,dtype=N.float_))
+    i = N.arange(n1+1)
+    u = N.zeros((n1+1,len(h)),N.float_)
+    u[0] = h > 0
+    prob = N.where(h > 0,0.0,1.0)
+    for k in range(1,n1+n2+1):
+        j = k-i
+        valid = (j >= 0) & (j <= n2)
+        shifted = N.zeros(u.shape,N.float_)
+        shifted[1:] = u[:-1]
+        new = (i[:,N.newaxis]*shifted + N.maximum(j,0)[:,N.newaxis]*u)/float(k)
+        inside = N.fabs(i*n2-j*n1)[:,N.newaxis] < h
+        jj = N.clip(j,0,n2)
+        w = N.where(valid,N.exp(lf[k]-lf[i]-lf[jj] + lf[n1+n2-k] - lf[n1-i]
+                                - lf[n2-jj] - lf[n1+n2] + lf[n1] + lf[n2]),0.0)
+        prob = prob + N.add.reduce(N.where(inside,0.0,new)*w[:,N.newaxis],0)
+        u = N.where(inside & valid[:,N.newaxis],new,0.0)
+    return N.reshape(N.minimum(prob,1.0),d.shape)
+
+
+def amannwhitneyu(x,y,dimension=None):
     """
     Calculates a Mann-Whitney U statistic on the provided scores and
     returns the result.  Use only when the n in each condition is < 20 and
     you have 2 independent samples of ranks.  REMEMBER: Mann-Whitney U is
     significant if the u-obtained is LESS THAN or equal to the critical
-    value of U.
+    value of U.  With an integer dimension, tests every pair of lanes along
+    that dimension at once and returns arrays (nan where all are tied).
     
-    Usage:   amannwhitneyu(x,y)     where x,y are arrays of values for 2 conditions
+    Usage:   amannwhitneyu(x,y,dimension=None)   x,y arrays of values for 2 conditions
     Returns: u-statistic, one-tailed p-value (i.e., p(z(U)))
     """
+    if dimension <> None:
+        x = N.asarray(x)
+        n1 = x.shape[dimension]
+        n2 = N.asarray(y).shape[dimension]
+        ranked, T = abatchrankdata(N.concatenate((x,y),dimension),dimension)
+        rankx = N.take(ranked,N.arange(n1),dimension)
+        u1 = n1*n2 + (n1*(n1+1))/2.0 - N.add.reduce(rankx,dimension)
+        u2 = n1*n2 - u1
+        bigu = N.maximum(u1,u2)
+        smallu = N.minimum(u1,u2)
+        T = N.sqrt(T)
+        olderr = N.seterr(divide='ignore',invalid='ignore')
+        try:
+            sd = N.sqrt(T*n1*n2*(n1+n2+1)/12.0)
+            z = N.where(T > 0, abs((bigu-n1*n2/2.0) / sd), N.nan)
+            prob = 1.0 - azprob(z)
+        finally:
+            N.seterr(**olderr)
+        return smallu, prob
     n1 = len(x)
     n2 = len(y)
-    ranked = rankdata(N.concatenate((x,y)))
+    ranked, ties = arankties(N.concatenate((x,y)))
     rankx = ranked[0:n1]       # get the x-ranks
     ranky = ranked[n1:]        # the rest are y-ranks
     u1 = n1*n2 + (n1*(n1+1))/2.0 - sum(rankx)  # calc U for x
     u2 = n1*n2 - u1                            # remainder is U for y
     bigu = max(u1,u2)
     smallu = min(u1,u2)
-    T = math.sqrt(tiecorrect(ranked))  # correction factor for tied scores
+    T = math.sqrt(atiecorrect(ranked,ties))  # correction factor for tied scores
     if T == 0:
         raise ValueError, 'All numbers are identical in amannwhitneyu'
     sd = math.sqrt(T*n1*n2*(n1+n2+1)/12.0)
@@ -3575,40 +5422,46 @@ def amannwhitneyu(x,y):
     return smallu, 1.0 - azprob(z)
 
 
-def atiecorrect(rankvals):
+def atiecorrect(rankvals,ties=None):
     """
     Tie-corrector for ties in Mann Whitney U and Kruskal Wallis H tests.
     See Siegel, S. (1956) Nonparametric Statistics for the Behavioral
     Sciences.  New York: McGraw-Hill.  Code adapted from |Stat rankind.c
-    code.
+    code.  Pass the tie-group sizes from rankties() as ties to skip
+    sorting rankvals.
     
-    Usage:   atiecorrect(rankvals)
+    Usage:   atiecorrect(rankvals,ties=None)
     Returns: T correction factor for U or H
     """
-    sorted,posn = ashellsort(N.array(rankvals))
-    n = len(sorted)
-    T = 0.0
-    i = 0
-    while (i<n-1):
-        if sorted[i] == sorted[i+1]:
-            nties = 1
-            while (i<n-1) and (sorted[i] == sorted[i+1]):
-                nties = nties +1
-                i = i +1
-            T = T + nties**3 - nties
-        i = i+1
+    rankvals = N.asarray(rankvals)
+    n = len(rankvals)
+    if ties is None:
+        ties = N.unique(rankvals,return_counts=True)[1]
+    ties = N.asarray(ties,N.float_)
+    T = N.add.reduce(ties**3 - ties)
     T = T / float(n**3-n)
     return 1.0 - T
 
 
-def aranksums(x,y):
+def aranksums(x,y,dimension=None):
     """
     Calculates the rank sums statistic on the provided scores and returns
-    the result.
+    the result.  With an integer dimension, tests every pair of lanes
+    along that dimension at once and returns arrays.
     
-    Usage:   aranksums(x,y)     where x,y are arrays of values for 2 conditions
+    Usage:   aranksums(x,y,dimension=None)   x,y arrays of values for 2 conditions
     Returns: z-statistic, two-tailed p-value
     """
+    if dimension <> None:
+        x = N.asarray(x)
+        n1 = x.shape[dimension]
+        n2 = N.asarray(y).shape[dimension]
+        ranked = abatchrankdata(N.concatenate((x,y),dimension),dimension)[0]
+        s = N.add.reduce(N.take(ranked,N.arange(n1),dimension),dimension)
+        expected = n1*(n1+n2+1) / 2.0
+        z = (s - expected) / math.sqrt(n1*n2*(n1+n2+1)/12.0)
+        prob = 2*(1.0 - azprob(abs(z)))
+        return z, prob
     n1 = len(x)
     n2 = len(y)
     alldata = N.concatenate((x,y))
@@ -3622,14 +5475,35 @@ def aranksums(x,y):
     return z, prob
 
 
-def awilcoxont(x,y):
+def awilcoxont(x,y,dimension=None):
     """
     Calculates the Wilcoxon T-test for related samples and returns the
-    result.  A non-parametric T-test.
+    result.  A non-parametric T-test.  With an integer dimension, tests
+    every pair of lanes along that dimension at once and returns arrays
+    (nan where all differences are zero).
     
-    Usage:   awilcoxont(x,y)     where x,y are equal-length arrays for 2 conditions
+    Usage:   awilcoxont(x,y,dimension=None)   x,y equal-shape arrays for 2 conditions
     Returns: t-statistic, two-tailed p-value
     """
+    if dimension <> None:
+        d = N.asarray(x) - N.asarray(y)
+        n = d.shape[dimension]
+        # zero differences rank below all others; drop their ranks
+        zeros = N.add.reduce(N.equal(d,0),dimension,keepdims=True)
+        absranked = abatchrankdata(abs(d),dimension)[0] - zeros
+        r_plus = N.add.reduce(N.where(d > 0,absranked,0),dimension)
+        r_minus = N.add.reduce(N.where(d < 0,absranked,0),dimension)
+        count = n - N.reshape(zeros,r_plus.shape)
+        wt = N.minimum(r_plus,r_minus)
+        mn = count * (count+1) * 0.25
+        se = N.sqrt(count*(count+1)*(2.0*count+1.0)/24.0)
+        olderr = N.seterr(divide='ignore',invalid='ignore')
+        try:
+            z = N.where(count > 0, N.fabs(wt-mn) / se, N.nan)
+            prob = 2*(1.0 - azprob(abs(z)))
+        finally:
+            N.seterr(**olderr)
+        return wt, prob
     if len(x) <> len(y):
         raise ValueError, 'Unequal N in awilcoxont.  Aborting.'
     d = x-y
@@ -3653,25 +5527,48 @@ def awilcoxont(x,y):
     return wt, prob
 
 
-def akruskalwallish(*args):
+def akruskalwallish(*args,**kw):
     """
     The Kruskal-Wallis H-test is a non-parametric ANOVA for 3 or more
     groups, requiring at least 5 subjects in each group.  This function
     calculates the Kruskal-Wallis H and associated p-value for 3 or more
     independent samples.
     
-    Usage:   akruskalwallish(*args)     args are separate arrays for 3+ conditions
+    With the keyword dimension, tests every lane along that dimension at
+    once (the other dimensions must match) and returns arrays (nan where
+    all scores are tied).
+    
+    Usage:   akruskalwallish(*args,**{'dimension':None})   args are arrays for 3+ conditions
     Returns: H-statistic (corrected for ties), associated p-value
     """
-    assert len(args) == 3, "Need at least 3 groups in stats.akruskalwallish()"
+    assert len(args) >= 3, "Need at least 3 groups in stats.akruskalwallish()"
+    dimension = kw.get('dimension')
+    if dimension <> None:
+        n = [N.asarray(a).shape[dimension] for a in args]
+        ranked, T = abatchrankdata(N.concatenate(args,dimension),dimension)
+        ssbn = 0.0
+        start = 0
+        for i in range(len(args)):
+            rsum = N.add.reduce(N.take(ranked,N.arange(start,start+n[i]),dimension),dimension)
+            ssbn = ssbn + rsum**2 / float(n[i])
+            start = start + n[i]
+        totaln = start
+        h = 12.0 / (totaln*(totaln+1)) * ssbn - 3*(totaln+1)
+        olderr = N.seterr(divide='ignore',invalid='ignore')
+        try:
+            h = N.where(T > 0, h / T, N.nan)
+        finally:
+            N.seterr(**olderr)
+        prob = achisqprob(N.where(T > 0, h, 0.0),len(args)-1)
+        return h, N.where(T > 0, prob, N.nan)
     args = list(args)
     n = [0]*len(args)
     n = map(len,args)
     all = []
     for i in range(len(args)):
         all = all + args[i].tolist()
-    ranked = rankdata(all)
-    T = tiecorrect(ranked)
+    ranked, ties = lrankties(all)
+    T = ltiecorrect(ranked,ties)
     for i in range(len(args)):
         args[i] = ranked[0:n[i]]
         del ranked[0:n[i]]
@@ -3725,6 +5622,10 @@ def achisqprob(chisq,df):
     
     Usage:   achisqprob(chisq,df)    chisq=chisquare stat., df=degrees of freedom
     """
+    if probcache is not None:
+        p = probcache.lookup('chisq',df,chisq)
+        if p is not None:
+            return p
     BIG = 200.0
     def ex(x):
         BIG = 200.0
@@ -3801,15 +5702,28 @@ def achisqprob(chisq,df):
 
 def aerfcc(x):
     """
-    Returns the complementary error function erfc(x) with fractional error
-    everywhere less than 1.2e-7.  Adapted from Numerical Recipes.  Can
-    handle multiple dimensions.
+    Returns the complementary error function erfc(x), accurate to nearly
+    double precision, using the Chebyshev expansion of Numerical Recipes
+    (3rd ed.).  exp(-x*x) is split as exp(-h*h)*exp(-(x-h)*(x+h)) with h
+    x rounded to 1/8192, so large x lose no accuracy to rounding of x*x.
+    Can handle multiple dimensions.
     
     Usage:   aerfcc(x)
     """
+    x = N.asarray(x,N.float_)
     z = abs(x)
-    t = 1.0 / (1.0+0.5*z)
-    ans = t * N.exp(-z*z-1.26551223 + t*(1.00002368+t*(0.37409196+t*(0.09678418+t*(-0.18628806+t*(0.27886807+t*(-1.13520398+t*(1.48851587+t*(-0.82215223+t*0.17087277)))))))))
+    t = 2.0 / (2.0+z)
+    ty = 4.0*t - 2.0
+    d = N.zeros(z.shape,N.float_)
+    dd = N.zeros(z.shape,N.float_)
+    for j in range(len(_ERFCCOF)-1,0,-1):
+        d, dd = ty*d - dd + _ERFCCOF[j], d
+    h = N.floor(z*8192.0) / 8192.0
+    olderr = N.seterr(under='ignore')
+    try:
+        ans = t * N.exp(-h*h) * N.exp(-(z-h)*(z+h) + 0.5*(_ERFCCOF[0] + ty*d) - dd)
+    finally:
+        N.seterr(**olderr)
     return N.where(N.greater_equal(x,0), ans, 2.0-ans)
 
 
@@ -3855,43 +5769,38 @@ def azprob(z):
 def aksprob(alam):
     """
    Returns the probability value for a K-S statistic computed via ks_2samp.
-   Adapted from Numerical Recipes.  Can handle multiple dimensions.
+   Adapted from Numerical Recipes.  Can handle multiple dimensions.  The
+   alternating series is summed only over the elements that have not yet
+   converged (1.0 where it fails to converge within 200 terms, nan for
+   nan).
    
    Usage:   aksprob(alam)
    """
-    if type(alam) == N.ndarray:
-        frozen = -1 *N.ones(alam.shape,N.float64)
-        alam = alam.astype(N.float64)
-        arrayflag = 1
-    else:
-        frozen = N.array(-1.)
-        alam = N.array(alam,N.float64)
-        arrayflag = 1
-    mask = N.zeros(alam.shape)
-    fac = 2.0 *N.ones(alam.shape,N.float_)
-    sum = N.zeros(alam.shape,N.float_)
-    termbf = N.zeros(alam.shape,N.float_)
-    a2 = N.array(-2.0*alam*alam,N.float64)
-    totalelements = N.multiply.reduce(N.array(mask.shape))
+    alam = N.asarray(alam,N.float64)
+    a2 = N.ravel(-2.0*alam*alam)
+    result = N.where(N.isnan(a2),N.nan,1.0)
+    idx = N.nonzero(~N.isnan(a2))[0]
+    a2 = a2[idx]
+    sum = N.zeros(a2.shape,N.float_)
+    termbf = N.zeros(a2.shape,N.float_)
+    fac = 2.0
     for j in range(1,201):
-        if asum(mask) == totalelements:
+        if len(idx) == 0:
             break
-        exponents = (a2*j*j)
-        overflowmask = N.less(exponents,-746)
-        frozen = N.where(overflowmask,0,frozen)
-        mask = mask+overflowmask
-        term = fac*N.exp(exponents)
+        term = fac*N.exp(a2*j*j)
         sum = sum + term
-        newmask = N.where(N.less_equal(abs(term),(0.001*termbf)) +
-                          N.less(abs(term),1.0e-8*sum), 1, 0)
-        frozen = N.where(newmask*N.equal(mask,0), sum, frozen)
-        mask = N.clip(mask+newmask,0,1)
+        done = (N.fabs(term) <= 0.001*termbf) | (N.fabs(term) < 1.0e-8*sum)
+        result[idx[done]] = sum[done]
+        keep = ~done
+        idx = idx[keep]
+        a2 = a2[keep]
+        sum = sum[keep]
+        termbf = N.fabs(term[keep])
         fac = -fac
-        termbf = abs(term)
-    if arrayflag:
-        return N.where(N.equal(frozen,-1), 1.0, frozen)  # 1.0 if doesn't converge
-    else:
-        return N.where(N.equal(frozen,-1), 1.0, frozen)[0]  # 1.0 if doesn't converge
+    result = N.reshape(result,alam.shape)
+    if result.ndim == 0:
+        return result[()]
+    return result
 
 
 def afprob (dfnum, dfden, F):
@@ -3902,6 +5811,10 @@ def afprob (dfnum, dfden, F):
     
     Usage:   afprob(dfnum, dfden, F)   where usually dfnum=dfbn, dfden=dfwn
     """
+    if probcache is not None:
+        p = probcache.lookup('f',(dfnum,dfden),F)
+        if p is not None:
+            return p
     if type(F) == N.ndarray:
         return abetai(0.5*dfden, 0.5*dfnum, dfden/(1.0*dfden+dfnum*F))
     else:
@@ -3911,75 +5824,90 @@ def afprob (dfnum, dfden, F):
 def abetacf(a,b,x,verbose=1):
     """
     Evaluates the continued fraction form of the incomplete Beta function,
-    betai.  (Adapted from: Numerical Recipes in C.)  Can handle multiple
-    dimensions for x.
+    betai, by the modified Lentz method.  (Adapted from: Numerical Recipes
+    in C, 2nd ed.)  a, b and x broadcast against each other and can have
+    any number of dimensions.  Each iteration only works on the elements
+    that have not yet converged; NaN inputs give NaN.
     
     Usage:   abetacf(a,b,x,verbose=1)
     """
     ITMAX = 200
-    EPS = 3.0e-7
-
-    arrayflag = 1
-    if type(x) == N.ndarray:
-        frozen = N.ones(x.shape,N.float_) *-1  #start out w/ -1s, should replace all
-    else:
-        arrayflag = 0
-        frozen = N.array([-1])
-        x = N.array([x])
-    mask = N.zeros(x.shape)
-    bm = az = am = 1.0
+    EPS = 3.0e-16
+    FPMIN = 1.0e-300
+
+    a, b, x = N.broadcast_arrays(N.asarray(a,N.float_),N.asarray(b,N.float_),
+                                 N.asarray(x,N.float_))
+    if a.size:
+        # convergence takes O(sqrt(max(a,b))) iterations
+        big = N.nanmax(N.maximum(a,b))
+        if big == big:
+            ITMAX = max(ITMAX,int(10*math.sqrt(min(big,1e12))))
+    shape = x.shape
+    result = N.ravel(N.array(x))                 # NaN stays NaN
+    idx = N.nonzero(~(N.isnan(N.ravel(a))|N.isnan(N.ravel(b))|N.isnan(result)))[0]
+    a = N.ravel(a)[idx]
+    b = N.ravel(b)[idx]
+    x = result[idx]
     qab = a+b
     qap = a+1.0
     qam = a-1.0
-    bz = 1.0-qab*x/qap
-    for i in range(ITMAX+1):
-        if N.sum(N.ravel(N.equal(frozen,-1)))==0:
+    c = N.ones(len(idx),N.float_)
+    d = 1.0-qab*x/qap
+    d[abs(d)<FPMIN] = FPMIN
+    d = 1.0/d
+    h = d.copy()
+    for i in range(1,ITMAX+1):
+        if len(idx) == 0:
             break
-        em = float(i+1)
-        tem = em + em
-        d = em*(b-em)*x/((qam+tem)*(a+tem))
-        ap = az + d*am
-        bp = bz+d*bm
-        d = -(a+em)*(qab+em)*x/((qap+tem)*(a+tem))
-        app = ap+d*az
-        bpp = bp+d*bz
-        aold = az*1
-        am = ap/bpp
-        bm = bp/bpp
-        az = app/bpp
-        bz = 1.0
-        newmask = N.less(abs(az-aold),EPS*abs(az))
-        frozen = N.where(newmask*N.equal(mask,0), az, frozen)
-        mask = N.clip(mask+newmask,0,1)
-    noconverge = asum(N.equal(frozen,-1))
-    if noconverge <> 0 and verbose:
-        print 'a or b too big, or ITMAX too small in Betacf for ',noconverge,' elements'
-    if arrayflag:
-        return frozen
-    else:
-        return frozen[0]
+        m2 = 2.0*i
+        for aa in [i*(b-i)*x/((qam+m2)*(a+m2)),      # even step
+                   -(a+i)*(qab+i)*x/((a+m2)*(qap+m2))]: # odd step
+            d *= aa
+            d += 1.0
+            d[abs(d)<FPMIN] = FPMIN
+            c = aa/c
+            c += 1.0
+            c[abs(c)<FPMIN] = FPMIN
+            N.divide(1.0,d,d)
+            delta = d*c
+            h *= delta
+        done = abs(delta-1.0) < EPS
+        if N.sometrue(done):
+            result[idx[done]] = h[done]
+            keep = ~done
+            idx, a, b, x, qab, qap, qam, c, d, h = [v[keep] for v in
+                                   (idx, a, b, x, qab, qap, qam, c, d, h)]
+    if len(idx):
+        result[idx] = h
+        if verbose:
+            print 'a or b too big, or ITMAX too small in Betacf for ',len(idx),' elements'
+    result = N.reshape(result,shape)
+    if result.ndim == 0:
+        return result[()]
+    return result
 
 
 def agammln(xx):
     """
-    Returns the gamma function of xx.
+    Returns the log of the gamma function of xx (log|gamma| for xx < 0).
     Gamma(z) = Integral(0,infinity) of t^(z-1)exp(-t) dt.
     
-    Adapted from: Numerical Recipes in C.  Can handle multiple dims ... but
-    probably doesn't normally have to.
+    Uses a Lanczos series (g=7, 9 terms), accurate to about 1e-15, with
+    the reflection formula below 0.5.  Can handle multiple dims.
     
     Usage:   agammln(xx)
     """
-    coeff = [76.18009173, -86.50532033, 24.01409822, -1.231739516,
-             0.120858003e-2, -0.536382e-5]
-    x = xx - 1.0
-    tmp = x + 5.5
-    tmp = tmp - (x+0.5)*N.log(tmp)
-    ser = 1.0
-    for j in range(len(coeff)):
-        x = x + 1
-        ser = ser + coeff[j]/x
-    return -tmp + N.log(2.50662827465*ser)
+    xx = N.asarray(xx,N.float_)
+    reflect = N.less(xx,0.5)
+    x = N.where(reflect,1.0-xx,xx) - 1.0
+    ser = _LANCZOS[0]
+    for j in range(1,len(_LANCZOS)):
+        ser = ser + _LANCZOS[j]/(x+j)
+    t = x + 7.5
+    ans = 0.91893853320467274 + (x+0.5)*N.log(t) - t + N.log(ser)
+    if N.sometrue(reflect):
+        ans = N.where(reflect, N.log(N.pi/abs(N.sin(N.pi*xx))) - ans, ans)
+    return ans
 
 
 def abetai(a,b,x,verbose=1):
@@ -3991,34 +5919,267 @@ def abetai(a,b,x,verbose=1):
     where a,b>0 and B(a,b) = G(a)*G(b)/(G(a+b)) where G(a) is the gamma
     function of a.  The continued fraction formulation is implemented
     here, using the betacf function.  (Adapted from: Numerical Recipes in
-    C.)  Can handle multiple dimensions.
+    C.)  a, b and x broadcast and can have multiple dimensions; each
+    element goes through one continued fraction, on whichever side of the
+    symmetry point converges fast.
     
     Usage:   abetai(a,b,x,verbose=1)
     """
     TINY = 1e-15
-    if type(a) == N.ndarray:
-        if asum(N.less(x,0)+N.greater(x,1)) <> 0:
-            raise ValueError, 'Bad x in abetai'
+    a = N.asarray(a,N.float_)
+    b = N.asarray(b,N.float_)
+    x = N.asarray(x,N.float_)
+    if N.sometrue(N.ravel(N.less(x,0)+N.greater(x,1))):
+        raise ValueError, 'Bad x in abetai'
     x = N.where(N.equal(x,0),TINY,x)
     x = N.where(N.equal(x,1.0),1-TINY,x)
 
-    bt = N.where(N.equal(x,0)+N.equal(x,1), 0, -1)
     exponents = ( gammln(a+b)-gammln(a)-gammln(b)+a*N.log(x)+b*
                   N.log(1.0-x) )
     # 746 (below) is the MAX POSSIBLE BEFORE OVERFLOW
     exponents = N.where(N.less(exponents,-740),-740,exponents)
     bt = N.exp(exponents)
-    if type(x) == N.ndarray:
-        ans = N.where(N.less(x,(a+1)/(a+b+2.0)),
-                      bt*abetacf(a,b,x,verbose)/float(a),
-                      1.0-bt*abetacf(b,a,1.0-x,verbose)/float(b))
-    else:
-        if x<(a+1)/(a+b+2.0):
-            ans = bt*abetacf(a,b,x,verbose)/float(a)
-        else:
-            ans = 1.0-bt*abetacf(b,a,1.0-x,verbose)/float(b)
+    swap = N.greater_equal(x,(a+1)/(a+b+2.0))
+    a, b = N.where(swap,b,a), N.where(swap,a,b)
+    ans = bt*abetacf(a,b,N.where(swap,1.0-x,x),verbose)/a
+    ans = N.where(swap,1.0-ans,ans)
+    if ans.ndim == 0:
+        return ans[()]
     return ans
 
+
+def _ainvert(p, x, prob, logpdf, dlogpdf, sign, lo, hi):
+    """
+    Solves prob(x,sel) = p elementwise by Halley iteration, where prob is
+    an increasing (sign=1) or decreasing (sign=-1) distribution function
+    with density exp(logpdf(x,sel)), and sel indexes the elements still
+    being solved.  lo and hi bracket each root and shrink as iterates
+    come in; a step leaving its bracket is replaced by bisection.
+    Elements with non-finite x are left alone, and converged elements drop
+    out of later iterations.
+
+    Usage:   _ainvert(p,x,prob,logpdf,dlogpdf,sign,lo,hi)   1D float arrays
+    Returns: x, holding the roots
+    """
+    ITMAX = 60
+    EPS = 1e-13
+    sel = N.nonzero(N.isfinite(x))[0]
+    laststep = N.zeros(x.shape)+N.inf
+    olderr = N.seterr(all='ignore')
+    try:
+        for i in range(ITMAX):
+            if len(sel) == 0:
+                break
+            xs = x[sel]
+            f = prob(xs,sel) - p[sel]
+            above = sign*f < 0                  # root lies above xs
+            l = N.where(above,xs,lo[sel])
+            h = N.where(above,hi[sel],xs)
+            lo[sel] = l
+            hi[sel] = h
+            u = f / (sign*N.exp(logpdf(xs,sel)))  # Newton step
+            corr = 1.0 - 0.5*u*dlogpdf(xs,sel)   # Halley correction
+            new = xs - N.where(corr > 0.5, u/corr, u)
+            bad = ~((new >= l) & (new <= h))
+            if N.sometrue(bad):
+                mid = N.where(N.isfinite(h), 0.5*(l+h), l + N.maximum(2*abs(l),1.0))
+                geo = (l > 0) & N.isfinite(h) & (h > 4*l)
+                new = N.where(bad, N.where(geo,N.sqrt(l*h),mid), new)
+            x[sel] = new
+            step = abs(new-xs)
+            # stop at convergence, or once rounding in prob() makes the
+            # (already tiny) steps stop shrinking
+            done = ((step <= EPS*abs(new)) | (h-l <= EPS*abs(new)) |
+                    ((step >= 0.25*laststep[sel]) & (step <= 1e-7*abs(new))))
+            laststep[sel] = step
+            sel = sel[~done]
+    finally:
+        N.seterr(**olderr)
+    return x
+
+
+def _ainvargs(p, *params):
+    """
+    Broadcasts p and the distribution parameters against each other,
+    after checking 0 <= p <= 1.
+
+    Usage:   _ainvargs(p,*params)
+    Returns: shape, flat float p, list of flat float parameter arrays
+    """
+    arrays = N.broadcast_arrays(*[N.asarray(a,N.float_) for a in (p,)+params])
+    p = N.ravel(arrays[0])
+    if N.sometrue(N.less(p,0) | N.greater(p,1)):
+        raise ValueError, 'probabilities must be between 0 and 1'
+    return arrays[0].shape, p, [N.ravel(a) for a in arrays[1:]]
+
+
+def _ainvresult(x, shape):
+    "Reshapes x to shape, giving a float for scalar arguments."
+    x = N.reshape(x,shape)
+    if x.ndim == 0:
+        return float(x)
+    return x
+
+
+def _azguess(p):
+    """
+    Acklam's rational approximation to the normal quantile (relative
+    error below 1.2e-9); -inf for p=0 and inf for p=1.
+    """
+    A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    olderr = N.seterr(all='ignore')
+    try:
+        q = p - 0.5
+        r = q*q
+        z = (((((A[0]*r+A[1])*r+A[2])*r+A[3])*r+A[4])*r+A[5])*q / \
+            (((((B[0]*r+B[1])*r+B[2])*r+B[3])*r+B[4])*r+1.0)
+        r = N.sqrt(-2.0*N.log(N.minimum(p,1.0-p)))
+        tail = (((((C[0]*r+C[1])*r+C[2])*r+C[3])*r+C[4])*r+C[5]) / \
+               ((((D[0]*r+D[1])*r+D[2])*r+D[3])*r+1.0)
+        z = N.where(abs(q) <= 0.47575, z, N.where(p < 0.5, tail, -tail))
+    finally:
+        N.seterr(**olderr)
+    z = N.where(N.equal(p,0), -N.inf, z)
+    return N.where(N.equal(p,1), N.inf, z)
+
+
+def azprobinv(p):
+    """
+    Inverse of zprob():  returns z such that the area under the normal
+    curve to the left of z is p.  Starts from Acklam's approximation and
+    polishes it with Halley steps against azprob() wherever azprob() is
+    not flat (|z| < 5.5).  Can handle multiple dimensions.
+
+    Usage:   azprobinv(p)
+    Returns: z-value(s) with the shape of p (-inf for p=0, inf for p=1)
+    """
+    shape, p, params = _ainvargs(p)
+    guess = _azguess(p)
+    polish = N.less(abs(guess),5.5)
+    def prob(z,sel):
+        return azprob(z)
+    def logpdf(z,sel):
+        return -0.5*z*z - 0.91893853320467274     # log(1/sqrt(2pi))
+    def dlogpdf(z,sel):
+        return -z
+    z = _ainvert(p, N.where(polish,guess,N.nan), prob, logpdf, dlogpdf, 1,
+                 N.zeros(p.shape)-6.0, N.zeros(p.shape)+6.0)
+    return _ainvresult(N.where(polish,z,guess),shape)
+
+
+def achisqprobinv(p,df):
+    """
+    Inverse of chisqprob():  returns the chi-square value whose (1-tail)
+    probability with df degrees of freedom is p, i.e., the critical value
+    at level p.  Starts from the Wilson-Hilferty approximation (exact
+    formulas for df=1 and 2, a small-x series where Wilson-Hilferty fails)
+    and refines with Halley steps against achisqprob(), with the erfc()
+    term of odd df taken from aerfcc() so small p keep full accuracy.  p
+    and df can be arrays of any (broadcastable) shapes.
+
+    Usage:   achisqprobinv(p,df)
+    Returns: chi-square value(s) (inf for p=0, 0 for p=1)
+    """
+    shape, p, (df,) = _ainvargs(p,df)
+    olderr = N.seterr(all='ignore')
+    try:
+        z = -_azguess(p)
+        h = 2.0 / (9.0*df)
+        base = 1.0 - h + z*N.sqrt(h)
+        x = df*base**3
+        small = N.exp((2.0/df)*(N.log(1.0-p) + 0.5*df*N.log(2.0) + agammln(0.5*df+1)))
+        x = N.where(base > 0.2, x, small)
+        x = N.where(N.equal(df,2), -2.0*N.log(p), x)
+        x = N.where(N.equal(df,1), _azguess(0.5*p)**2, x)
+        x = N.where((p > 0) & (p < 1) & (df > 0), x, N.nan)
+    finally:
+        N.seterr(**olderr)
+    lognorm = -0.5*df*N.log(2.0) - agammln(0.5*df)
+    def prob(x,sel):
+        out = N.zeros(x.shape,N.float_)
+        dfs = df[sel]
+        for d in pstat.aunique(dfs):
+            mask = N.equal(dfs,d)
+            out[mask] = achisqprob(x[mask],d)
+        # for odd df achisqprob() starts from 2*azprob(-sqrt(x)), which is
+        # flat beyond |z|=6 (chisq=36); swap in the same term from aerfcc()
+        odd = N.not_equal(dfs % 2, 0)
+        if N.sometrue(odd):
+            xo = x[odd]
+            out[odd] = out[odd] - achisqprob(xo,1) + aerfcc(N.sqrt(0.5*xo))
+        return out
+    def logpdf(x,sel):
+        return (0.5*df[sel]-1)*N.log(x) - 0.5*x + lognorm[sel]
+    def dlogpdf(x,sel):
+        return (0.5*df[sel]-1)/x - 0.5
+    x = _ainvert(p, x, prob, logpdf, dlogpdf, -1,
+                 N.zeros(p.shape), N.zeros(p.shape)+N.inf)
+    x = N.where(N.equal(p,0) & (df > 0), N.inf, x)
+    x = N.where(N.equal(p,1) & (df > 0), 0.0, x)
+    return _ainvresult(x,shape)
+
+
+def afprobinv(p,dfnum,dfden):
+    """
+    Inverse of fprob():  returns the F value whose (1-tailed) significance
+    level with dfnum and dfden degrees of freedom is p, i.e., the critical
+    value at level p.  Starts from Paulson's normal approximation and
+    refines with Halley steps against abetai().  p, dfnum and dfden can be
+    arrays of any (broadcastable) shapes.
+
+    Usage:   afprobinv(p,dfnum,dfden)
+    Returns: F value(s) (inf for p=0, 0 for p=1)
+    """
+    shape, p, (d1, d2) = _ainvargs(p,dfnum,dfden)
+    olderr = N.seterr(all='ignore')
+    try:
+        z = -_azguess(p)
+        a = 2.0 / (9.0*d1)
+        b = 2.0 / (9.0*d2)
+        A = (1-b)**2 - z*z*b
+        disc = ((1-a)*(1-b))**2 - A*((1-a)**2 - z*z*a)
+        y = ((1-a)*(1-b) + N.where(z < 0,-1,1)*N.sqrt(disc)) / A
+        x = N.where((A > 0) & (disc >= 0) & (y > 0), y**3, 1.0)
+        x = N.where((p > 0) & (p < 1) & (d1 > 0) & (d2 > 0), x, N.nan)
+    finally:
+        N.seterr(**olderr)
+    lognorm = (agammln(0.5*(d1+d2)) - agammln(0.5*d1) - agammln(0.5*d2) +
+               0.5*d1*N.log(d1/d2))
+    def prob(x,sel):
+        return abetai(0.5*d2[sel], 0.5*d1[sel], d2[sel]/(d2[sel]+d1[sel]*x), 0)
+    def logpdf(x,sel):
+        r = d1[sel]/d2[sel]
+        return (lognorm[sel] + (0.5*d1[sel]-1)*N.log(x) -
+                0.5*(d1[sel]+d2[sel])*N.log1p(r*x))
+    def dlogpdf(x,sel):
+        r = d1[sel]/d2[sel]
+        return (0.5*d1[sel]-1)/x - 0.5*(d1[sel]+d2[sel])*r/(1.0+r*x)
+    x = _ainvert(p, x, prob, logpdf, dlogpdf, -1,
+                 N.zeros(p.shape), N.zeros(p.shape)+N.inf)
+    x = N.where(N.equal(p,0) & (d1 > 0) & (d2 > 0), N.inf, x)
+    x = N.where(N.equal(p,1) & (d1 > 0) & (d2 > 0), 0.0, x)
+    return _ainvresult(x,shape)
+
+
+def atprobinv(p,df):
+    """
+    Returns the t-value (>= 0) whose two-tailed probability with df
+    degrees of freedom is p, as computed by the t-tests, i.e., the critical
+    value at level p.  Uses t**2 = F(1,df), via afprobinv().  p and df can
+    be arrays of any (broadcastable) shapes.
+
+    Usage:   atprobinv(p,df)
+    Returns: t-value(s) (inf for p=0, 0 for p=1)
+    """
+    return N.sqrt(afprobinv(p,1,df))
+
 #####################################
 #######  AANOVA CALCULATIONS  #######
 #####################################
@@ -4092,6 +6253,57 @@ def aF_oneway(*args):
     return f, prob
 
 
+def aF_onewaylabels(values,labels):
+    """
+    Performs a 1-way ANOVA on a flat array of scores and a parallel array
+    of group labels (any sortable values), instead of one array per group
+    as in aF_oneway().  Per-group n and sums come from a single bincount
+    pass, after centring each column on its grand mean to limit
+    cancellation.  With 2D values each column is a separate dependent
+    variable, all binned in the same pass.  Labels that are small
+    non-negative integers are used directly; others are sorted once.
+    
+    Usage:   aF_onewaylabels(values,labels)   values 1D or 2D (rows=observations)
+    Returns: f-value, probability (arrays, one per column, for 2D values)
+    """
+    values = N.asarray(values,N.float_)
+    labels = N.asarray(labels)
+    bign = values.shape[0]
+    if labels.shape <> (bign,):
+        raise ValueError, 'aF_onewaylabels: need one label per row of values'
+    if (labels.dtype.kind in 'iub' and bign > 0 and labels.min() >= 0
+        and labels.max() < 2*bign):
+        group = labels.astype(N.int_)
+    else:
+        group = N.unique(labels,return_inverse=True)[1]
+    ns = N.bincount(group)
+    used = ns > 0
+    na = N.add.reduce(used)
+    x = values - N.add.reduce(values,0)/float(bign)
+    if values.ndim == 1:
+        sums = N.bincount(group,x)[used]
+        ns = ns[used]
+    else:
+        # one bincount over (group, column) cells covers every column
+        m = x.shape[1]
+        cells = N.ravel(group[:,N.newaxis]*m + N.arange(m))
+        sums = N.reshape(N.bincount(cells,N.ravel(x),len(ns)*m),(-1,m))[used]
+        ns = ns[used][:,N.newaxis]
+    mean2 = N.add.reduce(x,0)**2/float(bign)    # ~0 after centring
+    sstot = N.add.reduce(x*x,0) - mean2
+    ssbn = N.add.reduce(sums*sums/ns,0) - mean2
+    sswn = sstot-ssbn
+    dfbn = na-1
+    dfwn = bign - na
+    olderr = N.seterr(divide='ignore',invalid='ignore')
+    try:
+        f = (ssbn/float(dfbn)) / (sswn/float(dfwn))
+    finally:
+        N.seterr(**olderr)
+    prob = afprob(dfbn,dfwn,f)
+    return f, prob
+
+
 def aF_value (ER,EF,dfR,dfF):
     """
     Returns an F-statistic given the following:
@@ -4294,23 +6506,34 @@ def ashellsort(inarray):
     Usage:   ashellsort(inarray)
     Returns: sorted-inarray, sorting-index-vector (for original array)
     """
-    n = len(inarray)
-    svec = inarray *1.0
-    ivec = range(n)
-    gap = n/2   # integer division needed
-    while gap >0:
-        for i in range(gap,n):
-            for j in range(i-gap,-1,-gap):
-                while j>=0 and svec[j]>svec[j+gap]:
-                    temp        = svec[j]
-                    svec[j]     = svec[j+gap]
-                    svec[j+gap] = temp
-                    itemp       = ivec[j]
-                    ivec[j]     = ivec[j+gap]
-                    ivec[j+gap] = itemp
-        gap = gap / 2  # integer division needed
+    # name kept for compatibility; a stable N.argsort does the work
+    ivec = N.argsort(inarray,kind='mergesort')
+    svec = inarray[ivec] *1.0
     # svec is now sorted input vector, ivec has the order svec[i] = vec[ivec[i]]
-    return svec, ivec
+    return svec, ivec.tolist()
+
+
+def arankties(inarray):
+    """
+    Ranks the data in inarray (tied scores get their average rank) and
+    also returns the size of every group of tied scores, so that
+    tiecorrect() need not sort again.  One stable argsort; tie groups are
+    averaged without a python loop.  Assumes a 1D inarray.
+    
+    Usage:   arankties(inarray)
+    Returns: array of rank scores, array of tie-group sizes (groups of 2+)
+    """
+    inarray = N.asarray(inarray)
+    n = len(inarray)
+    ivec = N.argsort(inarray,kind='mergesort')
+    svec = inarray[ivec]
+    newgroup = N.ones(n,N.bool_)
+    newgroup[1:] = svec[1:] <> svec[:-1]
+    starts = N.nonzero(newgroup)[0]
+    sizes = N.diff(N.concatenate((starts,[n])))
+    ranks = N.zeros(n,N.float_)
+    ranks[ivec] = N.repeat(starts + (sizes-1)/2.0 + 1, sizes)
+    return ranks, sizes[sizes > 1]
 
 
 def arankdata(inarray):
@@ -4321,21 +6544,38 @@ def arankdata(inarray):
     Usage:   arankdata(inarray)
     Returns: array of length equal to inarray, containing rank scores
     """
-    n = len(inarray)
-    svec, ivec = ashellsort(inarray)
-    sumranks = 0
-    dupcount = 0
-    newarray = N.zeros(n,N.float_)
-    for i in range(n):
-        sumranks = sumranks + i
-        dupcount = dupcount + 1
-        if i==n-1 or svec[i] <> svec[i+1]:
-            averank = sumranks / float(dupcount) + 1
-            for j in range(i-dupcount+1,i+1):
-                newarray[ivec[j]] = averank
-            sumranks = 0
-            dupcount = 0
-    return newarray
+    return arankties(inarray)[0]
+
+
+def abatchrankdata(inarray,dimension=0):
+    """
+    Ranks every lane of inarray along dimension at once (ties get their
+    average rank), with one argsort and vectorized tie averaging, and
+    returns the tie-correction factor of each lane as tiecorrect() would.
+    
+    Usage:   abatchrankdata(inarray,dimension=0)
+    Returns: array of ranks shaped like inarray, array of tie corrections T
+             (shaped like inarray without dimension)
+    """
+    a = N.rollaxis(N.asarray(inarray),dimension,len(N.shape(inarray)))
+    lanes = a.shape[:-1]
+    n = a.shape[-1]
+    a = N.reshape(a,(-1,n))
+    m = a.shape[0]
+    order = N.argsort(a,1,kind='mergesort')
+    rows = N.arange(m)[:,N.newaxis]
+    svec = a[rows,order]
+    newgroup = N.ones((m,n),N.bool_)
+    newgroup[:,1:] = svec[:,1:] <> svec[:,:-1]
+    starts = N.nonzero(N.ravel(newgroup))[0]        # groups never span lanes
+    sizes = N.diff(N.concatenate((starts,[m*n])))
+    ranks = N.zeros((m,n),N.float_)
+    ranks[rows,order] = N.reshape(N.repeat(starts%n + (sizes-1)/2.0 + 1,sizes),(m,n))
+    sizes = sizes.astype(N.float_)
+    T = 1.0 - N.bincount(starts//n,sizes**3-sizes,minlength=m) / float(n**3-n)
+    ranks = N.reshape(ranks,lanes+(n,))
+    ranks = N.rollaxis(ranks,len(lanes),dimension)
+    return ranks, N.reshape(T,lanes)
 
 
 def afindwithin(data):
@@ -4410,10 +6650,14 @@ try:
                           (aitemfreq, (N.ndarray,)) )
     scoreatpercentile = Dispatch ( (lscoreatpercentile, (ListType, TupleType)),
                                    (ascoreatpercentile, (N.ndarray,)) )
+    quantiles = Dispatch ( (lquantiles, (ListType, TupleType)),
+                           (aquantiles, (N.ndarray,)) )
     percentileofscore = Dispatch ( (lpercentileofscore, (ListType, TupleType)),
                                     (apercentileofscore, (N.ndarray,)) )
     histogram = Dispatch ( (lhistogram, (ListType, TupleType)),
                            (ahistogram, (N.ndarray,)) )
+    histograms = Dispatch ( (ahistograms, (ListType, TupleType)),
+                            (ahistograms, (N.ndarray,)) )
     cumfreq = Dispatch ( (lcumfreq, (ListType, TupleType)),
                          (acumfreq, (N.ndarray,)) )
     relfreq = Dispatch ( (lrelfreq, (ListType, TupleType)),
@@ -4456,6 +6700,10 @@ try:
                           (apearsonr, (N.ndarray,)) )
     spearmanr = Dispatch ( (lspearmanr, (ListType, TupleType)),
                            (aspearmanr, (N.ndarray,)) )
+    pearsonrmatrix = Dispatch ( (apearsonrmatrix, (ListType, TupleType)),
+                                (apearsonrmatrix, (N.ndarray,)) )
+    spearmanrmatrix = Dispatch ( (aspearmanrmatrix, (ListType, TupleType)),
+                                 (aspearmanrmatrix, (N.ndarray,)) )
     pointbiserialr = Dispatch ( (lpointbiserialr, (ListType, TupleType)),
                                 (apointbiserialr, (N.ndarray,)) )
     kendalltau = Dispatch ( (lkendalltau, (ListType, TupleType)),
@@ -4478,6 +6726,8 @@ try:
                               (amannwhitneyu, (N.ndarray,)) )
     tiecorrect = Dispatch ( (ltiecorrect, (ListType, TupleType)),
                             (atiecorrect, (N.ndarray,)) )
+    rankties = Dispatch ( (lrankties, (ListType, TupleType)),
+                          (arankties, (N.ndarray,)) )
     ranksums = Dispatch ( (lranksums, (ListType, TupleType)),
                           (aranksums, (N.ndarray,)) )
     wilcoxont = Dispatch ( (lwilcoxont, (ListType, TupleType)),
@@ -4504,10 +6754,25 @@ try:
                        (aerfcc, (N.ndarray,)) )
     gammln = Dispatch ( (lgammln, (IntType, FloatType)),
                         (agammln, (N.ndarray,)) )
-    
+    zprobinv = Dispatch ( (azprobinv, (IntType, FloatType, ListType, TupleType,
+                                       N.ndarray)), )
+    tprobinv = Dispatch ( (atprobinv, (IntType, FloatType, ListType, TupleType,
+                                       N.ndarray)), )
+    chisqprobinv = Dispatch ( (achisqprobinv, (IntType, FloatType, ListType,
+                                               TupleType, N.ndarray)), )
+    fprobinv = Dispatch ( (afprobinv, (IntType, FloatType, ListType, TupleType,
+                                       N.ndarray)), )
+    # numpy scalars (float32, int16, ...) go wherever a python number goes
+    for disp in [chisqprob, zprob, ksprob, fprob, betacf, betai, erfcc, gammln,
+                 zprobinv, tprobinv, chisqprobinv, fprobinv]:
+        disp.register(disp.resolve(FloatType), (N.floating, N.integer))
+    del disp
+
     ## ANOVA FUNCTIONS:
     F_oneway = Dispatch ( (lF_oneway, (ListType, TupleType)),
                           (aF_oneway, (N.ndarray,)) )
+    F_onewaylabels = Dispatch ( (aF_onewaylabels, (ListType, TupleType)),
+                                (aF_onewaylabels, (N.ndarray,)) )
     F_value = Dispatch ( (lF_value, (ListType, TupleType)),
                          (aF_value, (N.ndarray,)) )
    
@@ -4531,6 +6796,30 @@ try:
                           (arankdata, (N.ndarray,)) )
     findwithin = Dispatch ( (lfindwithin, (ListType, TupleType)),
                             (afindwithin, (N.ndarray,)) )
+
+    ## LIST-TO-ARRAY PROMOTION (see promotelength):
+    # only single-sample functions whose array version gives the same answer
+    def tofloatarray(inlist):
+        return N.ascontiguousarray(inlist, N.float_)
+
+    def fromfloatarray(result):
+        # arrays become lists and numpy scalars python numbers, as the
+        # list versions return them
+        if isinstance(result, N.ndarray):
+            return result.tolist()
+        elif isinstance(result, N.generic):
+            return result.item()
+        elif type(result) == TupleType:
+            return tuple(map(fromfloatarray, result))
+        return result
+
+    for disp in [geometricmean, harmonicmean, mean, median, medianscore,
+                 moment, variation, skew, kurtosis, describe,
+                 itemfreq, quantiles, percentileofscore, histogram, cumfreq, relfreq,
+                 samplevar, samplestdev, var, stdev, sterr, sem, z, zs,
+                 sum, cumsum, ss, square_of_sums, rankdata, rankties, tiecorrect]:
+        disp.setpromotion(tofloatarray, fromfloatarray)
+    del disp
    
 ######################  END OF NUMERIC FUNCTION BLOCK  #####################
 
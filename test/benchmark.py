@@ -0,0 +1,199 @@
+"""
+Rough timings for the performance-sensitive code paths in statlib.
+Requires numpy.  Run all sections, or name the ones you want:
+
+    python benchmark.py
+    python benchmark.py promotion kendalltau
+"""
+
+import sys, time, random
+
+# attempt to use the most current library
+sys.path.insert(0, '..')
+from statlib import stats
+import numpy as N
+
+
+def besttime(fcn, *args, **kw):
+    "Returns the best of 3 runs of fcn(*args,**kw), in seconds"
+    best = None
+    for i in range(3):
+        start = time.time()
+        fcn(*args, **kw)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def randomlist(n, seed=1):
+    rnd = random.Random(seed)
+    return [rnd.gauss(0, 1) for i in range(n)]
+
+
+def bench_promotion():
+    """
+    List-to-array promotion in Dispatch: list path, cost of converting the
+    list, and array path after conversion.  Promotion pays off once
+    convert + array < list; set stats.promotelength near that length.
+    """
+    print '%-10s %8s %10s %10s %10s' % ('function', 'n', 'list', 'convert', 'array')
+    for name in ['var', 'histogram', 'rankdata']:
+        disp = getattr(stats, name)
+        for n in [10, 100, 1000, 5000]:
+            data = randomlist(n)
+            ltime = besttime(disp, data, promote=0)
+            ctime = besttime(N.ascontiguousarray, data, N.float_)
+            atime = besttime(disp, N.ascontiguousarray(data, N.float_))
+            print '%-10s %8d %10.6f %10.6f %10.6f' % (name, n, ltime, ctime, atime)
+
+
+def bench_kendalltau():
+    """
+    Scaling of Knight's O(n log n) kendalltau with the number of pairs of
+    observations, for lists and arrays (the old pairwise loop was O(n**2)).
+    """
+    print '%8s %10s %10s' % ('n', 'list', 'array')
+    for n in [1000, 10000, 100000, 1000000]:
+        x = randomlist(n, 1)
+        y = [a + b for a, b in zip(x, randomlist(n, 2))]
+        if n <= 100000:
+            ltime = '%10.4f' % besttime(stats.kendalltau, x, y)
+        else:
+            ltime = '%10s' % '-'
+        atime = besttime(stats.kendalltau, N.array(x), N.array(y))
+        print '%8d %s %10.4f' % (n, ltime, atime)
+
+
+def bench_probcache():
+    """
+    chisqprob/fprob with and without a ProbCache installed, for repeated
+    calls with the same degrees of freedom (the first cached call, which
+    builds the table, is not counted).
+    """
+    rnd = random.Random(1)
+    xs = [rnd.uniform(0, 60) for i in range(5000)]
+    xa = N.array([rnd.uniform(0, 60) for i in range(100000)])
+    cases = [('chisqprob df=10', lambda: [stats.chisqprob(x, 10) for x in xs]),
+             ('chisqprob df=100', lambda: [stats.chisqprob(x, 100) for x in xs]),
+             ('fprob 3,40', lambda: [stats.fprob(3, 40, x / 10.0) for x in xs]),
+             ('achisqprob df=40', lambda: stats.achisqprob(xa, 40)),
+             ('afprob 3,40', lambda: stats.afprob(3, 40, xa / 10.0))]
+    print '%-18s %10s %10s' % ('call', 'exact', 'cached')
+    for name, fcn in cases:
+        stats.probcache = None
+        etime = besttime(fcn)
+        stats.probcache = stats.ProbCache()
+        fcn()
+        ctime = besttime(fcn)
+        stats.probcache = None
+        print '%-18s %10.4f %10.4f' % (name, etime, ctime)
+
+
+def bench_ks_2samp():
+    """
+    Two-sample KS test: list merge walk, array searchsorted, and one
+    batched call over 1000 pairs of samples of 100 (per-pair time shown).
+    """
+    print '%8s %10s %10s' % ('n', 'list', 'array')
+    for n in [1000, 10000, 100000]:
+        x = randomlist(n, 1)
+        y = randomlist(n, 2)
+        ltime = besttime(stats.ks_2samp, x, y)
+        atime = besttime(stats.ks_2samp, N.array(x), N.array(y))
+        print '%8d %10.4f %10.4f' % (n, ltime, atime)
+    X = N.reshape(N.array(randomlist(100000, 1)), (100, 1000))
+    Y = N.reshape(N.array(randomlist(100000, 2)), (100, 1000))
+    ptime = besttime(lambda: [stats.ks_2samp(X[:, j], Y[:, j]) for j in range(1000)])
+    btime = besttime(stats.ks_2samp, X, Y, dimension=0)
+    print 'per pair of 100: loop %.6f, batched %.6f' % (ptime / 1000, btime / 1000)
+
+
+def bench_F_onewaylabels():
+    """
+    One-way ANOVA of 10**6 scores: F_oneway with one array per group
+    against F_onewaylabels on flat scores plus labels (1 and 10 columns).
+    """
+    r = N.random.RandomState(1)
+    n = 1000000
+    v = r.randn(n)
+    X = r.randn(n, 10)
+    print '%8s %10s %10s %10s' % ('groups', 'F_oneway', 'labels', '10 cols')
+    for k in [10, 1000, 100000]:
+        g = r.randint(0, k, n)
+        if k <= 1000:
+            order = N.argsort(g, kind='mergesort')
+            groups = N.split(v[order], N.cumsum(N.bincount(g))[:-1])
+            otime = '%10.4f' % besttime(stats.F_oneway, *groups)
+        else:
+            otime = '%10s' % '-'
+        ltime = besttime(stats.F_onewaylabels, v, g)
+        xtime = besttime(stats.F_onewaylabels, X, g)
+        print '%8d %s %10.4f %10.4f' % (k, otime, ltime, xtime)
+
+
+def bench_anova():
+    """
+    aanova on synthetic mixed designs (subjects nested in all between-
+    subject cells, crossed with the within-subject factors): run time, and
+    the memory of the dense subjects x all-levels array aanova used to fill
+    against that of its coded design (anova.AnovaResult.designbytes).
+    """
+    from statlib import anova
+    print '%8s %-13s %-8s %8s %12s %12s' % ('subjects', 'between', 'within',
+                                           'seconds', 'dense bytes', 'coded bytes')
+    for nsubj, blevels, wlevels in [(200, [4, 5, 3], [3, 4]),
+                                    (1000, [4, 5, 3], [3, 4]),
+                                    (1680, [4, 5, 6, 7], [3])]:
+        r = N.random.RandomState(1)
+        ncells = N.multiply.reduce(blevels)
+        data = []
+        for s in range(nsubj):
+            btw = [int(i) for i in N.unravel_index(s % ncells, blevels)]
+            for w in N.ndindex(*wlevels):
+                data.append([s] + btw + list(w) + [round(r.randn(), 3)])
+        start = time.time()
+        result = anova.aanova(data, printit=0)
+        elapsed = time.time() - start
+        dense = 4 * nsubj * N.multiply.reduce(blevels + wlevels)
+        print '%8d %-13s %-8s %8.2f %12d %12d' % (nsubj, blevels, wlevels, elapsed,
+                                                dense, result.designbytes)
+
+
+def bench_anova_ss():
+    """
+    The anova SS kernels on many-level designs: subtr_cellmeans (grouped
+    between-subject cell means) and multivar_SScalc (SSCP Gram matrix),
+    for D-variables from 12 to 96 within-subject levels.
+    """
+    from statlib import anova
+    r = N.random.RandomState(1)
+    print '%8s %8s %8s %12s %12s' % ('levels', 'cells', 'subjects',
+                                     'cellmeans', 'SSCP')
+    for wlevels, ncells, nsubj in [(12, 4, 400), (48, 64, 1280), (96, 512, 2048)]:
+        subjcells = N.arange(nsubj) % ncells
+        workd = r.randn(nsubj, wlevels - 1)
+        ctx = anova.AnovaContext()
+        ctx.bcellshape = (ncells,)
+        errors = anova.subtr_cellmeans(ctx, workd, subjcells)
+        mtime = besttime(anova.subtr_cellmeans, ctx, workd, subjcells)
+        stime = besttime(anova.multivar_SScalc, errors)
+        print '%8d %8d %8d %12.4f %12.4f' % (wlevels, ncells, nsubj, mtime, stime)
+
+
+SECTIONS = [('promotion', bench_promotion),
+            ('kendalltau', bench_kendalltau),
+            ('probcache', bench_probcache),
+            ('ks_2samp', bench_ks_2samp),
+            ('F_onewaylabels', bench_F_onewaylabels),
+            ('anova', bench_anova),
+            ('anova_ss', bench_anova_ss)]
+
+
+if __name__ == '__main__':
+    wanted = sys.argv[1:]
+    for name, fcn in SECTIONS:
+        if wanted and name not in wanted:
+            continue
+        print '\n==', name, '=='
+        fcn()
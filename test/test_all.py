@@ -1,13 +1,15 @@
-import sys, unittest
+import sys, math, unittest, StringIO
 
 # attempt to use the most current library
 sys.path.insert(0, '..')
 from statlib import stats, pstat
 
 try:
+    import numpy
     from numpy import array as num_array
 except ImportError:
     # numpy not installed
+    numpy = None
     sys.stderr.write('Numpy not installed ... skipping numpy tests\n')
     # falls back to lists
     def num_array( values ):
@@ -85,6 +87,17 @@ class TestStatlib(unittest.TestCase):
         data = [ L1, L2, A1, A2  ]
         for d in data :
             self.assertEqual( stats.mode( d ), (3, [1]) )
+        # ties: lists return all modes in sorted order, arrays the first seen
+        self.assertEqual( stats.mode( [4, 2, 2, 4, 3] ), (2, [2, 4]) )
+        self.assertEqual( stats.lcounts( [4, 2, 2, 4, 3] ), ([2, 3, 4], [2, 1, 2]) )
+        self.assertEqual( pstat.unique( [4, 2, 2, 4, 3] ), [4, 2, 3] )
+        self.assertEqual( pstat.unique( [[1, 2], [3], [1, 2]] ), [[1, 2], [3]] )
+        if numpy is not None:
+            self.assertEqual( list( stats.mode( num_array( [4, 2, 2, 4, 3] ) )[1] ), [4] )
+            counts, modes = stats.mode( num_array( [[1, 2, 2], [3, 3, 2]] ), 1 )
+            self.assertEqual( counts.tolist(), [[2], [2]] )
+            self.assertEqual( modes.tolist(), [[2], [3]] )
+            self.assertEqual( list( pstat.aunique( num_array( [4, 2, 2, 4, 3] ) ) ), [4, 2, 3] )
 
     # Moments
     
@@ -174,6 +187,22 @@ class TestStatlib(unittest.TestCase):
             self.assertEqual( stats.histogram( d )[i], results1[i] ) 
             i += 1
         # hmm...
+        # out-of-range scores and weights
+        self.assertEqual( stats.histogram( self.L, 4, [0, 20] ), ([4, 5, 5, 5], 0, 5.0, 1) )
+        w = [0.5]*20
+        self.assertEqual( stats.histogram( self.L, 4, [0, 20], 0, w )[0], [2.0, 2.5, 2.5, 2.5] )
+        self.assertRaises( ValueError, stats.histogram, self.L, 4, None, 0, w[:3] )
+        if numpy is not None:
+            h = stats.histogram( self.A, 4, [0, 20], 0 )
+            self.assertEqual( (list( h[0] ), h[3]), ([4, 5, 5, 5], 1) )
+            h = stats.histogram( num_array( self.L + [numpy.nan] ), 4, [0, 20], 0, num_array( w + [1] ) )
+            self.assertEqual( (list( h[0] ), h[3]), ([2.0, 2.5, 2.5, 2.5], 2) )
+            # several arrays on one bin layout
+            hs, low, width, extra = stats.histograms( [self.A, self.A[:10]], 10, None, 0 )
+            self.assertEqual( hs.shape, (2, 10) )
+            self.assertEqual( list( hs[0] ), list( stats.histogram( self.A )[0] ) )
+            self.assertEqual( list( hs[1] ), [2, 2, 2, 2, 2, 0, 0, 0, 0, 0] )
+            self.assertEqual( (low, width, extra), stats.histogram( self.A )[1:3] + ([0, 0],) )
     def test_cumfreq(self):
         "Testing cumfreq"
         data = [ self.L, self.LF, self.A, self.AF ]
@@ -296,7 +325,10 @@ class TestStatlib(unittest.TestCase):
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (0.80208084775070976, 2.1040104471429959e-005)
+        # p-values here and below come from the Lentz betacf and a double
+        # precision gammln (the old 3e-7 betacf tolerance and 6-term gammln
+        # were only good to ~1e-8 and ~1e-10)
+        results = (0.80208084775070976, 2.104010447477626e-05)
         
         i = 0
         for d in data1:
@@ -308,19 +340,42 @@ class TestStatlib(unittest.TestCase):
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (0.93233082706766912, 2.2066972068439387e-009)
+        results = (0.93233082706766912, 2.2066972068586456e-09)
         
         i = 0
         for d in data1:
            self.assertEqual( stats.spearmanr( d, data2[i] )[i], results[i] )
            i += 1
-    
+
+    def test_correlation_matrices(self):
+        "Testing pearsonrmatrix and spearmanrmatrix"
+        if numpy is None:
+            return
+        X = numpy.transpose( num_array( [self.L, self.M, self.L[::-1], [1, 2] * 10], float ) )
+        r, p = stats.pearsonrmatrix( X, 0 )
+        rs, ps = stats.spearmanrmatrix( X, 0 )
+        self.assertEqual( r.shape, (4, 4) )
+        self.assertEqual( ps.shape, (4, 4) )
+        for i in range( 4 ):
+            self.EQ( r[i, i], 1.0 )
+            self.EQ( rs[i, i], 1.0 )
+            for j in range( 4 ):
+                if i <> j:
+                    pr, pp = stats.apearsonr( X[:, i], X[:, j], 0 )
+                    sr, sp = stats.aspearmanr( X[:, i], X[:, j] )
+                    self.EQ( r[i, j], pr )
+                    self.EQ( p[i, j], pp )
+                    self.EQ( rs[i, j], sr )
+                    self.EQ( ps[i, j], sp )
+        self.EQ( rs[0, 1], 0.93233082706766912 )
+        self.assertRaises( TypeError, stats.pearsonrmatrix, self.L )
+
     def test_pointbiserialr(self):
         "Testing pointbiserialr"
         
         data1 = [ self.PB, self.APB ]
         data2 = [ self.L, self.A ]
-        results = (0.8627635262664034, 9.8591235557031489e-007)
+        results = (0.8627635262664034, 9.859123555667133e-07)
         
         i = 0
         for d in data1:
@@ -332,19 +387,29 @@ class TestStatlib(unittest.TestCase):
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (0.86313455447495724, 1.0335817091423592e-007)
+        # 9 of the 190 pairs are discordant: tau = 172/190 (the old pairwise
+        # loop also counted each score against itself and gave 0.863 here)
+        results = (0.9052631578947369, 2.3994299176083438e-08)
         
         i = 0
         for d in data1:
            self.assertEqual( stats.kendalltau( d, data2[i] )[i], results[i] )
            i += 1
+        # tau-b: 2 ties in x, 2 in y, 1 in both; 11 concordant, 1 discordant
+        x, y = [1, 2, 2, 3, 4, 4], [1, 3, 2, 2, 5, 5]
+        self.EQ( stats.kendalltau( x, y )[0], 10/13.0 )
+        self.EQ( stats.kendalltau( y, x )[0], 10/13.0 )
+        self.EQ( stats.kendalltau( x, [-v for v in y] )[0], -10/13.0 )
+        if numpy is not None:
+            self.EQ( stats.kendalltau( num_array( x ), num_array( y ) )[0], 10/13.0 )
+            self.EQ( stats.kendalltau( num_array( x ), -num_array( y ) )[0], -10/13.0 )
            
     def test_linregress(self):
         "Testing linregress"
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (1.0150375939849625, 3.8421052631578938, 0.80208084775070976, 2.1040104471429959e-005, 4.3580363930338537)
+        results = (1.0150375939849625, 3.8421052631578938, 0.80208084775070976, 2.104010447477626e-05, 4.3580363930338537)
     
         i = 0
         for d in data1: # so check the first two of results...
@@ -357,13 +422,13 @@ class TestStatlib(unittest.TestCase):
         "Testing ttest_1samp"
         
         data = [ self.L, self.A ]
-        results = (-1.1338934190276817, 0.27094394816451473)
+        results = (-1.1338934190276817, 0.27094394817260903)
         
         i = 0
         for d in data:
             self.assertEqual( stats.ttest_1samp( d, 12 )[i], results[i] )
             i += 1
-    results = (-1.1338934190276817, 0.27094394816451473)
+    results = (-1.1338934190276817, 0.27094394817260903)
     
     
     def test_ttest_ind(self):
@@ -371,7 +436,7 @@ class TestStatlib(unittest.TestCase):
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (-1.8746868717340566, 0.068537696711420654)
+        results = (-1.8746868717340566, 0.06853769883644822)
         
         i = 0
         for d in data1:
@@ -383,7 +448,7 @@ class TestStatlib(unittest.TestCase):
         
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (-4.0, 0.00076619233678407726)
+        results = (-4.0, 0.0007661923372286411)
         
         i = 0
         for d in data1:
@@ -413,6 +478,25 @@ class TestStatlib(unittest.TestCase):
         for d in data1:
             self.assertEqual( stats.ks_2samp( d, data2[i] )[i], results[i] )
             i += 1
+        # D is the largest gap between the two empirical distributions (the
+        # old merge walk took each step's fraction before counting the value,
+        # and gave -0.5 for fully separated samples)
+        self.assertEqual( stats.ks_2samp( [1, 2], [3, 4] )[0], -1.0 )
+        self.assertEqual( stats.ks_2samp( [1, 2, 6], [3, 4, 5, 7] )[0], -2 / 3.0 )
+        # the inputs are not sorted in place
+        x = self.L[::-1]
+        stats.ks_2samp( x, self.M )
+        self.assertEqual( x, self.L[::-1] )
+        # exact p-values: 14 of the 35 merge orders of 3 and 4 values have
+        # |D| >= 2/3, and only the 2 fully separated orders reach D = 1
+        self.EQ( stats.ks_2samp( [1, 2, 6], [3, 4, 5, 7], exact=1 )[1], 14 / 35.0 )
+        self.EQ( stats.ks_2samp( range(20), range(20, 40), exact=1 )[1],
+                 2 / 137846528820.0 )
+        if numpy is None:
+            return
+        self.EQ( stats.ks_2samp( num_array( [1, 2, 6] ), num_array( [3, 4, 5, 7] ),
+                                 exact=1 )[1], 14 / 35.0 )
+        self.EQ( stats.ksprob( num_array( [1.0, 4.0] ) )[0], stats.ksprob( 1.0 ) )
     
     def test_mannwhitneyu(self):
         "Testing mannwhitneyu"
@@ -461,7 +545,38 @@ class TestStatlib(unittest.TestCase):
         for d in data1:
             self.EQ( stats.kruskalwallish( d, data2[i], data3[i] )[i], results[i] )
             i += 1
-            
+
+    def test_batch_rank_tests(self):
+        "Testing the dimension (batch) mode of the rank and KS tests"
+        if numpy is None:
+            return
+        X = numpy.transpose( num_array( [self.L, self.M, [1, 2] * 10], float ) )
+        Y = numpy.transpose( num_array( [self.M, self.L[::-1], [2, 1, 3, 3] * 5], float ) )
+        Z = numpy.transpose( num_array( [self.M[::-1], self.L, [5] * 20], float ) )
+        for name, args in [ ('amannwhitneyu', (X, Y)), ('aranksums', (X, Y)),
+                            ('aks_2samp', (X, Y)), ('awilcoxont', (X, Y)),
+                            ('akruskalwallish', (X, Y, Z)) ]:
+            fcn = getattr( stats, name )
+            stat, prob = fcn( *args, **{'dimension': 0} )
+            tstat, tprob = fcn( *[ numpy.transpose( a ) for a in args ],
+                                **{'dimension': 1} )
+            self.assertEqual( stat.shape, (3,) )
+            for j in range( 3 ):
+                s, p = fcn( *[ a[:, j] for a in args ] )
+                self.EQ( stat[j], s )
+                self.EQ( prob[j], p )
+                self.EQ( tstat[j], s )
+                self.EQ( tprob[j], p )
+        d, p = stats.aks_2samp( X, Y, dimension=0, exact=1 )
+        for j in range( 3 ):
+            s, ep = stats.ks_2samp( list( X[:, j] ), list( Y[:, j] ), exact=1 )
+            self.EQ( d[j], s )
+            self.EQ( p[j], ep )
+        # lanes where every score is tied give nan instead of raising
+        stat, prob = stats.amannwhitneyu( Z, Z, dimension=0 )
+        self.assertTrue( numpy.isnan( prob[2] ) )
+        self.assertFalse( numpy.isnan( prob[0] ) )
+
     def test_friedmanchisquare(self):
         "Testing friedmanchisquare"
         
@@ -475,17 +590,245 @@ class TestStatlib(unittest.TestCase):
             self.EQ( stats.friedmanchisquare( d, data2[i], data3[i] )[i], results[i] )
             i += 1
             
+    def test_betai(self):
+        "Testing betai"
+        # I_x(a,b) for integer a, b is a binomial tail sum
+        self.EQ( stats.betai( 3, 4, 0.4 ), 0.45568, 12 )
+        self.EQ( stats.betai( 4, 3, 0.6 ), 1 - 0.45568, 12 )
+        # huge a and b (F tests with 10**5 groups) need more than 200 iterations;
+        # the gammln prefactor (~1e7) limits the result to ~1e-9
+        self.EQ( stats.betai( 5e5, 5e5, 0.5 ), 0.5, 8 )
+        if numpy is None:
+            return
+        x = num_array( [[0.4, 0.6, 0.0], [1.0, 0.9999, numpy.nan]] )
+        p = stats.abetai( num_array( [[3.], [4.]] ), 4, x )
+        self.assertEqual( p.shape, (2, 3) )
+        self.EQ( p[0, 0], 0.45568, 12 )
+        self.EQ( p[0, 1], 0.8208, 12 )
+        self.EQ( p[0, 2], 0.0 )
+        self.EQ( p[1, 0], 1.0 )
+        self.assertTrue( numpy.isnan( p[1, 2] ) )
+        self.EQ( stats.abetai( 3, 4, 0.4 ), stats.lbetai( 3, 4, 0.4 ), 14 )
+        self.assertRaises( ValueError, stats.abetai, 3, 4, num_array( [0.5, 1.5] ) )
+        self.EQ( stats.abetai( 5e5, 5e5, num_array( [0.5] ) )[0], 0.5, 8 )
+        self.EQ( stats.afprob( 99999, 2900000, num_array( [1.01] ) )[0],
+                 stats.fprob( 99999, 2900000, 1.01 ), 12 )
+
+    def test_gammln_erfcc(self):
+        "Testing gammln and erfcc"
+        logsqrtpi = 0.57236494292470008        # gammln(0.5) = log(sqrt(pi))
+        self.EQ( stats.gammln( 0.5 ), logsqrtpi, 14 )
+        self.EQ( stats.gammln( 101 ), 363.73937555556347, 11 )   # log(100!)
+        self.EQ( stats.erfcc( 1.0 ), 0.15729920705028513, 14 )
+        self.EQ( stats.erfcc( -1.0 ), 2 - 0.15729920705028513, 14 )
+        self.EQ( stats.erfcc( 5.0 ) / 1.5374597944280349e-12, 1.0, 12 )
+        if numpy is None:
+            return
+        g = stats.gammln( num_array( [0.5, 101.0, 1.0, 2.0] ) )
+        self.EQ( g[0], logsqrtpi, 14 )
+        self.EQ( g[1], 363.73937555556347, 11 )
+        self.EQ( g[2], 0.0, 14 )
+        self.EQ( g[3], 0.0, 14 )
+        e = stats.erfcc( num_array( [1.0, -1.0, 5.0, 26.0] ) )
+        self.EQ( e[0], 0.15729920705028513, 14 )
+        self.EQ( e[1], 2 - 0.15729920705028513, 14 )
+        self.EQ( e[2] / 1.5374597944280349e-12, 1.0, 14 )
+        self.EQ( e[3] / 5.663192408856143e-296, 1.0, 13 )
+
+    def chisqtail(self, x, df):
+        "Upper chi-square tail for integer df from math.erfc and exp, independent of stats"
+        if df % 2:
+            s, term, k = math.erfc( math.sqrt( x / 2.0 ) ), math.sqrt( 2 * x / math.pi ) * math.exp( -x / 2.0 ), 3
+        else:
+            s, term, k = 0.0, math.exp( -x / 2.0 ), 2
+        while k <= df:
+            s = s + term
+            term = term * x / k
+            k = k + 2
+        return s
+
+    def test_probinv(self):
+        "Testing zprobinv, tprobinv, chisqprobinv and fprobinv"
+        if numpy is None:
+            return
+        self.EQ( stats.zprobinv( 0.975 ), 1.959964, 6 )
+        self.EQ( stats.tprobinv( 0.05, 10 ), 2.228139, 6 )
+        self.EQ( stats.chisqprobinv( 0.05, 3 ), 7.814728, 6 )
+        self.EQ( stats.fprobinv( 0.05, 3, 10 ), 3.708265, 6 )
+        p = num_array( [1e-6, 0.01, 0.2, 0.5, 0.9] )
+        df = num_array( [1, 2, 7, 30, 100] )
+        z = stats.zprobinv( p )
+        t = stats.tprobinv( p, df )
+        x = stats.chisqprobinv( p, df )
+        f = stats.fprobinv( p[:, None], df, df[::-1] )
+        self.assertEqual( f.shape, (5, 5) )
+        for i in range( 5 ):
+            self.EQ( stats.zprob( z[i] ) / p[i], 1.0, 7 )
+            self.EQ( stats.betai( 0.5 * df[i], 0.5, df[i] / (df[i] + t[i] ** 2) ) / p[i], 1.0, 9 )
+            self.EQ( self.chisqtail( x[i], df[i] ) / p[i], 1.0, 9 )
+            for j in range( 5 ):
+                self.EQ( stats.fprob( df[j], df[4 - j], f[i, j] ) / p[i], 1.0, 9 )
+        # p far below azprob's range; df=1 has the closed form 2*erfcinv(p)**2
+        x = stats.chisqprobinv( [1e-10, 1e-12], 1 )
+        self.EQ( x[0] / 41.82145636476129, 1.0, 12 )
+        self.EQ( x[1] / 50.84412791181816, 1.0, 12 )
+        self.EQ( stats.chisqprobinv( 1e-10, 1 ) / stats.zprobinv( 0.5e-10 ) ** 2, 1.0, 8 )
+        self.EQ( stats.chisqprobinv( 1e-12, 1 ) / stats.zprobinv( 0.5e-12 ) ** 2, 1.0, 8 )
+        self.EQ( stats.chisqprobinv( 1e-12, 3 ) / 58.91975568320215, 1.0, 12 )
+        self.assertEqual( list( stats.chisqprobinv( [0, 1], 4 ) ), [numpy.inf, 0.0] )
+        self.assertEqual( list( stats.zprobinv( [0, 0.5, 1] ) ), [-numpy.inf, 0.0, numpy.inf] )
+        self.assertRaises( ValueError, stats.fprobinv, 1.5, 3, 10 )
+        t = stats.ap2t( [0.05, -0.05], 10 )
+        self.EQ( t[0], 2.228139, 6 )
+        self.EQ( t[1], -2.228139, 6 )
+
+    def test_probcache(self):
+        "Testing ProbCache tables for chisqprob and fprob"
+        cache = stats.ProbCache( maxsize=2, tol=1e-9 )
+        for x in [0.0, 0.3, 2.5, 7.0, 19.9, 60.0, 500.0, -1.0]:
+            for df in [1, 4, 9]:
+                self.assertTrue( abs( cache.chisqprob( x, df ) - stats.lchisqprob( x, df ) )
+                                 <= 1e-9 * stats.lchisqprob( x, df ) )
+            self.assertTrue( abs( cache.fprob( 3, 17, abs( x ) ) - stats.lfprob( 3, 17, abs( x ) ) )
+                             <= 1e-9 * stats.lfprob( 3, 17, abs( x ) ) )
+        info = cache.info()
+        self.assertEqual( (info['misses'], info['size'], info['evictions']), (32, 2, 30) )
+        self.assertEqual( info['hits'], 0 )
+        self.assertTrue( info['fallbacks'] > 0 )     # -1.0 and the far tails
+        cache.fprob( 3, 17, 1.0 )
+        self.assertEqual( cache.info()['hits'], 1 )
+        # installed, it answers the module functions
+        exact = stats.chisquare( [10, 20, 30, 40] )
+        stats.probcache = cache
+        try:
+            self.EQ( stats.chisquare( [10, 20, 30, 40] )[1], exact[1] )
+            self.assertEqual( cache.info()['misses'], 33 )
+            if numpy is not None:
+                x = num_array( [0.5, 3.0, numpy.nan, 1e6] )
+                ap = stats.achisqprob( x, 4 )
+                self.EQ( ap[1], stats.lchisqprob( 3.0, 4 ) )
+                self.assertTrue( numpy.isnan( ap[2] ) )
+                self.assertTrue( ap[3] < 1e-50 )        # exact far tail
+                self.EQ( stats.afprob( 3, 17, x[:2] )[1], stats.lfprob( 3, 17, 3.0 ) )
+        finally:
+            stats.probcache = None
+        cache.clear()
+        self.assertEqual( cache.info()['size'], 0 )
+
     # ANOVAs
     def test_oneway(self):
         "Testing F_oneway"
         data1 = [ self.L, self.A ]
         data2 = [ self.M, self.B ]
-        results = (3.5144508670520231, 0.068537696711420654)
+        results = (3.5144508670520231, 0.06853769883644822)
         
         i = 0
         for d in data1:
            self.assertEqual( stats.F_oneway( d, data2[i] )[i], results[i] )
            i += 1
+
+    def test_aanova(self):
+        "Testing anova.aanova and parallelanova"
+        if numpy is None:
+            return
+        import os, random
+        from statlib import anova
+        def load( name ):
+            rows = []
+            for line in open( os.path.join( os.path.dirname( __file__ ) or '.',
+                                            'data', name ) ):
+                row = []
+                for item in line.split():
+                    try:
+                        row.append( int( item ) )
+                    except ValueError:
+                        row.append( item )
+                rows.append( row )
+            return rows
+        between = load( 'P94.TXT' )      # 2x3 between-subjects design
+        within = load( 'P620.TXT' )      # 2x3 within-subjects design
+        r = anova.aanova( between, printit=0 )
+        self.assertEqual( r.factors, ['A', 'B'] )
+        self.assertEqual( r.types, ['BETWEEN', 'BETWEEN'] )
+        self.assertEqual( [ e.effect for e in r.effects ], ['A', 'B', 'AB'] )
+        self.EQ( r['A'].F, 2.0377358490566038 )
+        self.EQ( r['A'].p, 0.17893987705067493 )
+        self.assertEqual( ( r['A'].df, r['A'].dferr ), ( 1, 12 ) )
+        self.EQ( r['B'].MSerr, 106.0 / 12 )
+        self.assertRaises( KeyError, r.__getitem__, 'C' )
+        w = anova.aanova( within, printit=0 )
+        self.assertEqual( w.types, ['WITHIN', 'WITHIN'] )
+        self.EQ( w['A'].F, 33.765957446808514, 5 )
+        self.EQ( w['AB'].F, 44.91352549889135, 5 )
+        # replicated scores are averaged; a subject missing a cell is an error
+        w2 = anova.aanova( within + within, printit=0 )
+        self.EQ( w2['AB'].F, w['AB'].F, 5 )
+        self.assertRaises( ValueError, anova.aanova, within[1:], printit=0 )
+        # within x between interactions use the full hypothesis SSCP matrix
+        mixed = anova.aanova( load( 'P645.TXT' ), printit=0 )
+        self.EQ( mixed['AB'].F, 6.6897265819631, 5 )
+        self.assertEqual( mixed['AB'].dferr, 17 )
+        # polynomial contrasts for any number of within-subject levels
+        C = anova.polycontrasts( 12 )
+        self.assertEqual( C.shape, ( 11, 12 ) )
+        for i in range( 11 ):
+            self.EQ( numpy.sum( C[i] ), 0.0 )
+            for j in range( 11 ):
+                self.EQ( numpy.dot( C[i], C[j] ), float( i == j ) )
+        self.EQ( C[0][-1] / C[0][0], -1.0 )
+        self.EQ( C[1][0] / C[1][1], 55.0 / 25 )    # tabled 55, 25, 1, ...
+        rnd = random.Random( 1 )
+        scores = [ [ s, level, rnd.gauss( level / 10.0, 1 ) ]
+                   for s in range( 16 ) for level in range( 12 ) ]
+        many = anova.aanova( scores, printit=0 )
+        self.assertEqual( ( many['A'].df, many['A'].dferr ), ( 11, 5 ) )
+        # ... which is Hotelling's T**2 test on the contrasts
+        D = numpy.dot( numpy.reshape( [ row[-1] for row in scores ], ( 16, 12 ) ), C.T )
+        m = numpy.mean( D, 0 )
+        S = numpy.cov( D, rowvar=0 )
+        T2 = 16 * numpy.dot( m, numpy.linalg.solve( S, m ) )
+        self.EQ( many['A'].F, T2 * 5 / ( 11.0 * 15 ), 4 )
+        # SS kernels: deviations from between-subject cell means, Gram matrix
+        ctx = anova.AnovaContext()
+        ctx.bcellshape = ( 2, )
+        cells = numpy.array( [ 0, 0, 0, 1, 1, 1 ] )
+        d = numpy.reshape( numpy.arange( 12.0 ) ** 2, ( 6, 2 ) )
+        e = anova.subtr_cellmeans( ctx, d, cells )
+        self.assertEqual( e.shape, ( 2, 6 ) )
+        for i in range( 2 ):
+            self.EQ( e[ i, 0 ], d[ 0, i ] - numpy.mean( d[ :3, i ] ) )
+            self.EQ( e[ i, 5 ], d[ 5, i ] - numpy.mean( d[ 3:, i ] ) )
+        ss = anova.multivar_SScalc( e )
+        self.EQ( ss[ 0, 1 ], numpy.sum( e[ 0 ] * e[ 1 ] ) )
+        self.EQ( ss[ 1, 0 ], ss[ 0, 1 ] )
+        # independent analyses share no state, in threads or in processes
+        for threads in [1, 0]:
+            results = anova.parallelanova( [ between, within ] * 2,
+                                           processes=2, threads=threads )
+            for got, want in zip( results, [ r, w ] * 2 ):
+                self.assertEqual( got.effects, want.effects )
+
+    def test_F_onewaylabels(self):
+        "Testing F_onewaylabels"
+        if numpy is None:
+            return
+        f, p = stats.F_onewaylabels( self.L + self.M, [ 0 ] * 20 + [ 1 ] * 20 )
+        self.EQ( f, 3.5144508670520231 )
+        self.EQ( p, 0.06853769883644822 )
+        # any labels, in any order; 2D values give one test per column
+        labels = num_array( [ 'c', 'a', 'b', 'a', 'c' ] * 4 )
+        X = numpy.transpose( num_array( [ self.L, self.M, [ x % 3 for x in self.M ] ], float ) )
+        f, p = stats.F_onewaylabels( X, labels )
+        self.assertEqual( f.shape, ( 3, ) )
+        for j in range( 3 ):
+            groups = [ X[ labels == g, j ] for g in 'abc' ]
+            for got, want in zip( ( f[j], p[j] ), stats.F_oneway( *groups ) ):
+                self.EQ( got, want )
+            self.EQ( stats.F_onewaylabels( X[:, j], labels )[0], f[j] )
+        # integer labels with unused values in between
+        g = num_array( [ 7, 2, 2, 40, 7 ] * 4 )
+        f, p = stats.F_onewaylabels( self.A, g )
+        self.EQ( f, stats.F_oneway( *[ self.A[ g == k ] for k in ( 2, 7, 40 ) ] )[0] )
         
         
     # Support
@@ -564,7 +907,360 @@ class TestStatlib(unittest.TestCase):
         for d in data:
             self.assertEqual( stats.rankdata( d )[i], results[i])
             i += 1
-    
+
+    def test_rankties(self):
+        "Testing rankties and tiecorrect"
+        data = [3, 1, 3, 2, 3, 1]
+        ranks, ties = stats.rankties( data )
+        self.assertEqual( ranks, [5.0, 1.5, 5.0, 3.0, 5.0, 1.5] )
+        self.assertEqual( ties, [2, 3] )
+        T = 1.0 - (2**3-2 + 3**3-3) / float(6**3-6)
+        self.EQ( stats.tiecorrect( ranks ), T )
+        self.EQ( stats.tiecorrect( ranks, ties ), T )
+        if numpy is not None:
+            ranks, ties = stats.rankties( num_array( data ) )
+            self.assertEqual( list( ranks ), [5.0, 1.5, 5.0, 3.0, 5.0, 1.5] )
+            self.assertEqual( list( ties ), [2, 3] )
+            self.EQ( stats.tiecorrect( ranks ), T )
+            self.EQ( stats.tiecorrect( ranks, ties ), T )
+
+    # Dispatch
+    def test_dispatch_resolve(self):
+        "Testing Dispatch resolution"
+        self.assert_( stats.mean.resolve( list ) is stats.lmean )
+        self.assert_( stats.mean.resolve( tuple ) is stats.lmean )
+        self.assertRaises( TypeError, stats.mean, 'abc' )
+        self.assertRaises( TypeError, stats.mean.resolve, str )
+
+    def test_dispatch_subclass(self):
+        "Testing Dispatch on subclasses"
+        class MyList( list ):
+            pass
+        self.EQ( stats.mean( MyList( self.L ) ), 10.5 )
+        if numpy is None:
+            return
+        class MyArray( numpy.ndarray ):
+            pass
+        self.EQ( stats.mean( self.A.view( MyArray ) ), 10.5 )
+        self.assert_( stats.mean.resolve( MyArray ) is stats.amean )
+        for f in [ numpy.float64, numpy.float32, numpy.int16 ]:
+            self.EQ( stats.betai( f(1), 0.5, 0.5 ), 0.292893, 5 )
+
+    def test_dispatch_register(self):
+        "Testing Dispatch.register"
+        disp = stats.Dispatch( (stats.lsum, (list,)) )
+        self.assertRaises( TypeError, disp, (1, 2) )
+        disp.register( stats.lsum, (tuple,) )
+        self.assertEqual( disp( (1, 2) ), 3 )
+        self.assertRaises( ValueError, disp.register, stats.lmean, (list,) )
+
+    def test_dispatch_promote(self):
+        "Testing Dispatch list-to-array promotion"
+        if numpy is None:
+            return
+        self.EQ( stats.var( self.L, promote=1 ), 35.0 )
+        # promoted calls return the types the list versions return
+        self.assertEqual( stats.rankdata( self.M, promote=1 ), stats.rankdata( self.M ) )
+        self.assertEqual( stats.histogram( self.L, promote=1 ), stats.histogram( self.L ) )
+        self.assertEqual( type( stats.skew( self.L, promote=1 ) ), float )
+        # module-level threshold, and per-call override
+        seen = []
+        def convert( inlist ):
+            seen.append( len( inlist ) )
+            return numpy.asarray( inlist, float )
+        disp = stats.Dispatch( (stats.lvar, (list, tuple)), (stats.avar, (numpy.ndarray,)) )
+        disp.setpromotion( convert, float )
+        old = stats.promotelength
+        try:
+            stats.promotelength = 10
+            self.EQ( disp( self.L ), 35.0 )
+            disp( self.L[:5] )
+            disp( self.L, promote=0 )
+            self.assertEqual( seen, [20] )
+            d = stats.describe( tuple( self.L ) )
+            self.EQ( d[3], 5.9160797831 )
+            self.assertEqual( map( type, d[2:] ), [float] * 4 )
+            # the promoted median does not print amedian's extrapoints
+            stdout = sys.stdout
+            sys.stdout = StringIO.StringIO()
+            try:
+                m = stats.median( self.L )
+                printed = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            self.assertEqual( printed, '' )
+            self.EQ( m, stats.median( self.L, promote=0 ) )
+        finally:
+            stats.promotelength = old
+        # dispatchers without a converter do not take the keyword
+        self.assertRaises( TypeError, stats.ttest_ind, self.L, self.M, promote=1 )
+
+    # running statistics
+
+    def twopass_describe(self, data):
+        "describe() computed directly with two-pass moments, independent of RunningStats"
+        n = len( data )
+        mean = sum( data ) / float( n )
+        m2, m3, m4 = [ sum( [ ( x - mean ) ** k for x in data ] ) / n for k in ( 2, 3, 4 ) ]
+        return ( n, ( min( data ), max( data ) ), mean, ( m2 * n / ( n - 1 ) ) ** 0.5,
+                 m3 / m2 ** 1.5, m4 / m2 ** 2 )
+
+    def test_runningstats(self):
+        "Testing RunningStats"
+        expected = (20, (1, 20), 10.5, 5.9160797830996161, 0.0, 1.7939849624060149)
+        self.assertEqual( self.twopass_describe( self.L ), expected )
+        # whole list, one value at a time, and uneven chunks
+        for got, want in zip( stats.RunningStats( self.L ).describe(), expected ):
+            if type(want) == tuple:
+                self.assertEqual( got, want )
+            else:
+                self.EQ( got, want )
+        rs = stats.RunningStats()
+        for x in self.L:
+            rs.update( x )
+        for got, want in zip( rs.describe(), expected ):
+            if type(want) == tuple:
+                self.assertEqual( got, want )
+            else:
+                self.EQ( got, want )
+        rs = stats.RunningStats()
+        for chunk in [self.M[:3], self.M[3:4], (), self.M[4:13], self.M[13:]]:
+            rs.update_many( chunk )
+        rs.update_many( iter( self.L ) )
+        for got, want in zip( rs.describe(), self.twopass_describe( self.M + self.L ) ):
+            if type(want) == tuple:
+                self.assertEqual( got, want )
+            else:
+                self.EQ( got, want )
+        self.EQ( rs.moment(3), stats.moment( self.M + self.L, 3 ) )
+        self.EQ( rs.samplevar(), stats.samplevar( self.M + self.L ) )
+        if numpy is not None:
+            rs = stats.RunningStats( self.A[:7] )
+            rs.update_many( self.A[7:] )
+            for got, want in zip( rs.describe()[2:], expected[2:] ):
+                self.EQ( got, want )
+            self.assertEqual( rs.describe()[1], (1.0, 20.0) )
+
+    def test_runningstats_merge(self):
+        "Testing RunningStats.merge and parallelsummary"
+        import pickle
+        left = stats.RunningStats( self.M[:5] )
+        right = stats.RunningStats()
+        right.update_many( self.M[5:] )
+        merged = left.merge( pickle.loads( pickle.dumps( right ) ) )
+        for got, want in zip( merged.describe()[2:], self.twopass_describe( self.M )[2:] ):
+            self.EQ( got, want )
+        self.assertEqual( merged.describe()[:2], self.twopass_describe( self.M )[:2] )
+        copy = stats.RunningStats.fromsummary( merged.summary() )
+        self.assertEqual( copy.summary(), merged.summary() )
+        self.assertEqual( stats.RunningStats().merge( copy ).summary(), copy.summary() )
+        # shards in worker processes
+        rs = stats.parallelsummary( self.L, processes=2, chunks=3 )
+        for got, want in zip( rs.describe()[2:], self.twopass_describe( self.L )[2:] ):
+            self.EQ( got, want )
+        if numpy is not None:
+            rs = stats.parallelsummary( self.A, processes=2 )
+            self.EQ( rs.describe()[3], 5.9160797830996161 )
+            for got, want in zip( rs.describe()[2:], stats.adescribe( self.A )[2:] ):
+                self.EQ( got, want )
+
+    def test_running_ttests(self):
+        "Testing RunningTTest1Samp, RunningTTestInd and RunningTTestRel"
+        rt = stats.RunningTTestInd()
+        for x in self.L:
+            rt.update( x )
+        rt.update_many( self.M[:5], 1 )
+        rt.update_many( iter( self.M[5:] ), 1 )
+        for got, want in zip( rt.result(), stats.ttest_ind( self.L, self.M ) ):
+            self.EQ( got, want )
+        # Welch's test: separate variances and Welch-Satterthwaite df
+        rt = stats.RunningTTestInd( pooled=0 )
+        rt.update_many( self.L )
+        rt.update_many( self.M[:10], 1 )
+        s1 = stats.var( self.L ) / 20.0
+        s2 = stats.var( self.M[:10] ) / 10.0
+        t = ( stats.mean( self.L ) - stats.mean( self.M[:10] ) ) / ( s1 + s2 ) ** 0.5
+        df = ( s1 + s2 ) ** 2 / ( s1 * s1 / 19 + s2 * s2 / 9 )
+        self.EQ( rt.result()[0], t )
+        self.EQ( rt.result()[1], stats.betai( 0.5 * df, 0.5, df / ( df + t * t ) ) )
+        # a window keeps the last 8 values of each sample
+        rt = stats.RunningTTestInd( window=8 )
+        for i in range( 20 ):
+            rt.update( self.L[i], 0 )
+            rt.update( self.M[i], 1 )
+        for got, want in zip( rt.result(), stats.ttest_ind( self.L[-8:], self.M[-8:] ) ):
+            self.EQ( got, want )
+        rt = stats.RunningTTest1Samp( 10.0 )
+        rt.update_many( self.M )
+        for x in self.M[:6]:
+            rt.retract( x )
+        for got, want in zip( rt.result(), stats.ttest_1samp( self.M[6:], 10.0 ) ):
+            self.EQ( got, want )
+        rt = stats.RunningTTest1Samp( 10.0, window=5 )
+        rt.update_many( self.M )
+        self.assertRaises( ValueError, rt.retract, self.M[0] )
+        for got, want in zip( rt.result(), stats.ttest_1samp( self.M[-5:], 10.0 ) ):
+            self.EQ( got, want )
+        b = [ x * 1.5 + ( x % 3 ) for x in self.L ]
+        rt = stats.RunningTTestRel()
+        rt.update_many( self.L[:4], b[:4] )
+        for i in range( 4, 20 ):
+            rt.update( self.L[i], b[i] )
+        for got, want in zip( rt.result(), stats.ttest_rel( self.L, b ) ):
+            self.EQ( got, want )
+        self.assertRaises( ValueError, stats.RunningTTestRel().result )
+        if numpy is not None:
+            rt = stats.RunningTTestInd()
+            rt.update_many( self.A )
+            rt.update_many( self.B, 1 )
+            for got, want in zip( rt.result(), stats.ttest_ind( self.A, self.B ) ):
+                self.EQ( got, want )
+
+    def test_running_chisquare(self):
+        "Testing RunningChisquare"
+        cats = [ x % 4 for x in self.M ] + [ 0, 0, 1 ]
+        counts = [ cats.count( i ) for i in range( 4 ) ]
+        rc = stats.RunningChisquare( 4 )
+        for c in cats:
+            rc.update( c )
+        for got, want in zip( rc.result(), stats.chisquare( counts ) ):
+            self.EQ( got, want )
+        rc.retract( 0, 2 )
+        counts[0] = counts[0] - 2
+        for got, want in zip( rc.result(), stats.chisquare( counts ) ):
+            self.EQ( got, want )
+        # expected proportions are rescaled to the current total
+        rc = stats.RunningChisquare( f_exp=[ 1, 2, 3, 4 ] )
+        rc.update_many( counts )
+        n = float( sum( counts ) )
+        expected = stats.chisquare( counts, [ n * e / 10 for e in [ 1, 2, 3, 4 ] ] )
+        for got, want in zip( rc.result(), expected ):
+            self.EQ( got, want )
+        # a window keeps the last 10 updates
+        rc = stats.RunningChisquare( 4, window=10 )
+        for c in cats:
+            rc.update( c )
+        last = [ cats[-10:].count( i ) for i in range( 4 ) ]
+        for got, want in zip( rc.result(), stats.chisquare( last ) ):
+            self.EQ( got, want )
+        self.assertRaises( ValueError, rc.retract, 2, 5 )
+
+    def test_quantiles(self):
+        "Testing quantiles"
+        import random
+        rnd = random.Random(3)
+        data = [rnd.randint(0, 50) for i in range(501)]
+        ordered = sorted( data )
+        self.assertEqual( stats.quantiles( data, 50 ), ordered[250] )
+        self.assertEqual( stats.quantiles( data, [0, 10, 100] ), [ordered[0], ordered[50], ordered[500]] )
+        self.EQ( stats.quantiles( self.L, 40 ), 8.6 )
+        self.EQ( stats.quantiles( self.L, [25, 50] )[1], 10.5 )
+        self.EQ( stats.median( self.L, method='exact' ), 10.5 )
+        self.EQ( stats.scoreatpercentile( self.L, 40, method='exact' ), 8.6 )
+        self.assertRaises( ValueError, stats.quantiles, self.L, 101 )
+        self.assertRaises( ValueError, stats.median, self.L, method='nope' )
+        self.assertEqual( stats.lselect( list( data ), [7, 400] )[400], ordered[400] )
+        if numpy is not None:
+            a = numpy.array( data )
+            self.assertEqual( list( stats.quantiles( a, [0, 10, 100] ) ), [ordered[0], ordered[50], ordered[500]] )
+            self.EQ( stats.quantiles( self.A, 40 ), 8.6 )
+            self.EQ( stats.median( self.A, method='exact' ), 10.5 )
+            self.EQ( stats.scoreatpercentile( self.A, 40, method='exact' ), 8.6 )
+            q = stats.quantiles( numpy.array( [self.L, self.M] ), [50, 75], dimension=1 )
+            self.assertEqual( q.shape, (2, 2) )
+            self.EQ( q[0, 0], 10.5 )
+            self.EQ( q[1, 1], stats.quantiles( self.M, 75 ) )
+
+    def test_quantilesketch(self):
+        "Testing QuantileSketch"
+        import pickle, random
+        # small inputs are kept exactly
+        qs = stats.QuantileSketch( self.L )
+        self.EQ( qs.median(), 10.5 )
+        self.EQ( qs.scoreatpercentile( 0 ), 1 )
+        self.EQ( qs.scoreatpercentile( 100 ), 20 )
+        self.EQ( qs.percentileofscore( 10.5 ), 50.0 )
+        self.EQ( qs.cdf( 0 ), 0.0 )
+        self.EQ( qs.cdf( 20 ), 1.0 )
+        self.assertRaises( ValueError, qs.quantile, 1.5 )
+        self.assertRaises( ValueError, stats.QuantileSketch().quantile, 0.5 )
+        # large stream, split over two sketches and merged
+        rnd = random.Random(1)
+        data = [rnd.random() for i in range(20000)]
+        left = stats.QuantileSketch()
+        for x in data[:10000]:
+            left.update( x )
+        right = stats.QuantileSketch( compression=50 )
+        right.update_many( data[10000:] )
+        right = stats.QuantileSketch.fromsummary( pickle.loads( pickle.dumps( right.summary() ) ) )
+        left.merge( right )
+        self.assertEqual( left.n, 20000 )
+        self.assert_( len( left.means ) < 200 )
+        for p in [1, 50, 95, 99]:
+            self.EQ( left.scoreatpercentile( p ), stats.quantiles( data, p ), 2 )
+            self.EQ( left.percentileofscore( p/100.0 ), p, 0 )
+        if numpy is not None:
+            qs = stats.QuantileSketch( numpy.array( data ) )
+            self.EQ( qs.scoreatpercentile( 99 ), stats.quantiles( data, 99 ), 2 )
+
+    def test_histogram_object(self):
+        "Testing Histogram"
+        h = stats.Histogram()
+        h.add( self.L[:7] + [20] )
+        h.add( self.L[7:19] )
+        self.assertEqual( h.histogram(), stats.histogram( self.L ) )
+        self.assertEqual( h.cumfreq(), stats.cumfreq( self.L ) )
+        self.assertEqual( h.relfreq(), stats.relfreq( self.L ) )
+        self.EQ( h.percentileofscore( 12 ), stats.percentileofscore( self.L, 12 ) )
+        # sliding window on fixed bins
+        h = stats.Histogram( 4, [0, 20] )
+        h.add( self.L )
+        h.subtract( self.L[:5] )
+        self.assertEqual( h.histogram(), stats.histogram( self.L[5:], 4, [0, 20] ) )
+        self.assertEqual( h.n, 15 )
+        # auto-extending bins, weights and merging
+        left = stats.Histogram( 2, [0, 2], extend=1 )
+        left.add( [-1.5, 0.5, 3.5], [1, 1, 2] )
+        right = stats.Histogram( 2, [0, 2], extend=1 )
+        right.add( iter( [5.5, float('nan')] ) )
+        left.merge( right )
+        self.assertEqual( left.histogram(), ([1, 0, 1, 0, 0, 2, 0, 1], -2.0, 1.0, 1) )
+        self.assertRaises( ValueError, left.merge, stats.Histogram( 3, [0, 2] ) )
+        if numpy is not None:
+            h = stats.Histogram( 4, [0, 20], extend=1 )
+            h.add( self.A )
+            h.add( num_array( [-3, 27] ) )
+            self.assertEqual( h.histogram(), ([1, 4, 5, 5, 5, 1, 1], -5.0, 5.0, 0) )
+    def test_multicomp(self):
+        "Testing multiple-comparison adjustments"
+        if numpy is None:
+            return
+        from statlib import multicomp
+        p = num_array( [0.01, 0.04, 0.03, 0.02, 0.05] )
+        expected = { 'bonferroni': [0.05, 0.2, 0.15, 0.1, 0.25],
+                     'holm': [0.05, 0.09, 0.09, 0.08, 0.09],
+                     'bh': [0.05] * 5,
+                     'by': [0.05 * (1 + 1/2.0 + 1/3.0 + 1/4.0 + 1/5.0)] * 5 }
+        for method, values in expected.items():
+            adj = multicomp.apadjust( p, method )
+            for i in range( 5 ):
+                self.EQ( adj[i], values[i] )
+            # each lane is its own family; nan is skipped and kept
+            P = numpy.transpose( num_array( [p, p[::-1]] ) )
+            lanes = multicomp.apadjust( P, method, dimension=0 )
+            self.assertEqual( lanes.shape, (5, 2) )
+            for i in range( 5 ):
+                self.EQ( lanes[i, 0], values[i] )
+                self.EQ( lanes[i, 1], values[4 - i] )
+            withnan = multicomp.apadjust( numpy.concatenate( (p, [numpy.nan]) ), method )
+            self.assertTrue( numpy.isnan( withnan[5] ) )
+            for i in range( 5 ):
+                self.EQ( withnan[i], values[i] )
+        self.assertEqual( list( multicomp.areject( p, 0.05, 'holm' ) ),
+                          [True, False, False, False, False] )
+        self.assertRaises( ValueError, multicomp.apadjust, p, 'sidak' )
+
+
 def get_suite():
     suite = unittest.TestLoader().loadTestsFromTestCase( TestStatlib )
     return suite